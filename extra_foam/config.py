@@ -83,6 +83,8 @@ class GeomAssembler(IntEnum):
 class PipelineSlowPolicy(IntEnum):
     DROP = 0
     WAIT = 1
+    # wait and skip optional processing of some trains
+    DEGRADE = 2
 
 
 def list_azimuthal_integ_methods(detector):
@@ -211,8 +213,34 @@ class _Config(dict):
         # size, the smaller the latency)
         "PIPELINE_MAX_QUEUE_SIZE": 2,
         "PIPELINE_SLOW_POLICY": PipelineSlowPolicy.DROP,
+        # maximum k when only every k-th train is processed fully with the
+        # DEGRADE slow policy
+        "PIPELINE_DEGRADE_MAX_STRIDE": 10,
+        # whether to pass data between processes via shared memory
+        "PIPELINE_SHM_ENABLED": True,
+        # size of each shared-memory slot used to pass data between
+        # processes, in MB
+        "PIPELINE_SHM_SLOT_SIZE": 64,
+        # directory of the shared-memory segments used to pass large
+        # arrays, e.g. the reference image, from the GUI to the pipeline
+        "PIPELINE_SHM_DIR": "/dev/shm",
+        # maximum time to wait for data in the pipeline before checking
+        # whether the pipeline has been paused or closed, in second
+        "PIPELINE_WAIT_TIMEOUT": 0.1,
+        # number of processes for processing pulse-resolved data. If it is
+        # larger than 1, trains are dispatched to these processes in turn
+        # and the results are merged in the order of train ID.
+        "PIPELINE_N_PULSE_WORKERS": 1,
+        # maximum time to hold a processed train while waiting for the
+        # trains with smaller train IDs, in second
+        "PIPELINE_MERGE_TIMEOUT": 0.5,
+        # trace every n-th train (by train ID) through the pipeline and
+        # publish the latencies of its stages. 0 for disabling tracing.
+        "PIPELINE_TRACE_SAMPLING": 10,
         # timeout of the zmq bridge, in second
         "BRIDGE_TIMEOUT": 0.1,
+        # maximum number of trains prefetched from each zmq bridge
+        "BRIDGE_PREFETCH": 2,
         # maximum length of the cache used in data correlation by train ID
         "CORRELATION_QUEUE_CACHE_SIZE": 20,
         # -------------------------------------------------------------
@@ -244,8 +272,9 @@ class _Config(dict):
         "REDIS_MAX_PING_ATTEMPTS": 3,
         # interval for pinging the Redis server from the main GUI, in milliseconds
         "REDIS_PING_ATTEMPT_INTERVAL": 5000,
-        # If the path is given, redis-py will use UnixDomainSocketConnection.
-        # Otherwise, normal TCP socket connection.
+        # path of the Unix domain socket of the Redis server. If not given,
+        # 'redis-<port>.sock' in the root directory will be used. Clients
+        # on the same machine connect through it instead of TCP.
         "REDIS_UNIX_DOMAIN_SOCKET_PATH": "",
         # maximum allowed REDIS memory (fraction of system memory)
         "REDIS_MAX_MEMORY_FRAC": 0.2,  # must <= 0.5
@@ -8,7 +8,7 @@ Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
 from collections import abc, namedtuple
-import copy
+import weakref
 
 from ..algorithms import OrderedSet
 from ..config import config
@@ -28,6 +28,10 @@ class SourceCatalog(abc.Collection):
     """SourceCatalog class.
 
     Served as a catalog for searching data sources.
+
+    An immutable snapshot of the catalog can be obtained via snapshot().
+    Snapshots are rebuilt only after the catalog has been modified and
+    can be shared by any number of trains.
     """
     def __init__(self):
         super().__init__()
@@ -40,6 +44,13 @@ class SourceCatalog(abc.Collection):
         self._main_detector_category = config["DETECTOR"]
         self._main_detector = ''
 
+        # increased by one every time the catalog is modified
+        self._version = 0
+
+        # immutable snapshot of the current version
+        self._snapshot = None
+        self._frozen = False
+
     def __contains__(self, item):
         """Override."""
         return self._items.__contains__(item)
@@ -65,6 +76,10 @@ class SourceCatalog(abc.Collection):
     def main_detector(self):
         return self._main_detector
 
+    @property
+    def version(self):
+        return self._version
+
     def get_category(self, src):
         return self._items[src].category
 
@@ -77,11 +92,17 @@ class SourceCatalog(abc.Collection):
     def from_category(self, ctg):
         return self._categories.get(ctg, OrderedSet())
 
+    def _check_mutable(self):
+        if self._frozen:
+            raise TypeError("Snapshot of SourceCatalog is immutable!")
+
     def add_item(self, item):
         """Add a source item to the catalog.
 
         :param SourceItem item: new source item.
         """
+        self._check_mutable()
+
         src = f"{item.name} {item.property}"
         self._items[src] = item
 
@@ -93,11 +114,15 @@ class SourceCatalog(abc.Collection):
         if ctg == self._main_detector_category:
             self._main_detector = src
 
+        self._version += 1
+
     def remove_item(self, src):
         """Remove an item from the catalog.
 
         :param str src: source name - <device ID>< ><property>.
         """
+        self._check_mutable()
+
         ctg = self._items.__getitem__(src).category
         self._items.__delitem__(src)
         self._categories[ctg].remove(src)
@@ -108,33 +133,95 @@ class SourceCatalog(abc.Collection):
         if ctg == self._main_detector_category:
             self._main_detector = ''
 
+        self._version += 1
+
     def clear(self):
+        self._check_mutable()
+
         self._items.clear()
         self._categories.clear()
         self._main_detector = ''
+        self._version += 1
+
+    def snapshot(self):
+        """Return an immutable snapshot of the current catalog.
+
+        The same snapshot is returned until the catalog is modified.
+        """
+        if self._frozen:
+            return self
+
+        if self._snapshot is None or self._snapshot.version != self._version:
+            instance = self.__copy__()
+            instance._frozen = True
+            self._snapshot = instance
+        return self._snapshot
 
     def __copy__(self):
         instance = self.__class__()
-        instance._items = copy.deepcopy(self._items)
-        instance._categories = copy.deepcopy(self._categories)
+        # SourceItem is immutable
+        instance._items = self._items.copy()
+        instance._categories = {k: OrderedSet(v)
+                                for k, v in self._categories.items()}
         instance._main_detector_category = self._main_detector_category
         instance._main_detector = self._main_detector
+        instance._version = self._version
         return instance
 
     def __deepcopy__(self, memo):
         return self.__copy__()
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_snapshot'] = None
+        return state
+
     def __repr__(self):
         return f'SourceCatalog(main_detector={self._main_detector}, ' \
                f'n_items={self.__len__()})'
 
 
+class _EuXFELTransformPlan:
+    """Pre-compiled extraction plan of a given version of SourceCatalog."""
+
+    __slots__ = ['version', 'modular', 'non_modular']
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+
+        # (source, tuple of module names)
+        self.modular = []
+        # (source, device ID, (property keys in the order to try))
+        self.non_modular = []
+        for src, item in catalog.items():
+            src_name, modules, src_ppt = item.name, item.modules, item.property
+            if modules:
+                prefix, suffix = src_name.split("*")
+                self.modular.append(
+                    (src, tuple(f"{prefix}{idx}{suffix}" for idx in modules)))
+            else:
+                # caveat: the sequence matters because of property
+                self.non_modular.append(
+                    (src, src_name, (src_ppt, f"{src_ppt}.value")))
+
+
 class DataTransformer:
     """DataTransformer class.
 
     Transform external data format to EXtra-foam compatible data
     format for further processing.
     """
+    # key: SourceCatalog, value: _EuXFELTransformPlan
+    _euxfel_plans = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def _euxfel_plan(cls, catalog):
+        plan = cls._euxfel_plans.get(catalog)
+        if plan is None or plan.version != catalog.version:
+            plan = _EuXFELTransformPlan(catalog)
+            cls._euxfel_plans[catalog] = plan
+        return plan
+
     @classmethod
     def transform_euxfel(cls, raw, meta, *, catalog=None, source_type=None):
         """Transform European XFEL data.
@@ -147,50 +234,49 @@ class DataTransformer:
 
         :raises: this method should not raise!!!
         """
+        plan = cls._euxfel_plan(catalog)
+
         new_raw, new_meta = dict(), dict()
         not_found = []
-        for src, item in catalog.items():
-            ctg, src_name, modules, src_ppt = \
-                item.category, item.name, item.modules, item.property
-
-            if modules:
-                prefix, suffix = src_name.split("*")
-                new_raw[src] = dict()
-                module_data = new_raw[src]
-                n_found = 0
-                i_found = None
-                for idx in modules:
-                    module_name = f"{prefix}{idx}{suffix}"
-                    if module_name in raw:
-                        module_data[module_name] = raw[module_name]
-                        n_found += 1
-                        i_found = module_name
-
-                if n_found == 0:
-                    # there is no module data
-                    not_found.append(src)
-                    continue
-                else:
-                    new_meta[src] = {
-                        'tid': meta[i_found]['timestamp.tid'],
-                        'source_type': source_type,
-                    }
+        for src, module_names in plan.modular:
+            module_data = dict()
+            i_found = None
+            for module_name in module_names:
+                if module_name in raw:
+                    module_data[module_name] = raw[module_name]
+                    i_found = module_name
+
+            new_raw[src] = module_data
+            if i_found is None:
+                # there is no module data
+                not_found.append(src)
+                continue
+
+            new_meta[src] = {
+                'tid': meta[i_found]['timestamp.tid'],
+                'source_type': source_type,
+            }
+
+        for src, src_name, ppts in plan.non_modular:
+            src_data = raw.get(src_name)
+            if src_data is None:
+                # if the requested source is not in the data
+                not_found.append(src)
+                continue
+
+            for ppt in ppts:
+                if ppt in src_data:
+                    break
             else:
-                try:
-                    # caveat: the sequence matters because of property
-                    try:
-                        new_raw[src] = raw[src_name][src_ppt]
-                    except KeyError:
-                        new_raw[src] = raw[src_name][f"{src_ppt}.value"]
-                except KeyError:
-                    # if the requested source or property is not in the data
-                    not_found.append(src)
-                    continue
-
-                new_meta[src] = {
-                    'tid': meta[src_name]['timestamp.tid'],
-                    'source_type': source_type,
-                }
+                # if the requested property is not in the data
+                not_found.append(src)
+                continue
+
+            new_raw[src] = src_data[ppt]
+            new_meta[src] = {
+                'tid': meta[src_name]['timestamp.tid'],
+                'source_type': source_type,
+            }
 
         # We keep the source item in catalog even if it was not found in
         # the data since it is common when the data is arriving from different
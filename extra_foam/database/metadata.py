@@ -7,9 +7,13 @@ Author: Jun Zhu <jun.zhu@xfel.eu>
 Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
+import os
+from threading import RLock
+
 from .base_proxy import _AbstractProxy
 from .db_utils import redis_except_handler
 from ..config import AnalysisType
+from ..ipc import redis_connection
 
 
 class MetaMetadata(type):
@@ -48,48 +52,274 @@ class Metadata(metaclass=MetaMetadata):
     DARK_RUN_PROC = "meta:proc:dark_run"
     TR_XAS_PROC = "meta:proc:tr_xas"
 
+    # channel for notifying the update of the cached hashes, i.e. the
+    # processors' metadata, the registered analysis types and the
+    # subscribed fields. The message is the key of the updated hash.
+    CACHE_UPDATE = "meta:cache_update"
+
     # The real key depends on the category of the data source. For example,
     # 'XGM' has the key 'meta:sources:XGM' and 'DSSC' has the key
     # 'meta:sources:DSSC'.
     # The value is an unordered set for each source.
     DATA_SOURCE = "meta:data_source"
 
+    # optional fields of the processed data requested by the GUI. The
+    # value is the number of subscribers for each field.
+    GUI_FIELDS = "meta:gui_fields"
+
+
+class _MetadataCache:
+    """Process-local cache of the processors' metadata, the registered
+    analysis types and the fields subscribed by the GUI.
+
+    All the hashes are pulled at once and a hash is pulled again only
+    after an update of it has been published.
+
+    The cache is shared by all the threads in a process, e.g. the
+    processors and the output thread of a pipe, which must not read the
+    subscription or modify the cached hashes at the same time.
+    """
+    # bit of each analysis type in the bitmap
+    _ANALYSIS_BITS = {t: 1 << i for i, t in enumerate(AnalysisType)}
+
+    def __init__(self):
+        self._lock = RLock()
+
+        self._pid = None
+        self._db = None
+        self._sub = None
+
+        # key: hash name, value: dict
+        self._data = dict()
+        # bitmap of the registered analysis types
+        self._analysis = None
+
+    @staticmethod
+    def cached(name):
+        return name.startswith("meta:proc:") or \
+            name in (Metadata.ANALYSIS_TYPE, Metadata.GUI_FIELDS)
+
+    def _check_subscription(self):
+        db = redis_connection()
+        if self._pid != os.getpid() or self._db is not db:
+            # Do not close the subscriber inherited from the parent
+            # process since the socket is shared.
+            self._pid = os.getpid()
+            self._db = db
+            self._sub = None
+            self._data.clear()
+            self._analysis = None
+
+        if self._sub is None and db is not None:
+            sub = db.pubsub(ignore_subscribe_messages=True)
+            # subscribe before pulling the data to not miss any update
+            sub.subscribe(Metadata.CACHE_UPDATE)
+            self._sub = sub
+
+        return self._sub is not None
+
+    def _sync(self):
+        """Apply the published updates.
+
+        It must be called with the lock held.
+
+        :return: False if there is no connection.
+        """
+        if not self._check_subscription():
+            return False
+
+        while True:
+            msg = self._sub.get_message()
+            if msg is None:
+                break
+            self.invalidate(msg['data'])
+
+        if not self._data:
+            names = [f"meta:proc:{proc}" for proc in Metadata.processors]
+            names.extend([Metadata.ANALYSIS_TYPE, Metadata.GUI_FIELDS])
+            pipe = self._db.pipeline()
+            for name in names:
+                pipe.execute_command('HGETALL', name)
+            self._data.update(zip(names, pipe.execute()))
+        return True
+
+    def _get(self, name):
+        """Return the cached hash.
+
+        It must be called with the lock held.
+        """
+        if name not in self._data:
+            self._data[name] = self._db.execute_command('HGETALL', name)
+        return self._data[name]
+
+    def get(self, name):
+        """Return the cached hash.
+
+        :return: None if the connection failed; otherwise, a copy of
+                 the hash.
+        """
+        with self._lock:
+            if not self._sync():
+                return None
+            return self._get(name).copy()
+
+    def analysis(self):
+        """Return the bitmap of the registered analysis types.
+
+        :return: None if the connection failed.
+        """
+        with self._lock:
+            if not self._sync():
+                return None
+
+            if self._analysis is None:
+                registered = self._get(Metadata.ANALYSIS_TYPE)
+                bitmap = 0
+                for t, bit in self._ANALYSIS_BITS.items():
+                    if int(registered.get(self.key(t), 0)) > 0:
+                        bitmap |= bit
+                self._analysis = bitmap
+            return self._analysis
+
+    def key(self, key):
+        """Return the key of a field as it is stored in the cached hash."""
+        if isinstance(key, str):
+            return key
+        return self._db.connection_pool.get_encoder().encode(key).decode()
+
+    def invalidate(self, name):
+        """Invalidate the cache of a hash."""
+        with self._lock:
+            self._data.pop(name, None)
+            if name == Metadata.ANALYSIS_TYPE:
+                self._analysis = None
+
 
 class MetaProxy(_AbstractProxy):
-    """Proxy for retrieving metadata."""
+    """Proxy for retrieving metadata.
+
+    The processors' metadata, the registered analysis types and the
+    subscribed fields are read from a process-local cache and every
+    update of them is published to the other processes.
+    """
+    _cache = _MetadataCache()
+
+    # decrease the value of a key in a hash by one if it is positive
+    _DECREASE_IF_POSITIVE = """
+        local v = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+        if v > 0 then
+            return redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+        end
+        return v
+    """
+
+    @redis_except_handler
+    def _write_cached(self, name, *args):
+        ret = self._db.pipeline().execute_command(*args).execute_command(
+            'PUBLISH', Metadata.CACHE_UPDATE, name).execute()
+        self._cache.invalidate(name)
+        return ret[0]
+
+    def hset(self, name, key, value):
+        """Override."""
+        if self._cache.cached(name):
+            return self._write_cached(name, 'HSET', name, key, value)
+        return super().hset(name, key, value)
+
+    def hmset(self, name, mapping):
+        """Override."""
+        if self._cache.cached(name):
+            args = []
+            for k, v in mapping.items():
+                args.extend([k, v])
+            return self._write_cached(name, 'HMSET', name, *args)
+        return super().hmset(name, mapping)
+
+    def hdel(self, name, *keys):
+        """Override."""
+        if self._cache.cached(name):
+            return self._write_cached(name, 'HDEL', name, *keys)
+        return super().hdel(name, *keys)
+
+    def hincrease_by(self, name, key, amount=1):
+        """Override."""
+        if self._cache.cached(name):
+            return self._write_cached(name, 'HINCRBY', name, key, amount)
+        return super().hincrease_by(name, key, amount)
+
+    def hincrease_by_float(self, name, key, amount=1.0):
+        """Override."""
+        if self._cache.cached(name):
+            return self._write_cached(
+                name, 'HINCRBYFLOAT', name, key, amount)
+        return super().hincrease_by_float(name, key, amount)
+
+    @redis_except_handler
+    def _read_cached(self, name):
+        return self._cache.get(name)
+
+    def hget(self, name, key):
+        """Override."""
+        if self._cache.cached(name):
+            cfg = self._read_cached(name)
+            return None if cfg is None else cfg.get(self._cache.key(key))
+        return super().hget(name, key)
+
+    def hmget(self, name, keys):
+        """Override."""
+        if self._cache.cached(name):
+            cfg = self._read_cached(name)
+            if cfg is None:
+                return None
+            return [cfg.get(self._cache.key(k)) for k in keys]
+        return super().hmget(name, keys)
+
+    def hget_all(self, name):
+        """Override."""
+        if self._cache.cached(name):
+            return self._read_cached(name)
+        return super().hget_all(name)
+
+    @redis_except_handler
+    def _read_analysis(self):
+        return self._cache.analysis()
+
+    def _analysis_bitmap(self):
+        bitmap = self._read_analysis()
+        return 0 if bitmap is None else bitmap
+
+    def _analysis_mask(self, analysis_types):
+        if not isinstance(analysis_types, (tuple, list)):
+            raise TypeError("Input must be a tuple or list!")
+
+        mask = 0
+        for analysis_type in analysis_types:
+            mask |= _MetadataCache._ANALYSIS_BITS[analysis_type]
+        return mask
 
     def has_analysis(self, analysis_type):
         """Check if the given analysis type has been registered.
 
         :param AnalysisType analysis_type: analysis type.
         """
-        return int(self.hget(Metadata.ANALYSIS_TYPE, analysis_type))
+        return bool(self._analysis_bitmap()
+                    & _MetadataCache._ANALYSIS_BITS[analysis_type])
 
     def has_any_analysis(self, analysis_types):
         """Check if any of the listed analysis types has been registered.
 
         :param tuple/list analysis_types: a list of AnalysisType instances.
         """
-        if not isinstance(analysis_types, (tuple, list)):
-            raise TypeError("Input must be a tuple or list!")
-
-        for analysis_type in analysis_types:
-            if int(self.hget(Metadata.ANALYSIS_TYPE, analysis_type)) > 0:
-                return True
-        return False
+        mask = self._analysis_mask(analysis_types)
+        return bool(self._analysis_bitmap() & mask)
 
     def has_all_analysis(self, analysis_types):
         """Check if all of the listed analysis types have been registered.
 
         :param tuple/list analysis_types: a list of AnalysisType instances.
         """
-        if not isinstance(analysis_types, (tuple, list)):
-            raise TypeError("Input must be a tuple or list!")
-
-        for analysis_type in analysis_types:
-            if int(self.hget(Metadata.ANALYSIS_TYPE, analysis_type)) <= 0:
-                return False
-        return True
+        mask = self._analysis_mask(analysis_types)
+        return self._analysis_bitmap() & mask == mask
 
     def get_all_analysis(self):
         """Query all the registered analysis types.
@@ -116,6 +346,37 @@ class MetaProxy(_AbstractProxy):
             return self.hincrease_by(Metadata.ANALYSIS_TYPE, analysis_type, -1)
         return 0
 
+    def subscribe_fields(self, fields):
+        """Subscribe the given optional fields of the processed data.
+
+        :param tuple/list fields: a list of field names.
+        """
+        for field in fields:
+            self.hincrease_by(Metadata.GUI_FIELDS, field, 1)
+
+    def unsubscribe_fields(self, fields):
+        """Unsubscribe the given optional fields of the processed data.
+
+        :param tuple/list fields: a list of field names.
+        """
+        name = Metadata.GUI_FIELDS
+        for field in fields:
+            # check and decrease in one step since more than one window
+            # can be closed at the same time
+            self._write_cached(
+                name, 'EVAL', self._DECREASE_IF_POSITIVE, 1, name, field)
+
+    def get_subscribed_fields(self):
+        """Query the optional fields of the processed data in use.
+
+        :return: None if the connection failed; otherwise, a set of
+                 field names which have at least one subscriber.
+        """
+        fields = self.hget_all(Metadata.GUI_FIELDS)
+        if fields is None:
+            return None
+        return {k for k, v in fields.items() if int(v) > 0}
+
     @redis_except_handler
     def add_data_source(self, item):
         """Add a data source.
@@ -7,54 +7,353 @@ Author: Jun Zhu <jun.zhu@xfel.eu>
 Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
+import json
 import time
 
+import numpy as np
+
 from .base_proxy import _AbstractProxy
 from .db_utils import redis_except_handler
 from ..config import config
 
 
-MAX_TRAIN_ID = 999999999
 MAX_PERFORMANCE_MONITOR_POINTS = 10 * 60 * 5  # 5 minutes at 10 Hz
+MAX_TRACES = 1000
+# interval for writing out the buckets being aggregated, in second
+PERFORMANCE_FLUSH_INTERVAL = 1.0
+# (bucket width in second, max number of buckets)
+PERFORMANCE_BUCKETS = {
+    '1s': (1, 60 * 60),  # 1 hour
+    '1m': (60, 24 * 60),  # 1 day
+}
+
+
+class _PerformanceBucket:
+    """Aggregation of the per-train records within a time interval.
+
+    The record of the bucket being aggregated can be written out before
+    the bucket is complete (see flush). It is then marked as partial and
+    replaced when it is written out again.
+    """
+    def __init__(self, width):
+        self._width = width
+        self._start = None
+        self._n_trains = 0
+        self._tids = None
+        # stage: (sum of durations, number of trains)
+        self._durations = dict()
+        self._n_dropped = 0
+        # whether the current bucket has been written out
+        self._written = False
+        # whether the current bucket has changed since it was written out
+        self._dirty = False
+
+    def add(self, timestamp, tid, durations, n_dropped):
+        """Add a per-train record.
+
+        :return: (aggregated record, whether it replaces the written
+            one) of the previous bucket if the record falls into a new
+            bucket; otherwise, None.
+        """
+        start = timestamp - timestamp % self._width
+        ret = None
+        if start != self._start:
+            if self._start is not None:
+                ret = (self.record(), self._written)
+            self._start = start
+            self._n_trains = 0
+            self._tids = [tid, tid]
+            self._durations.clear()
+            self._n_dropped = 0
+            self._written = False
+
+        self._n_trains += 1
+        self._tids[0] = min(self._tids[0], tid)
+        self._tids[1] = max(self._tids[1], tid)
+        for k, v in durations.items():
+            total, count = self._durations.get(k, (0., 0))
+            self._durations[k] = (total + v, count + 1)
+        self._n_dropped += n_dropped
+        self._dirty = True
+        return ret
+
+    def flush(self):
+        """Write out the bucket being aggregated.
+
+        :return: (partial record, whether it replaces the written one)
+            if the bucket has changed since it was written out;
+            otherwise, None.
+        """
+        if not self._dirty:
+            return None
+
+        ret = (self.record(partial=True), self._written)
+        self._written = True
+        self._dirty = False
+        return ret
+
+    def record(self, partial=False):
+        """Return the aggregated record of the current bucket.
+
+        The duration of a stage is averaged over the trains which have
+        it, since only the traced trains have per-stage durations.
+
+        :param bool partial: True if the bucket is not complete.
+        """
+        if self._start is None:
+            return None
+
+        return {
+            'timestamp': self._start,
+            'n_trains': self._n_trains,
+            'tid': self._tids.copy(),
+            'durations': {k: total / count
+                          for k, (total, count) in self._durations.items()},
+            'n_dropped': self._n_dropped,
+            'partial': partial,
+        }
+
+
+def _latency_breakdown(trace):
+    """Return the latencies of a traced train in the order of stages.
+
+    The time between two stages, e.g. spent in the queues between
+    processes, is reported as "-> <stage>".
+
+    :param dict trace: trace of a train, see TrainTrace.to_dict.
+
+    :return list: [(stage, latency in second)]. The last item is the
+        end-to-end latency with the stage name "Total".
+    """
+    ret = []
+    spans = sorted(trace['spans'], key=lambda x: x[1])
+    if not spans:
+        return ret
+
+    prev_end = None
+    for stage, start, end in spans:
+        if prev_end is not None and start > prev_end:
+            ret.append((f"-> {stage}", start - prev_end))
+        ret.append((stage, end - start))
+        prev_end = end if prev_end is None else max(prev_end, end)
+    ret.append(("Total", prev_end - spans[0][1]))
+    return ret
 
 
 class MonProxy(_AbstractProxy):
     """Proxy for adding and retrieving runtime information to redis."""
 
-    MON_PERFORMANCE = "mon:train_id"
+    # capped list of the per-train records (latest first)
+    MON_PERFORMANCE = "mon:performance"
     MON_AVAILABLE_SOURCES = "mon:available_sources"
+    # capped list of the sampled per-train traces (latest first)
+    MON_TRACES = "mon:traces"
+    # latency statistics of the profiled functions
+    MON_PROFILER = "mon:profiler"
+
+    def __init__(self):
+        super().__init__()
+
+        self._buckets = {k: _PerformanceBucket(width)
+                         for k, (width, _) in PERFORMANCE_BUCKETS.items()}
+        # when the buckets being aggregated were written out
+        self._flush_ts = 0.
+
+    def _write_bucket(self, pipe, name, record, replace):
+        key = f"{self.MON_PERFORMANCE}:{name}"
+        if replace:
+            # The written record of the same bucket is at the head. Unlike
+            # LSET, LPOP does not fail if the list has been removed.
+            pipe.execute_command('LPOP', key)
+        pipe.execute_command('LPUSH', key, json.dumps(record))
+        pipe.execute_command(
+            'LTRIM', key, 0, PERFORMANCE_BUCKETS[name][1] - 1)
+
+    def _flush_buckets(self, pipe):
+        n = 0
+        for name, bucket in self._buckets.items():
+            ret = bucket.flush()
+            if ret is not None:
+                self._write_bucket(pipe, name, *ret)
+                n += 1
+        return n
 
     @redis_except_handler
-    def add_tid_with_timestamp(self, tid):
-        """Add the current timestamp ranked by the given train ID."""
-        return self._db.zadd(self.MON_PERFORMANCE, {time.time(): tid})
+    def add_tid_with_timestamp(self, tid, durations=None, n_dropped=0):
+        """Add a per-train record with the current timestamp.
+
+        The records are also downsampled into buckets of the widths
+        defined in PERFORMANCE_BUCKETS. The buckets being aggregated are
+        written out every PERFORMANCE_FLUSH_INTERVAL seconds.
+
+        :param int tid: train ID.
+        :param dict durations: processing time (in second) of each
+            stage of the train, see TrainTrace.durations. None if the
+            train is not traced.
+        :param int n_dropped: number of trains dropped since the previous
+            one.
+        """
+        if durations is None:
+            durations = dict()
+
+        timestamp = time.time()
+        pipe = self._db.pipeline()
+        key = self.MON_PERFORMANCE
+        pipe.execute_command('LPUSH', key, json.dumps({
+            'timestamp': timestamp,
+            'tid': tid,
+            'durations': durations,
+            'n_dropped': n_dropped,
+        }))
+        pipe.execute_command(
+            'LTRIM', key, 0, MAX_PERFORMANCE_MONITOR_POINTS - 1)
+
+        for name, bucket in self._buckets.items():
+            ret = bucket.add(timestamp, tid, durations, n_dropped)
+            if ret is not None:
+                self._write_bucket(pipe, name, *ret)
+
+        if timestamp - self._flush_ts >= PERFORMANCE_FLUSH_INTERVAL:
+            self._flush_buckets(pipe)
+            self._flush_ts = timestamp
+
+        return pipe.execute()
+
+    @redis_except_handler
+    def flush_performance_records(self):
+        """Write out the buckets being aggregated.
+
+        It should be called when no more per-train records are expected
+        soon, e.g. the pipeline is paused or stopped.
+
+        :return: None if the connection failed or there is nothing to
+            write; otherwise, a list of results of the commands.
+        """
+        pipe = self._db.pipeline()
+        if self._flush_buckets(pipe) == 0:
+            return None
+        self._flush_ts = time.time()
+        return pipe.execute()
 
     @redis_except_handler
+    def get_latest_records(self, num=MAX_PERFORMANCE_MONITOR_POINTS):
+        """Get a list of latest per-train records (latest first).
+
+        :param int num: maximum length of the returned list.
+        """
+        return [json.loads(item) for item in self._db.execute_command(
+            'LRANGE', self.MON_PERFORMANCE, 0, num - 1)]
+
+    @redis_except_handler
+    def get_downsampled_records(self, bucket, num=None):
+        """Get a list of latest downsampled records (latest first).
+
+        The first record can be that of the bucket being aggregated, which
+        is marked as partial.
+
+        :param str bucket: name of the bucket in PERFORMANCE_BUCKETS.
+        :param int num: maximum length of the returned list.
+        """
+        if bucket not in PERFORMANCE_BUCKETS:
+            raise ValueError(f"Unknown bucket: {bucket}!")
+        if num is None:
+            num = PERFORMANCE_BUCKETS[bucket][1]
+
+        return [json.loads(item) for item in self._db.execute_command(
+            'LRANGE', f"{self.MON_PERFORMANCE}:{bucket}", 0, num - 1)]
+
     def get_latest_tids(self, num=MAX_PERFORMANCE_MONITOR_POINTS):
         """Get a list of latest (timestamp, tid).
 
         :param int num: maximum length of the returned list.
-            Capped by MAX_PERFORMANCE_MONITOR_POINTS.
         """
-        if num > MAX_PERFORMANCE_MONITOR_POINTS:
-            # performance concern
-            num = MAX_PERFORMANCE_MONITOR_POINTS
-        return self._db.zrevrangebyscore(
-            self.MON_PERFORMANCE, MAX_TRAIN_ID, 0,
-            start=0, num=num, withscores=True, score_cast_func=int)
+        records = self.get_latest_records(num)
+        if records is None:
+            return None
+        return [(r['timestamp'], r['tid']) for r in records]
 
-    @redis_except_handler
     def get_last_tid(self):
-        """Get the largest registered train ID with timestamp.
+        """Get the latest registered train ID with timestamp.
 
         :return: (timestamp, tid) or None if no train ID has been registered.
         """
-        query = self._db.zrevrangebyscore(
-            self.MON_PERFORMANCE, MAX_TRAIN_ID, 0,
-            start=0, num=1, withscores=True, score_cast_func=int)
+        query = self.get_latest_tids(1)
         if query:
             return query[0]
 
+    @redis_except_handler
+    def add_trace(self, trace):
+        """Add the trace of a train.
+
+        :param dict trace: trace of a train, see TrainTrace.to_dict.
+        """
+        pipe = self._db.pipeline()
+        pipe.execute_command('LPUSH', self.MON_TRACES, json.dumps(trace))
+        pipe.execute_command('LTRIM', self.MON_TRACES, 0, MAX_TRACES - 1)
+        return pipe.execute()
+
+    @redis_except_handler
+    def get_traces(self, num=MAX_TRACES):
+        """Get a list of latest traces (latest first).
+
+        :param int num: maximum length of the returned list.
+        """
+        return [json.loads(item) for item in self._db.execute_command(
+            'LRANGE', self.MON_TRACES, 0, num - 1)]
+
+    def get_latency_breakdown(self, num=MAX_TRACES):
+        """Get the statistics of the latencies of the latest traces.
+
+        :param int num: maximum number of traces.
+
+        :return: None if the connection failed; otherwise, a list of
+            (stage, {'p50', 'p95', 'p99', 'max'}) in the order of stages.
+            The latencies are in second.
+        """
+        traces = self.get_traces(num)
+        if traces is None:
+            return None
+
+        latencies = dict()
+        for trace in reversed(traces):
+            for stage, v in _latency_breakdown(trace):
+                latencies.setdefault(stage, []).append(v)
+
+        ret = []
+        for stage, v in latencies.items():
+            p50, p95, p99 = np.percentile(v, [50, 95, 99])
+            ret.append((stage, {
+                'p50': p50, 'p95': p95, 'p99': p99, 'max': max(v)}))
+        # keep the end-to-end latency at the end
+        ret.sort(key=lambda x: x[0] == "Total")
+        return ret
+
+    @redis_except_handler
+    def set_profiler_stats(self, process, stats):
+        """Set the latency statistics of the profiled functions.
+
+        :param str process: name of the process.
+        :param dict stats: {name of the function: statistics}.
+        """
+        if not stats:
+            return
+        return self._db.hmset(self.MON_PROFILER, {
+            f"{process}|{k}": json.dumps(v) for k, v in stats.items()})
+
+    @redis_except_handler
+    def get_profiler_stats(self):
+        """Get the latency statistics of the profiled functions.
+
+        :return: None if the connection failed; otherwise, a list of
+            (process, name of the function, statistics) sorted by the
+            process and the name.
+        """
+        ret = []
+        for k, v in self._db.hgetall(self.MON_PROFILER).items():
+            process, name = k.split('|', 1)
+            ret.append((process, name, json.loads(v)))
+        return sorted(ret, key=lambda x: x[:2])
+
     def get_processor_params(self, proc):
         """Query the metadata for a given processor.
 
@@ -79,6 +378,18 @@ class MonProxy(_AbstractProxy):
         pipe.execute_command('PEXPIRE', key, config['SOURCE_EXPIRATION_TIMER'])
         return pipe.execute()
 
+    @redis_except_handler
+    def refresh_available_sources(self):
+        """Extend the expiration time of the available sources.
+
+        :return: None if the connection failed;
+                 otherwise, 1 if the expiration time was extended and 0
+                 if the key does not exist (e.g. it has already expired).
+        """
+        return self._db.execute_command(
+            'PEXPIRE', self.MON_AVAILABLE_SOURCES,
+            config['SOURCE_EXPIRATION_TIMER'])
+
     def get_available_sources(self):
         """Query available sources.
 
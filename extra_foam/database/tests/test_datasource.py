@@ -57,6 +57,32 @@ class TestSourceCatalog(unittest.TestCase):
         self.assertEqual(catalog._main_detector_category, catalog_cp._main_detector_category)
         self.assertEqual(catalog._main_detector, catalog_cp._main_detector)
 
+    def testSnapshot(self):
+        catalog = SourceCatalog()
+        catalog.add_item(SourceItem('DSSC', 'dssc_device_id', [], 'image.data', None, None))
+
+        snapshot = catalog.snapshot()
+        self.assertIs(snapshot, catalog.snapshot())
+        self.assertIs(snapshot, snapshot.snapshot())
+        self.assertEqual(catalog.version, snapshot.version)
+        self.assertEqual('dssc_device_id image.data', snapshot.main_detector)
+        with self.assertRaises(TypeError):
+            snapshot.add_item(SourceItem('Motor', 'motor_device1', [], 'actualPosition', None, None))
+        with self.assertRaises(TypeError):
+            snapshot.clear()
+
+        # a new snapshot is created only after the catalog is modified
+        catalog.add_item(SourceItem('Motor', 'motor_device1', [], 'actualPosition', None, None))
+        snapshot2 = catalog.snapshot()
+        self.assertIsNot(snapshot, snapshot2)
+        self.assertEqual(1, len(snapshot))
+        self.assertEqual(2, len(snapshot2))
+
+        # a copy of the snapshot is mutable
+        catalog_cp = copy.copy(snapshot2)
+        catalog_cp.remove_item('motor_device1 actualPosition')
+        self.assertEqual(2, len(snapshot2))
+
 
 class TestDataTransformer(unittest.TestCase):
     def testExtractData(self):
@@ -186,3 +212,32 @@ class TestDataTransformer(unittest.TestCase):
         self.assertIn('abc p_abc', catalog)
         self.assertIn('abc p2_abc', catalog)
         self.assertIn('xyz_*:xtdf p_xyz', catalog)
+
+    def testPlanCache(self):
+        transformer = DataTransformer.transform_euxfel
+
+        catalog = SourceCatalog()
+        catalog.add_item(SourceItem('Motor', 'motor', [], 'actualPosition', None, None))
+        raw = {'motor': {'actualPosition.value': 1}}
+        meta = {'motor': {'timestamp.tid': 1234}}
+
+        new_raw, _, _ = transformer(raw, meta, catalog=catalog)
+        self.assertDictEqual({'motor actualPosition': 1}, new_raw)
+        plan = DataTransformer._euxfel_plan(catalog)
+        # the plan is compiled only once for each catalog version
+        new_raw, _, _ = transformer(raw, meta, catalog=catalog)
+        self.assertDictEqual({'motor actualPosition': 1}, new_raw)
+        self.assertIs(plan, DataTransformer._euxfel_plan(catalog))
+
+        # property without suffix is still found
+        raw = {'motor': {'actualPosition': 2}}
+        new_raw, _, _ = transformer(raw, meta, catalog=catalog)
+        self.assertDictEqual({'motor actualPosition': 2}, new_raw)
+        # the cached plan is not modified
+        self.assertTupleEqual(('actualPosition', 'actualPosition.value'),
+                              plan.non_modular[0][2])
+
+        catalog.add_item(SourceItem('Motor', 'motor2', [], 'actualPosition', None, None))
+        _, _, not_found = transformer(raw, meta, catalog=catalog)
+        self.assertListEqual(['motor2 actualPosition'], not_found)
+        self.assertIsNot(plan, DataTransformer._euxfel_plan(catalog))
@@ -1,3 +1,4 @@
+from threading import Event, Thread
 import unittest
 
 from extra_foam.config import AnalysisType
@@ -52,6 +53,110 @@ class TestDataProxy(unittest.TestCase):
         self._meta.unregister_analysis(type3)
         self.assertEqual('0', self._meta.hget(Metadata.ANALYSIS_TYPE, type3))
 
+    def testAnalysisTypeCache(self):
+        type1 = AnalysisType.ROI_PROJ
+        self._meta.hset(Metadata.ANALYSIS_TYPE, type1, 0)
+        self.assertFalse(self._meta.has_analysis(type1))
+
+        # registered by another process
+        self._meta._db.hincrby(Metadata.ANALYSIS_TYPE, type1, 1)
+        self.assertFalse(self._meta.has_analysis(type1))
+        self._meta._db.publish(Metadata.CACHE_UPDATE, Metadata.ANALYSIS_TYPE)
+        self.assertTrue(self._meta.has_analysis(type1))
+        self.assertTrue(self._meta.has_all_analysis([type1]))
+
+        with self.assertRaises(TypeError):
+            self._meta.has_any_analysis(type1)
+
+    def testSubscribeFields(self):
+        self.assertSetEqual(set(), self._meta.get_subscribed_fields())
+
+        self._meta.subscribe_fields(['image.images', 'corr[0]'])
+        self._meta.subscribe_fields(['corr[0]'])
+        self.assertSetEqual({'image.images', 'corr[0]'},
+                            self._meta.get_subscribed_fields())
+
+        self._meta.unsubscribe_fields(['image.images', 'corr[0]'])
+        self.assertSetEqual({'corr[0]'}, self._meta.get_subscribed_fields())
+
+        # unsubscribe a field which has not been subscribed
+        self._meta.unsubscribe_fields(['corr[1]'])
+        self.assertSetEqual({'corr[0]'}, self._meta.get_subscribed_fields())
+        self.assertIsNone(self._meta._db.hget(Metadata.GUI_FIELDS, 'corr[1]'))
+
+        # the counter does not go below zero
+        self._meta.unsubscribe_fields(['corr[0]', 'corr[0]'])
+        self.assertSetEqual(set(), self._meta.get_subscribed_fields())
+        self.assertEqual(
+            '0', self._meta._db.hget(Metadata.GUI_FIELDS, 'corr[0]'))
+
+        # subscribed by another process
+        self._meta._db.hincrby(Metadata.GUI_FIELDS, 'corr[1]', 1)
+        self.assertSetEqual(set(), self._meta.get_subscribed_fields())
+        self._meta._db.publish(Metadata.CACHE_UPDATE, Metadata.GUI_FIELDS)
+        self.assertSetEqual({'corr[1]'}, self._meta.get_subscribed_fields())
+
+    def testProcMetadataCache(self):
+        name = Metadata.BIN_PROC
+        self._meta.hset(name, 'mode', 'average')
+        self.assertDictEqual({'mode': 'average'}, self._meta.hget_all(name))
+
+        # the returned dictionary is a copy
+        self._meta.hget_all(name)['mode'] = 'accumulate'
+        self.assertEqual('average', self._meta.hget(name, 'mode'))
+
+        # update published by another process
+        self._meta._db.hset(name, 'mode', 'accumulate')
+        self.assertEqual('average', self._meta.hget(name, 'mode'))
+        self._meta._db.publish(Metadata.CACHE_UPDATE, name)
+        self.assertEqual('accumulate', self._meta.hget(name, 'mode'))
+
+        # writers invalidate the cache immediately
+        self._meta.hmset(name, {'n_bins1': 10, 'reset': 1})
+        self.assertEqual('10', self._meta.hget(name, 'n_bins1'))
+        self._meta.hdel(name, 'reset')
+        self.assertListEqual(
+            ['10', None], self._meta.hmget(name, ['n_bins1', 'reset']))
+        self._meta.hincrease_by(name, 'n_bins1', 2)
+        self.assertEqual('12', self._meta.hget(name, 'n_bins1'))
+
+    def testProcMetadataCacheThreads(self):
+        name = Metadata.HISTOGRAM_PROC
+        self._meta.hset(name, 'n_bins', 0)
+
+        n_updates = 200
+        errors = []
+        done = Event()
+
+        def _read():
+            try:
+                while not done.is_set():
+                    self._meta.hget(name, 'n_bins')
+                    self._meta.hget_all(Metadata.BIN_PROC)
+                    self._meta.has_analysis(AnalysisType.ROI_PROJ)
+            except Exception as e:
+                errors.append(e)
+
+        readers = [Thread(target=_read) for _ in range(2)]
+        for t in readers:
+            t.start()
+
+        for i in range(1, n_updates + 1):
+            if i % 2:
+                self._meta.hset(name, 'n_bins', i)
+            else:
+                # update published by another process
+                self._meta._db.hset(name, 'n_bins', i)
+                self._meta._db.publish(Metadata.CACHE_UPDATE, name)
+
+        done.set()
+        for t in readers:
+            t.join()
+
+        self.assertListEqual([], errors)
+        # no invalidation is lost
+        self.assertEqual(str(n_updates), self._meta.hget(name, 'n_bins'))
+
     def testMetaMetadata(self):
         class Dummy(metaclass=MetaMetadata):
             DATA_SOURCE = "meta:data_source"
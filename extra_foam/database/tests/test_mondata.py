@@ -0,0 +1,190 @@
+import unittest
+from unittest.mock import patch
+
+from extra_foam.database import MonProxy
+from extra_foam.database.mondata import (
+    MAX_PERFORMANCE_MONITOR_POINTS, _PerformanceBucket, _latency_breakdown
+)
+from extra_foam.processes import wait_until_redis_shutdown
+from extra_foam.services import start_redis_server
+
+
+class TestPerformanceBucket(unittest.TestCase):
+    def testAggregation(self):
+        bucket = _PerformanceBucket(60)
+        self.assertIsNone(bucket.record())
+
+        self.assertIsNone(bucket.add(120.5, 1001, {'a': 0.1}, 0))
+        self.assertIsNone(bucket.add(150., 1003, {'a': 0.3, 'b': 0.2}, 1))
+        record, replace = bucket.add(180., 1004, {'a': 0.1}, 0)
+        self.assertFalse(replace)
+        self.assertFalse(record['partial'])
+        self.assertEqual(120., record['timestamp'])
+        self.assertEqual(2, record['n_trains'])
+        self.assertListEqual([1001, 1003], record['tid'])
+        self.assertAlmostEqual(0.2, record['durations']['a'])
+        # averaged over the trains which have the stage
+        self.assertAlmostEqual(0.2, record['durations']['b'])
+        self.assertEqual(1, record['n_dropped'])
+
+        self.assertEqual(180., bucket.record()['timestamp'])
+
+    def testFlush(self):
+        bucket = _PerformanceBucket(60)
+        self.assertIsNone(bucket.flush())
+
+        bucket.add(120.5, 1001, {}, 0)
+        record, replace = bucket.flush()
+        self.assertTrue(record['partial'])
+        self.assertEqual(1, record['n_trains'])
+        self.assertFalse(replace)
+        # unchanged since written out
+        self.assertIsNone(bucket.flush())
+
+        bucket.add(130., 1002, {}, 0)
+        record, replace = bucket.flush()
+        self.assertEqual(2, record['n_trains'])
+        self.assertTrue(replace)
+
+        # the final record replaces the written one
+        bucket.add(140., 1003, {}, 0)
+        record, replace = bucket.add(180., 1004, {}, 0)
+        self.assertFalse(record['partial'])
+        self.assertEqual(3, record['n_trains'])
+        self.assertTrue(replace)
+
+        # the complete bucket is written out again without being partial
+        bucket.flush()
+        record, replace = bucket.add(240., 1005, {}, 0)
+        self.assertFalse(record['partial'])
+        self.assertTrue(replace)
+
+
+class TestLatencyBreakdown(unittest.TestCase):
+    def testBreakdown(self):
+        self.assertListEqual([], _latency_breakdown({'tid': 1, 'spans': []}))
+
+        ret = _latency_breakdown({'tid': 1, 'spans': [
+            ["Bridge", 1.0, 1.5],
+            ["Correlation", 1.0, 2.0],
+            ["ImageProcessor", 2.5, 3.0],
+            ["GUI", 3.0, 3.5],
+        ]})
+        self.assertListEqual([
+            ("Bridge", 0.5),
+            ("Correlation", 1.0),
+            ("-> ImageProcessor", 0.5),
+            ("ImageProcessor", 0.5),
+            ("GUI", 0.5),
+            ("Total", 2.5),
+        ], ret)
+
+
+class TestMonProxy(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        start_redis_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        wait_until_redis_shutdown()
+
+    def setUp(self):
+        self._mon = MonProxy()
+        self._mon._db.delete(self._mon.MON_PERFORMANCE,
+                             f"{self._mon.MON_PERFORMANCE}:1s",
+                             f"{self._mon.MON_PERFORMANCE}:1m")
+
+    @patch("extra_foam.database.mondata.PERFORMANCE_FLUSH_INTERVAL", 1e9)
+    @patch("extra_foam.database.mondata.time.time")
+    def testPerformanceRecords(self, now):
+        self.assertIsNone(self._mon.get_last_tid())
+
+        n = MAX_PERFORMANCE_MONITOR_POINTS + 10
+        for i in range(n):
+            now.return_value = 1000. + 0.1 * i
+            self._mon.add_tid_with_timestamp(i, {'a': 0.05}, 0)
+
+        # the per-train records are capped
+        records = self._mon.get_latest_records()
+        self.assertEqual(MAX_PERFORMANCE_MONITOR_POINTS, len(records))
+        self.assertEqual(n - 1, records[0]['tid'])
+        self.assertTupleEqual((now.return_value, n - 1),
+                              self._mon.get_last_tid())
+        self.assertListEqual([(r['timestamp'], r['tid']) for r in records[:5]],
+                             self._mon.get_latest_tids(5))
+
+        records = self._mon.get_downsampled_records('1s')
+        self.assertEqual(n // 10 - 1, len(records))
+        self.assertEqual(10, records[0]['n_trains'])
+        self.assertAlmostEqual(0.05, records[0]['durations']['a'])
+
+        records = self._mon.get_downsampled_records('1m')
+        self.assertEqual(5, len(records))
+        self.assertEqual(600, records[0]['n_trains'])
+
+        with self.assertRaises(ValueError):
+            self._mon.get_downsampled_records('1h')
+
+    @patch("extra_foam.database.mondata.time.time")
+    def testFlushPerformanceRecords(self, now):
+        self.assertIsNone(self._mon.flush_performance_records())
+
+        for i in range(5):
+            now.return_value = 1000. + 0.1 * i
+            self._mon.add_tid_with_timestamp(i)
+
+        # the first record is written out with the partial buckets
+        records = self._mon.get_downsampled_records('1m')
+        self.assertEqual(1, len(records))
+        self.assertEqual(1, records[0]['n_trains'])
+        self.assertTrue(records[0]['partial'])
+
+        # the buckets are written out when no more record arrives
+        self._mon.flush_performance_records()
+        records = self._mon.get_downsampled_records('1m')
+        self.assertEqual(1, len(records))
+        self.assertEqual(5, records[0]['n_trains'])
+        self.assertIsNone(self._mon.flush_performance_records())
+
+        # the final record replaces the partial one
+        now.return_value = 1100.
+        self._mon.add_tid_with_timestamp(5)
+        records = self._mon.get_downsampled_records('1m')
+        self.assertEqual(2, len(records))
+        self.assertEqual(1, records[0]['n_trains'])
+        self.assertEqual(5, records[1]['n_trains'])
+        self.assertFalse(records[1]['partial'])
+
+    def testTraces(self):
+        self._mon._db.delete(self._mon.MON_TRACES)
+        for i in range(4):
+            self._mon.add_trace({'tid': i, 'spans': [
+                ["Bridge", 0., 0.01 * (i + 1)],
+                ["GUI", 1., 1.1],
+            ]})
+
+        traces = self._mon.get_traces()
+        self.assertListEqual([3, 2, 1, 0], [t['tid'] for t in traces])
+
+        ret = self._mon.get_latency_breakdown()
+        self.assertListEqual(["Bridge", "-> GUI", "GUI", "Total"],
+                             [stage for stage, _ in ret])
+        self.assertAlmostEqual(0.04, ret[0][1]['max'])
+        self.assertAlmostEqual(0.025, ret[0][1]['p50'])
+        self.assertAlmostEqual(1.1, ret[-1][1]['p99'])
+
+    def testProfilerStats(self):
+        self._mon._db.delete(self._mon.MON_PROFILER)
+        self._mon.set_profiler_stats("train worker", {
+            "ROI Processor (train)": {'count': 1, 'p50': 0.1},
+        })
+        self._mon.set_profiler_stats("pulse worker", {
+            "Image Assembler": {'count': 0},
+            "Image Processor (pulse)": {'count': 2, 'p50': 0.2},
+        })
+        self.assertListEqual([
+            ("pulse worker", "Image Assembler", {'count': 0}),
+            ("pulse worker", "Image Processor (pulse)", {'count': 2, 'p50': 0.2}),
+            ("train worker", "ROI Processor (train)", {'count': 1, 'p50': 0.1}),
+        ], self._mon.get_profiler_stats())
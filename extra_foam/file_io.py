@@ -76,12 +76,14 @@ def read_image(filepath, *, expected_shape=None):
         raise ValueError(f"Failed to load image from {filepath}: {str(e)}")
 
 
-def read_cal_constants(filepath):
+def read_cal_constants(filepath, *, mmap=False):
     """Read calibration constant from the given file.
 
     The file must be a '.npy' file.
 
     :param str filepath: path of the constant file.
+    :param bool mmap: True for returning a read-only memory map of the
+        file without converting the dtype.
 
     :return numpy.ndarray: constant array.
     """
@@ -89,13 +91,16 @@ def read_cal_constants(filepath):
         raise ValueError("Please specify the image file!")
 
     try:
-        c = np.load(filepath)
+        c = np.load(filepath, mmap_mode='r' if mmap else None)
     except Exception as e:
         raise ValueError(f"Failed to load constants from {filepath}: {str(e)}")
 
     if c.ndim not in (2, 3):
         raise ValueError("Constants must be an array with 2 or 3 dimensions!")
 
+    if mmap:
+        return c
+
     image_dtype = config["SOURCE_PROC_IMAGE_DTYPE"]
     if c.dtype != image_dtype:
         c = c.astype(image_dtype)
@@ -14,6 +14,7 @@ import h5py
 
 from ..algorithms.geometry import LPD_1MGeometry as _LPD_1MGeometry
 from ..algorithms.geometry import DSSC_1MGeometry as _DSSC_1MGeometry
+from ..algorithms.geometry import AGIPD_1MGeometry as _AGIPD_1MGeometry
 
 
 class _1MGeometryPyMixin:
@@ -22,15 +23,37 @@ class _1MGeometryPyMixin:
         shape = extra_shape + tuple(self.assembledShape())
         return np.full(shape, np.nan, dtype=dtype)
 
-    def position_all_modules(self, modules, out):
-        """Match the EXtra-geom signature."""
-        if isinstance(modules, np.ndarray):
-            self.positionAllModules(modules, out)
-        else:  # extra_data.StackView
-            ml = []
-            for i in range(self.n_modules):
-                ml.append(modules[:, i, ...])
-            self.positionAllModules(ml, out)
+    def position_all_modules(self, modules, out, *,
+                             gain=None, offset=None, pulses=None):
+        """Match the EXtra-geom signature.
+
+        :param numpy.ndarray gain: gain constants in the assembled layout.
+            Shape = (memory cells, y, x). If given, the assembled images
+            are multiplied by it.
+        :param numpy.ndarray offset: offset constants in the assembled
+            layout. Shape = (memory cells, y, x). If given, it is
+            subtracted from the assembled images before the gain
+            correction.
+        :param list pulses: indices of the memory cells to be positioned.
+            The i-th image in out is positioned from the memory cell
+            pulses[i]. If None, all the memory cells are positioned.
+            The constants must have the same shape as out.
+        """
+        if not isinstance(modules, np.ndarray):
+            # extra_data.StackView
+            modules = [modules[:, i, ...] for i in range(self.n_modules)]
+
+        if pulses is None:
+            pulses = []
+
+        if gain is not None and offset is not None:
+            self.positionAllModulesGainOffset(modules, out, gain, offset, pulses)
+        elif offset is not None:
+            self.positionAllModulesOffset(modules, out, offset, pulses)
+        elif gain is not None:
+            self.positionAllModulesGain(modules, out, gain, pulses)
+        else:
+            self.positionAllModules(modules, out, pulses)
 
 
 class DSSC_1MGeometryFast(_DSSC_1MGeometry, _1MGeometryPyMixin):
@@ -105,3 +128,22 @@ class LPD_1MGeometryFast(_LPD_1MGeometry, _1MGeometryPyMixin):
                 modules.append(tiles)
 
         return cls(modules)
+
+
+class AGIPD_1MGeometryFast(_AGIPD_1MGeometry, _1MGeometryPyMixin):
+    """AGIPD_1MGeometryFast.
+
+    Extend the functionality of AGIPD_1MGeometry implementation in C++.
+    """
+    @classmethod
+    def from_crystfel_geom(cls, filepath):
+        # use the CrystFEL parser in EXtra-geom
+        from extra_geom import AGIPD_1MGeometry
+
+        geom = AGIPD_1MGeometry.from_crystfel_geom(filepath)
+        modules = []
+        for tiles in geom.modules:
+            # corner position of the first pixel of each tile, in meter
+            modules.append([list(tile.corner_pos) for tile in tiles])
+
+        return cls(modules)
@@ -5,7 +5,9 @@ import pytest
 import numpy as np
 
 from extra_foam.pipeline.processors.image_assembler import StackView
-from extra_foam.geometries import DSSC_1MGeometryFast, LPD_1MGeometryFast
+from extra_foam.geometries import (
+    AGIPD_1MGeometryFast, DSSC_1MGeometryFast, LPD_1MGeometryFast
+)
 import extra_geom as eg
 from extra_foam.config import config
 
@@ -17,7 +19,7 @@ _RAW_IMAGE_DTYPE = config['SOURCE_RAW_IMAGE_DTYPE']
 
 
 class _Test1MGeometryMixin:
-    @pytest.mark.parametrize("dtype", [_IMAGE_DTYPE, _RAW_IMAGE_DTYPE])
+    @pytest.mark.parametrize("dtype", [_IMAGE_DTYPE, _RAW_IMAGE_DTYPE, np.int16])
     def testAssemblingOnline(self, dtype):
         modules = np.ones((self.n_pulses, self.n_modules, *self.module_shape), dtype=dtype)
 
@@ -37,7 +39,7 @@ class _Test1MGeometryMixin:
             assert abs(out_fast.shape[i] - out_gt.shape[i]) <= 1
         # np.testing.assert_equal(out_fast, out)
 
-    @pytest.mark.parametrize("dtype", [_IMAGE_DTYPE, _RAW_IMAGE_DTYPE])
+    @pytest.mark.parametrize("dtype", [_IMAGE_DTYPE, _RAW_IMAGE_DTYPE, np.int16])
     def testAssemblingFile(self, dtype):
         modules = StackView(
             {i: np.ones((self.n_pulses, *self.module_shape), dtype=dtype) for i in range(self.n_modules)},
@@ -62,6 +64,63 @@ class _Test1MGeometryMixin:
             assert abs(out_fast.shape[i] - out_gt.shape[i]) <= 1
         # np.testing.assert_equal(out_fast, out)
 
+    @pytest.mark.parametrize("dtype", [_RAW_IMAGE_DTYPE, np.int16])
+    def testAssemblingIntegerModules(self, dtype):
+        modules = np.random.randint(
+            0, 1000, size=(self.n_pulses, self.n_modules, *self.module_shape)).astype(dtype)
+
+        # integer modules are converted while being positioned
+        out = self.geom_fast.output_array_for_position_fast((self.n_pulses,), _IMAGE_DTYPE)
+        self.geom_fast.position_all_modules(modules, out)
+
+        out_gt = self.geom_fast.output_array_for_position_fast((self.n_pulses,), _IMAGE_DTYPE)
+        self.geom_fast.position_all_modules(modules.astype(_IMAGE_DTYPE), out_gt)
+
+        np.testing.assert_array_equal(out_gt, out)
+
+    @pytest.mark.parametrize("dtype", [_IMAGE_DTYPE, _RAW_IMAGE_DTYPE])
+    def testAssemblingWithCorrection(self, dtype):
+        modules = np.random.randint(
+            0, 1000, size=(self.n_pulses, self.n_modules, *self.module_shape)).astype(dtype)
+
+        out_gt = self.geom_fast.output_array_for_position_fast((self.n_pulses,), _IMAGE_DTYPE)
+        self.geom_fast.position_all_modules(modules, out_gt)
+        gain = np.random.randn(*out_gt.shape).astype(_IMAGE_DTYPE)
+        offset = np.random.randn(*out_gt.shape).astype(_IMAGE_DTYPE)
+
+        out = self.geom_fast.output_array_for_position_fast((self.n_pulses,), _IMAGE_DTYPE)
+        self.geom_fast.position_all_modules(modules, out, offset=offset)
+        np.testing.assert_array_almost_equal(out_gt - offset, out)
+
+        self.geom_fast.position_all_modules(modules, out, gain=gain)
+        np.testing.assert_array_almost_equal(out_gt * gain, out)
+
+        self.geom_fast.position_all_modules(modules, out, gain=gain, offset=offset)
+        np.testing.assert_array_almost_equal(gain * (out_gt - offset), out)
+
+        with pytest.raises(ValueError):
+            self.geom_fast.position_all_modules(modules, out, gain=gain[:1])
+
+    def testAssemblingSelectedPulses(self):
+        modules = np.random.randn(
+            self.n_pulses, self.n_modules, *self.module_shape).astype(_IMAGE_DTYPE)
+        pulses = [self.n_pulses - 1, 0]
+
+        out_gt = self.geom_fast.output_array_for_position_fast((len(pulses),), _IMAGE_DTYPE)
+        self.geom_fast.position_all_modules(modules[pulses], out_gt)
+
+        out = self.geom_fast.output_array_for_position_fast((len(pulses),), _IMAGE_DTYPE)
+        self.geom_fast.position_all_modules(modules, out, pulses=pulses)
+        np.testing.assert_array_equal(out_gt, out)
+
+        # the constants have the same shape as the output array
+        offset = np.random.randn(*out.shape).astype(_IMAGE_DTYPE)
+        self.geom_fast.position_all_modules(modules, out, offset=offset, pulses=pulses)
+        np.testing.assert_array_almost_equal(out_gt - offset, out)
+
+        with pytest.raises(IndexError):
+            self.geom_fast.position_all_modules(modules, out, pulses=[0, self.n_pulses])
+
 
 class TestDSSC_1MGeometryFast(_Test1MGeometryMixin):
     @classmethod
@@ -120,3 +179,37 @@ class TestLPD_1MGeometryFast(_Test1MGeometryMixin):
         cls.n_pulses = 2
         cls.n_modules = LPD_1MGeometryFast.n_modules
         cls.module_shape = LPD_1MGeometryFast.module_shape
+
+
+class TestAGIPD_1MGeometryFast(_Test1MGeometryMixin):
+    @classmethod
+    def setup_class(cls):
+        geom_file = osp.join(_geom_path, "agipd_mar18_v11.geom")
+        cls.geom_stack = AGIPD_1MGeometryFast()
+        cls.geom_fast = AGIPD_1MGeometryFast.from_crystfel_geom(geom_file)
+        cls.geom = eg.AGIPD_1MGeometry.from_crystfel_geom(geom_file)
+
+        cls.n_pulses = 2
+        cls.n_modules = AGIPD_1MGeometryFast.n_modules
+        cls.module_shape = AGIPD_1MGeometryFast.module_shape
+
+    def testStackOnlyLayout(self):
+        modules = np.zeros((self.n_pulses, self.n_modules, *self.module_shape), _IMAGE_DTYPE)
+        for i in range(self.n_modules):
+            modules[:, i] = i
+        # first pixel of each module
+        modules[:, :, 0, 0] = -1
+
+        out = self.geom_stack.output_array_for_position_fast((self.n_pulses,), _IMAGE_DTYPE)
+        self.geom_stack.position_all_modules(modules, out)
+
+        # modules are stacked without gaps
+        assert not np.isnan(out).any()
+        # ss -> x and fs -> y, the first module of Q1 at (min x, max y)
+        np.testing.assert_array_equal(out[:, -1, 0], -1)
+        out[:, -1, 0] = 0
+        np.testing.assert_array_equal(out[:, -128:, :512], 0)
+        # the first module of Q3 is flipped in both x and y
+        np.testing.assert_array_equal(out[:, 384, -1], -1)
+        out[:, 384, -1] = 8
+        np.testing.assert_array_equal(out[:, 384:512, 512:], 8)
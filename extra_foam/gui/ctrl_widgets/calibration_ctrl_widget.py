@@ -18,6 +18,7 @@ from .base_ctrl_widgets import _AbstractCtrlWidget
 from .smart_widgets import SmartSliceLineEdit
 from ..gui_helpers import create_icon_button
 from ...ipc import CalConstantsPub
+from ...logger import logger
 
 
 class CalibrationCtrlWidget(_AbstractCtrlWidget):
@@ -135,16 +136,24 @@ class CalibrationCtrlWidget(_AbstractCtrlWidget):
         filepath = QFileDialog.getOpenFileName(
             caption="Load constants", directory=osp.expanduser("~"))[0]
         if filepath:
+            try:
+                self._pub.set_gain(filepath)
+            except ValueError as e:
+                logger.error(str(e))
+                return
             self._gain_fp_le.setText(filepath)
-            self._pub.set_gain(filepath)
 
     @pyqtSlot()
     def _loadOffsetConst(self):
         filepath = QFileDialog.getOpenFileName(
             caption="Load constants", directory=osp.expanduser("~"))[0]
         if filepath:
+            try:
+                self._pub.set_offset(filepath)
+            except ValueError as e:
+                logger.error(str(e))
+                return
             self._offset_fp_le.setText(filepath)
-            self._pub.set_offset(filepath)
 
     @pyqtSlot()
     def _removeGain(self):
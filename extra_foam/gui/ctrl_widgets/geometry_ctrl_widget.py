@@ -41,11 +41,6 @@ class GeometryCtrlWidget(_AbstractCtrlWidget):
         self._stack_only_cb = QCheckBox("Stack only")
         self._stack_only_cb.setChecked(False)
 
-        if config["DETECTOR"] == "AGIPD":
-            # FIXME: native AGIPD geometry is not implemented yet
-            self._assembler_cb.removeItem(0)
-            self._stack_only_cb.setEnabled(False)
-
         self._quad_positions_tb = QTableWidget()
 
         self._geom_file_le = QLineEdit(config["GEOMETRY_FILE"])
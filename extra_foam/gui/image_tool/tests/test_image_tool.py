@@ -397,19 +397,20 @@ class TestImageTool(unittest.TestCase, _TestDataMixin):
 
         const_gt = np.ones([2, 2])
 
-        def _read_constants_side_effect(fn):
-            if fn in ["gain/file/path", "offset/file/path"]:
-                return const_gt
-
         # caveat: first establish the connection
         proc._cal_sub.update(None, None)
 
-        with patch('extra_foam.ipc.read_cal_constants', side_effect=_read_constants_side_effect):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            gain_fp = os.path.join(tmp_dir, "gain.npy")
+            np.save(gain_fp, const_gt)
+            offset_fp = os.path.join(tmp_dir, "offset.npy")
+            np.save(offset_fp, const_gt.astype(np.float32))
+
             with patch('extra_foam.gui.ctrl_widgets.calibration_ctrl_widget.QFileDialog.getOpenFileName',
-                       return_value=["gain/file/path"]):
+                       return_value=[gain_fp]):
                 QTest.mouseClick(widget._load_gain_btn, Qt.LeftButton)
                 time.sleep(0.1)  # wait to write into redis
-                self.assertEqual("gain/file/path", widget._gain_fp_le.text())
+                self.assertEqual(gain_fp, widget._gain_fp_le.text())
 
                 n_attempts = 0
                 # repeat to prevent random failure at Travis
@@ -425,6 +426,7 @@ class TestImageTool(unittest.TestCase, _TestDataMixin):
                 self.assertIsNone(offset)
 
                 QTest.mouseClick(widget._remove_gain_btn, Qt.LeftButton)
+                time.sleep(0.1)  # wait to write into redis
                 self.assertEqual("", widget._gain_fp_le.text())
                 new_gain, gain, new_offset, offset = proc._cal_sub.update(const_gt, None)
                 self.assertTrue(new_gain)
@@ -433,12 +435,12 @@ class TestImageTool(unittest.TestCase, _TestDataMixin):
                 self.assertIsNone(offset)
 
             with patch('extra_foam.gui.ctrl_widgets.calibration_ctrl_widget.QFileDialog.getOpenFileName',
-                       return_value=["offset/file/path"]):
+                       return_value=[offset_fp]):
                 proc._gain = const_gt
 
                 QTest.mouseClick(widget._load_offset_btn, Qt.LeftButton)
                 time.sleep(0.1)  # wait to write data into redis
-                self.assertEqual("offset/file/path", widget._offset_fp_le.text())
+                self.assertEqual(offset_fp, widget._offset_fp_le.text())
                 new_gain, gain, new_offset, offset = proc._cal_sub.update(const_gt, None)
                 self.assertFalse(new_gain)
                 np.testing.assert_array_equal(gain, const_gt)
@@ -446,6 +448,7 @@ class TestImageTool(unittest.TestCase, _TestDataMixin):
                 np.testing.assert_array_equal(offset, const_gt)
 
                 QTest.mouseClick(widget._remove_offset_btn, Qt.LeftButton)
+                time.sleep(0.1)  # wait to write into redis
                 self.assertEqual("", widget._offset_fp_le.text())
                 new_gain, gain, new_offset, offset = proc._cal_sub.update(const_gt, const_gt)
                 self.assertFalse(new_gain)
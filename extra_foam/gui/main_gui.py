@@ -46,7 +46,7 @@ from ..config import config
 from ..logger import logger
 from ..utils import profiler
 from ..ipc import RedisConnection, RedisPSubscriber
-from ..pipeline import MpInQueue
+from ..pipeline import MpInQueue, MpInShmQueue
 from ..processes import shutdown_all
 from ..database import MonProxy
 
@@ -106,7 +106,9 @@ class MainGUI(QMainWindow):
         self._pause_ev = pause_ev
         self._close_ev = close_ev
         self._input_update_ev = Event()
-        self._input = MpInQueue(self._input_update_ev, pause_ev, close_ev)
+        in_queue = MpInShmQueue if config["PIPELINE_SHM_ENABLED"] \
+            else MpInQueue
+        self._input = in_queue(self._input_update_ev, pause_ev, close_ev)
 
         self._pulse_resolved = config["PULSE_RESOLVED"]
         self._queue = deque(maxlen=1)
@@ -388,6 +390,7 @@ class MainGUI(QMainWindow):
         #     w.reset()
 
         data = self._queue[0]
+        t0 = time.time()
 
         self._image_tool.updateWidgetsF()
         for w in itertools.chain(self._special_windows, self._plot_windows):
@@ -399,6 +402,12 @@ class MainGUI(QMainWindow):
                              + repr(e))
                 logger.error(f"[Update plots] {repr(e)}")
 
+        trace = data.trace
+        if trace is not None:
+            trace.add("GUI", t0)
+            self._mon_proxy.add_trace(trace.to_dict())
+            data.trace = None
+
         logger.debug(f"Plot train with ID: {data.tid}")
 
     def pingRedisServer(self):
@@ -54,6 +54,12 @@ class Mediator(QObject):
     def unregisterAnalysis(self, analysis_type):
         self._meta.unregister_analysis(analysis_type)
 
+    def subscribeFields(self, fields):
+        self._meta.subscribe_fields(fields)
+
+    def unsubscribeFields(self, fields):
+        self._meta.unsubscribe_fields(fields)
+
     def onBridgeConnectionsChange(self, connections: dict):
         # key = endpoint, value = source type
         pipe = self._meta.pipeline()
@@ -86,7 +92,7 @@ class Mediator(QObject):
         self._meta.hset(mt.IMAGE_PROC, "recording dark", str(value))
 
     def onCalDarkRemove(self):
-        self._meta.hset(mt.IMAGE_PROC, "remove dark", 1)
+        self._meta.hincrease_by(mt.IMAGE_PROC, "remove dark", 1)
 
     def onImageThresholdMaskChange(self, value: tuple):
         self._meta.hset(mt.IMAGE_PROC, "threshold_mask", str(value))
@@ -226,10 +232,10 @@ class Mediator(QObject):
         # index, source, resolution
         # index starts from 1
         index, src, resolution = value
-        pipe = self._meta.pipeline()
-        pipe.hset(mt.CORRELATION_PROC, f'source{index}', src)
-        pipe.hset(mt.CORRELATION_PROC, f'resolution{index}', resolution)
-        pipe.execute()
+        self._meta.hmset(mt.CORRELATION_PROC, {
+            f'source{index}': src,
+            f'resolution{index}': resolution,
+        })
 
     def onCorrelationReset(self):
         self._meta.hset(mt.CORRELATION_PROC, "reset", 1)
@@ -239,11 +245,11 @@ class Mediator(QObject):
         # where the index starts from 1
         index, src, bin_range, n_bins = value
 
-        pipe = self._meta.pipeline()
-        pipe.hset(mt.BIN_PROC, f'source{index}', src)
-        pipe.hset(mt.BIN_PROC, f'bin_range{index}', str(bin_range))
-        pipe.hset(mt.BIN_PROC, f'n_bins{index}', n_bins)
-        pipe.execute()
+        self._meta.hmset(mt.BIN_PROC, {
+            f'source{index}': src,
+            f'bin_range{index}': str(bin_range),
+            f'n_bins{index}': n_bins,
+        })
 
     def onBinAnalysisTypeChange(self, value: IntEnum):
         self._meta.hset(mt.BIN_PROC, "analysis_type", int(value))
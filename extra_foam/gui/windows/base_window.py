@@ -51,6 +51,9 @@ class _AbstractPlotWindow(QMainWindow, _AbstractWindowMixin):
     """
     _title = ""
 
+    # optional fields of the processed data consumed by the window
+    _fields = ()
+
     _SPLITTER_HANDLE_WIDTH = 5
 
     def __init__(self, queue, *, pulse_resolved=True, parent=None):
@@ -66,6 +69,7 @@ class _AbstractPlotWindow(QMainWindow, _AbstractWindowMixin):
             parent.registerWindow(self)
 
         self._mediator = Mediator()
+        self._mediator.subscribeFields(self._fields)
 
         self._queue = queue
         self._pulse_resolved = pulse_resolved
@@ -107,6 +111,7 @@ class _AbstractPlotWindow(QMainWindow, _AbstractWindowMixin):
         parent = self.parent()
         if parent is not None:
             parent.unregisterWindow(self)
+        self._mediator.unsubscribeFields(self._fields)
         super().closeEvent(QCloseEvent)
 
 
@@ -153,6 +158,9 @@ class _AbstractSpecialAnalysisWindow(QMainWindow, _AbstractWindowMixin):
     """Base class for special analysis windows."""
     title = ""
 
+    # optional fields of the processed data consumed by the window
+    _fields = ()
+
     _SPLITTER_HANDLE_WIDTH = 5
 
     def __init__(self, queue, *, pulse_resolved=True, parent=None):
@@ -168,6 +176,7 @@ class _AbstractSpecialAnalysisWindow(QMainWindow, _AbstractWindowMixin):
             parent.registerSpecialWindow(self)
 
         self._mediator = Mediator()
+        self._mediator.subscribeFields(self._fields)
 
         self._queue = queue
         self._pulse_resolved = pulse_resolved
@@ -209,4 +218,5 @@ class _AbstractSpecialAnalysisWindow(QMainWindow, _AbstractWindowMixin):
         parent = self.parent()
         if parent is not None:
             parent.unregisterSpecialWindow(self)
+        self._mediator.unsubscribeFields(self._fields)
         super().closeEvent(QCloseEvent)
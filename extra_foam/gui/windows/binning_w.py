@@ -223,6 +223,7 @@ class BinningWindow(_AbstractPlotWindow):
     Plot data in selected bins.
     """
     _title = "Binning 1D"
+    _fields = ('bin[0]', 'bin[1]', 'bin.heat')
 
     _TOTAL_W, _TOTAL_H = config['GUI_PLOT_WINDOW_SIZE']
 
@@ -94,6 +94,7 @@ class CorrelationWindow(_AbstractPlotWindow):
     Visualize correlation.
     """
     _title = "Correlation"
+    _fields = ('corr[0]', 'corr[1]')
 
     _TOTAL_W, _TOTAL_H = config['GUI_PLOT_WINDOW_SIZE']
     _TOTAL_H /= 2
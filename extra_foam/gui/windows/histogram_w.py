@@ -73,6 +73,7 @@ class HistogramWindow(_AbstractPlotWindow):
     Visualize histogram.
     """
     _title = "Histogram"
+    _fields = ('hist', 'pulse.hist')
 
     _TOTAL_W, _TOTAL_H = config['GUI_PLOT_WINDOW_SIZE']
     _TOTAL_H /= 2
@@ -116,6 +116,7 @@ class PoiRoiHist(HistMixin, PlotWidgetF):
 class PulseOfInterestWindow(_AbstractPlotWindow):
     """PulseOfInterestWindow class."""
     _title = "Pulse-of-interest"
+    _fields = ('image.images', 'pulse.hist', 'pulse.roi.hist')
 
     _TOTAL_W, _TOTAL_H = config['GUI_PLOT_WINDOW_SIZE']
 
@@ -130,6 +130,7 @@ class PumpProbeFomPlot(TimedPlotWidgetF):
 class PumpProbeWindow(_AbstractPlotWindow):
     """PumpProbeWindow class."""
     _title = "Pump-probe"
+    _fields = ('pp.image_on', 'pp.image_off', 'corr.pp')
 
     _TOTAL_W, _TOTAL_H = config['GUI_PLOT_WINDOW_SIZE']
 
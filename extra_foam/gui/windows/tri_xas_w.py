@@ -92,6 +92,7 @@ class TrXasHeatmap(TimedImageViewF):
 class TrXasWindow(_AbstractSpecialAnalysisWindow):
     """TrXasWindow class."""
     _title = "Tr-XAS"
+    _fields = ('trxas',)
 
     _TOTAL_W, _TOTAL_H = config['GUI_PLOT_WINDOW_SIZE']
 
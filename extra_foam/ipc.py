@@ -7,22 +7,40 @@ Author: Jun Zhu <jun.zhu@xfel.eu>
 Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import multiprocessing as mp
+import multiprocessing.util
+import os
+import os.path as osp
+from queue import Empty, Full, Queue
+import socket
+import stat
+import tempfile
+from threading import Lock, Thread
+import time
 import weakref
 
 import json
 import numpy as np
 
+import psutil
 import redis
 
+from . import ROOT_PATH
 from .config import config
-from .serialization import deserialize_image, serialize_image
 from .file_io import read_cal_constants
 
 
 class _RedisQueueBase:
-    def __init__(self, namespace, **kwargs):
+    def __init__(self, namespace):
         self._key = namespace
-        self._redis = redis.Redis(**kwargs)
+
+    @property
+    def _redis(self):
+        return redis_connection(decode_responses=False)
 
 
 class RQProducer(_RedisQueueBase):
@@ -69,9 +87,47 @@ _GLOBAL_REDIS_CONNECTION_BYTES = None
 _global_connections = dict()
 
 
+def redis_unix_socket_path(port):
+    """Return the path of the Unix domain socket of a Redis server.
+
+    :param int port: Port of the Redis server.
+    """
+    path = config["REDIS_UNIX_DOMAIN_SOCKET_PATH"]
+    if not path:
+        path = osp.join(ROOT_PATH, f"redis-{port}.sock")
+    return path
+
+
+def _is_local_host(host):
+    """Check whether the host is this machine."""
+    try:
+        ip = socket.gethostbyname(host)
+    except socket.gaierror:
+        return False
+
+    if ip.startswith("127."):
+        return True
+
+    for addrs in psutil.net_if_addrs().values():
+        for addr in addrs:
+            if addr.family == socket.AF_INET and addr.address == ip:
+                return True
+    return False
+
+
+def _is_unix_socket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
 def init_redis_connection(host, port, *, password=None):
     """Initialize Redis client connection.
 
+    The Unix domain socket of the Redis server is used instead of TCP if
+    the server runs on the same machine.
+
     :param str host: IP address of the Redis server.
     :param int port:: Port of the Redis server.
     :param str password: password for the Redis server.
@@ -91,19 +147,17 @@ def init_redis_connection(host, port, *, password=None):
                 c.reset()
 
     # initialize new connection
-    if config["REDIS_UNIX_DOMAIN_SOCKET_PATH"]:
-        raise NotImplementedError(
-            "Unix domain socket connection is not supported!")
-        # connection = redis.Redis(
-        #     unix_socket_path=config["REDIS_UNIX_DOMAIN_SOCKET_PATH"],
-        #     decode_responses=decode_responses
-        # )
+    socket_path = redis_unix_socket_path(port)
+    if _is_local_host(host) and _is_unix_socket(socket_path):
+        kwargs = {'unix_socket_path': socket_path}
     else:
-        # the following two must have different pools
-        connection = redis.Redis(
-            host, port, password=password, decode_responses=True)
-        connection_byte = redis.Redis(
-            host, port, password=password, decode_responses=False)
+        kwargs = {'host': host, 'port': port}
+
+    # the following two must have different pools
+    connection = redis.Redis(
+        password=password, decode_responses=True, **kwargs)
+    connection_byte = redis.Redis(
+        password=password, decode_responses=False, **kwargs)
 
     _GLOBAL_REDIS_CONNECTION = connection
     _GLOBAL_REDIS_CONNECTION_BYTES = connection_byte
@@ -196,42 +250,238 @@ class RedisPSubscriber(metaclass=MetaRedisConnection):
 class ProcessLogger:
     """Worker which publishes log message in another Process.
 
+    Messages are queued and published in batches by a background thread
+    in each process. Identical messages repeated within REPEAT_INTERVAL
+    are published only once, followed by the number of repetitions.
+
     Note: remember to change other part of the code if the log pattern
     changes.
     """
 
     _db = RedisConnection()
 
+    # max number of messages waiting to be published
+    MAX_QUEUE_SIZE = 10000
+    # interval between two batches in second
+    FLUSH_INTERVAL = 0.1
+    # interval within which identical messages are collapsed in second
+    REPEAT_INTERVAL = 1.0
+
+    def __init__(self):
+        self._pid = None
+        self._queue = None
+        self._lock = None
+        # guard the start of the publishing thread and _n_dropped, which
+        # are accessed by all the threads which log messages
+        self._start_lock = Lock()
+        # key: (channel, message),
+        # value: [time of the last publication, number of repetitions]
+        self._repeats = dict()
+        self._n_dropped = 0
+
+    def _start(self):
+        """Start the publishing thread.
+
+        It must be called with _start_lock held.
+        """
+        self._queue = Queue(maxsize=self.MAX_QUEUE_SIZE)
+        self._lock = Lock()
+        self._repeats.clear()
+        self._n_dropped = 0
+
+        Thread(target=self._run, args=(self._queue,), daemon=True).start()
+        # publish the remaining messages before the process exits
+        mp.util.Finalize(self, self.flush, exitpriority=0)
+        # set at last since the other threads only check the pid
+        self._pid = os.getpid()
+
+    def _run(self, queue):
+        while True:
+            try:
+                records = [queue.get(timeout=self.FLUSH_INTERVAL)]
+            except Empty:
+                records = []
+            self._flush(records)
+
+    def _flush(self, records, force=False):
+        with self._lock:
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            now = time.monotonic()
+            outgoing = []
+            for record in records:
+                repeat = self._repeats.get(record)
+                if repeat is None:
+                    self._repeats[record] = [now, 0]
+                    outgoing.append(record)
+                else:
+                    repeat[1] += 1
+
+            for record, (t0, n) in list(self._repeats.items()):
+                if force or now - t0 >= self.REPEAT_INTERVAL:
+                    if n > 0:
+                        ch, msg = record
+                        outgoing.append((ch, f"{msg} (x{n})"))
+                        self._repeats[record] = [now, 0]
+                    else:
+                        del self._repeats[record]
+
+            with self._start_lock:
+                n_dropped, self._n_dropped = self._n_dropped, 0
+            if n_dropped > 0:
+                outgoing.append(("log:warning",
+                                 f"{n_dropped} log messages dropped!"))
+
+            if not outgoing:
+                return
+
+            try:
+                pipe = self._db.pipeline()
+                for ch, msg in outgoing:
+                    pipe.publish(ch, msg)
+                pipe.execute()
+            except redis.ConnectionError:
+                pass
+
+    def flush(self):
+        """Publish all the queued messages and repetitions."""
+        if self._pid == os.getpid():
+            self._flush([], force=True)
+
+    def _log(self, ch, msg):
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._start()
+
+        try:
+            self._queue.put_nowait((ch, msg))
+        except Full:
+            with self._start_lock:
+                self._n_dropped += 1
+
     def debug(self, msg):
-        self._db.publish("log:debug", msg)
+        self._log("log:debug", msg)
 
     def info(self, msg):
-        self._db.publish("log:info", msg)
+        self._log("log:info", msg)
 
     def warning(self, msg):
-        self._db.publish("log:warning", msg)
+        self._log("log:warning", msg)
 
     def error(self, msg):
-        self._db.publish("log:error", msg)
+        self._log("log:error", msg)
 
 
 process_logger = ProcessLogger()
 
 
+class SharedArrayWriter:
+    """Writer of arrays into named shared-memory segments.
+
+    Each array is written into a new segment and only the path of the
+    segment is sent to the readers, which map the segment without copying
+    (see read_shared_array). The previous segment of the same channel is
+    unlinked, which does not affect the readers which have mapped it.
+    """
+    def __init__(self):
+        self._pid = None
+        self._counter = itertools.count()
+        # key: channel, value: path of the latest segment
+        self._segments = dict()
+
+    @staticmethod
+    def _shm_dir():
+        shm_dir = config["PIPELINE_SHM_DIR"]
+        if not osp.isdir(shm_dir):
+            shm_dir = tempfile.gettempdir()
+        return shm_dir
+
+    def write(self, channel, array):
+        """Write an array into a new segment.
+
+        :param str channel: name of the channel.
+        :param numpy.ndarray array: array to be written.
+
+        :return str: path of the segment.
+        """
+        if self._pid != os.getpid():
+            # segments are owned by the process which created them
+            self._pid = os.getpid()
+            self._segments.clear()
+            atexit.register(self.clear)
+
+        name = channel.replace(':', '-')
+        path = osp.join(self._shm_dir(),
+                        f"extra-foam-{self._pid}-{name}-"
+                        f"{next(self._counter)}.npy")
+        fp = np.lib.format.open_memmap(
+            path, mode='w+', dtype=array.dtype, shape=array.shape)
+        fp[...] = array
+        fp.flush()
+        del fp
+
+        self.remove(channel)
+        self._segments[channel] = path
+        return path
+
+    def remove(self, channel):
+        """Unlink the latest segment of a channel."""
+        path = self._segments.pop(channel, None)
+        if path is not None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Unlink all the segments."""
+        for channel in list(self._segments):
+            self.remove(channel)
+
+
+_shm_writer = SharedArrayWriter()
+
+
+def read_shared_array(path):
+    """Map an array written by SharedArrayWriter or a '.npy' file.
+
+    The segment is mapped copy-on-write. Namely, the array can be modified
+    in place without affecting the segment and the pages are only copied
+    when they are written.
+
+    :param str path: path of the segment or file.
+
+    :raises FileNotFoundError: if the segment has been unlinked, which
+        happens when a newer one has been written.
+    """
+    return np.load(path, mmap_mode='c').view(np.ndarray)
+
+
 class ReferencePub:
     _db = RedisConnection()
 
     def set(self, image):
-        """Publish the reference image in Redis."""
-        self._db.publish("reference_image", serialize_image(image))
+        """Publish the reference image.
+
+        The image is written into shared memory and only the path of the
+        segment is published in Redis.
+        """
+        self._db.publish("reference_image",
+                         _shm_writer.write("reference_image", image))
 
     def remove(self):
         """Notify to remove the current reference image."""
         self._db.publish("reference_image", '')
+        _shm_writer.remove("reference_image")
 
 
 class ReferenceSub:
-    _sub = RedisSubscriber("reference_image", decode_responses=False)
+    _sub = RedisSubscriber("reference_image")
 
     def update(self, ref):
         """Parse all reference image operations.
@@ -239,16 +489,23 @@ class ReferenceSub:
         :return numpy.ndarray: the updated reference image.
         """
         sub = self._sub
+        path = None
         while True:
             msg = sub.get_message(ignore_subscribe_messages=True)
             if msg is None:
                 break
 
-            v = msg['data']
-            if not v:
+            path = msg['data']
+
+        if path is not None:
+            if not path:
                 ref = None
             else:
-                ref = deserialize_image(v)
+                try:
+                    ref = read_shared_array(path)
+                except FileNotFoundError:
+                    # the notification of the newer one is on the way
+                    pass
         return ref
 
 
@@ -266,18 +523,24 @@ class ImageMaskPub:
         self._db.publish("image_mask", str(mask_region))
 
     def set(self, mask):
-        """Set the whole mask."""
+        """Set the whole mask.
+
+        The mask is written into shared memory and only the path of the
+        segment is published in Redis.
+        """
         self._db.publish("image_mask", 'set')
         self._db.publish("image_mask",
-                         serialize_image(mask, is_mask=True))
+                         _shm_writer.write("image_mask",
+                                           mask.astype(np.bool, copy=False)))
 
     def remove(self):
         """Completely remove all the mask."""
         self._db.publish("image_mask", 'remove')
+        _shm_writer.remove("image_mask")
 
 
 class ImageMaskSub:
-    _sub = RedisSubscriber("image_mask", decode_responses=False)
+    _sub = RedisSubscriber("image_mask")
 
     def update(self, mask, shape):
         """Parse all masking operations.
@@ -298,15 +561,19 @@ class ImageMaskSub:
                 break
 
             action = msg['data']
-            if action == b'set':
-                mask = deserialize_image(sub.get_message()['data'], is_mask=True)
-            elif action in [b'add', b'erase']:
+            if action == 'set':
+                try:
+                    mask = read_shared_array(sub.get_message()['data'])
+                except FileNotFoundError:
+                    # the notification of the newer one is on the way
+                    pass
+            elif action in ['add', 'erase']:
                 if mask is None:
                     mask = np.zeros(shape, dtype=np.bool)
 
-                data = sub.get_message()['data'].decode("utf-8")
+                data = sub.get_message()['data']
                 x, y, w, h = [int(v) for v in data[1:-1].split(',')]
-                if action == b'add':
+                if action == 'add':
                     mask[y:y+h, x:x+w] = True
                 else:
                     mask[y:y+h, x:x+w] = False
@@ -317,29 +584,90 @@ class ImageMaskSub:
 
 
 class CalConstantsPub:
+    """Publisher of calibration constants.
+
+    The constants are published in a background thread in the order of
+    the requests. The constants file is published directly if its dtype
+    is the one used in processing, so that the workers memory-map the
+    file itself. Otherwise, the converted constants are written into
+    shared memory and cached by (path, mtime, size) of the file.
+    """
     _db = RedisConnection()
 
+    # maximum number of converted constants kept in shared memory
+    CACHE_SIZE = 2
+
+    def __init__(self):
+        self._executor = None
+        self._counter = itertools.count()
+        # key: (filepath, mtime, size), value: (channel, path of the segment)
+        self._cache = OrderedDict()
+
+    def _submit(self, f, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._executor.submit(f, *args)
+
+    def _set(self, name, filepath):
+        # cheap since only the header is read
+        c = read_cal_constants(filepath, mmap=True)
+        self._submit(self._publish, name, filepath, c)
+
+    def _publish(self, name, filepath, c):
+        try:
+            self._db.publish(f"cal_constants:{name}",
+                             self._convert(filepath, c))
+        except Exception as e:
+            process_logger.error(
+                f"Failed to publish constants from {filepath}: {str(e)}")
+
+    def _convert(self, filepath, c):
+        """Return the path of the constants with the processing dtype."""
+        filepath = osp.abspath(filepath)
+        dtype = config["SOURCE_PROC_IMAGE_DTYPE"]
+        if c.dtype == dtype:
+            return filepath
+
+        fs = os.stat(filepath)
+        key = (filepath, fs.st_mtime, fs.st_size)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+        else:
+            channel = f"cal_constants:{next(self._counter)}"
+            self._cache[key] = (
+                channel, _shm_writer.write(channel, c.astype(dtype)))
+            if len(self._cache) > self.CACHE_SIZE:
+                _shm_writer.remove(self._cache.popitem(last=False)[1][0])
+        return self._cache[key][1]
+
+    def _remove(self, name):
+        self._submit(self._db.publish, f"cal_constants:{name}", '')
+
     def set_gain(self, filepath):
-        """Publish the gain constants filepath in Redis.
+        """Load the gain constants and publish them.
 
         ：param str filepath: path of the gain constants file.
+
+        :raises ValueError: if the constants cannot be loaded.
         """
-        self._db.publish("cal_constants:gain", filepath)
+        self._set("gain", filepath)
 
     def remove_gain(self):
         """Notify to remove the current gain constants."""
-        self._db.publish("cal_constants:gain", '')
+        self._remove("gain")
 
     def set_offset(self, filepath):
-        """Publish the offset constants filepath in Redis.
+        """Load the offset constants and publish them.
 
         ：param str filepath: path of the offset constants file.
+
+        :raises ValueError: if the constants cannot be loaded.
         """
-        self._db.publish("cal_constants:offset", filepath)
+        self._set("offset", filepath)
 
     def remove_offset(self):
         """Notify to remove the current offset constants."""
-        self._db.publish("cal_constants:offset", '')
+        self._remove("offset")
 
 
 class CalConstantsSub:
@@ -348,35 +676,27 @@ class CalConstantsSub:
     def update(self, gain, offset):
         """Parse all cal constants operations."""
         sub = self._sub
-        new_gain = False
-        gain_fp = None
-        new_offset = False
-        offset_fp = None
+        # key: name of the constants, value: path of the segment
+        paths = dict()
         while True:
             msg = sub.get_message(ignore_subscribe_messages=True)
             if msg is None:
                 break
 
-            c = msg['channel'].split(":")[-1]
-            v = msg['data']
-            if c == 'gain':
-                if not v:
-                    gain = None
-                    new_gain = True
-                else:
-                    gain_fp = v
-            elif c == 'offset':
-                if not v:
-                    offset = None
-                    new_offset = True
-                else:
-                    offset_fp = v
-
-        if gain_fp is not None:
-            gain = read_cal_constants(gain_fp)
-            new_gain = True
-        if offset_fp is not None:
-            offset = read_cal_constants(offset_fp)
-            new_offset = True
+            paths[msg['channel'].split(":")[-1]] = msg['data']
 
+        new_gain, gain = self._map(paths.get('gain'), gain)
+        new_offset, offset = self._map(paths.get('offset'), offset)
         return new_gain, gain, new_offset, offset
+
+    @staticmethod
+    def _map(path, c):
+        if path is None:
+            return False, c
+        if not path:
+            return True, None
+        try:
+            return True, read_shared_array(path)
+        except FileNotFoundError:
+            # the notification of the newer one is on the way
+            return False, c
@@ -1,9 +1,15 @@
-from .worker import PulseWorker, TrainWorker
-from .pipe import MpInQueue, MpOutQueue
+from .worker import PulseDispatcher, PulseWorker, TrainWorker
+from .pipe import (
+    MpInMergeQueue, MpInQueue, MpInShmQueue, MpOutDispatchQueue, MpOutQueue
+)
 
 __all__ = [
+    "MpInMergeQueue",
     "MpInQueue",
+    "MpInShmQueue",
+    "MpOutDispatchQueue",
     "MpOutQueue",
+    "PulseDispatcher",
     "PulseWorker",
     "TrainWorker",
 ]
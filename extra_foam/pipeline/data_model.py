@@ -860,6 +860,8 @@ class ProcessedData:
         hist (HistgramData): statistics data.
         correlation (CorrelationData): correlation data.
         bin (BinData): binning data.
+        trace (TrainTrace): trace of the train. None if the train is not
+            traced.
     """
     class PulseData:
         """Container for pulse-resolved data."""
@@ -878,7 +880,8 @@ class ProcessedData:
                  'xgm', 'roi', 'ai', 'pp',
                  'hist', 'corr', 'bin',
                  'trxas',
-                 'pulse']
+                 'pulse',
+                 'trace']
 
     def __init__(self, tid):
         """Initialization."""
@@ -902,6 +905,9 @@ class ProcessedData:
 
         self.pulse = self.PulseData()
 
+        # TrainTrace if the train is traced
+        self.trace = None
+
     @property
     def tid(self):
         return self._tid
@@ -913,3 +919,53 @@ class ProcessedData:
     @property
     def pulse_resolved(self):
         return config['PULSE_RESOLVED']
+
+    def strip(self, fields):
+        """Reset the optional fields which are not requested.
+
+        Optional fields are heavy fields which are only consumed by
+        particular windows in the GUI.
+
+        :param set fields: requested fields, e.g. 'image.images', 'corr[0]'.
+        """
+        for field, reset in _OPTIONAL_FIELDS.items():
+            if field not in fields:
+                reset(self)
+
+
+def _reset_bin_heat(data):
+    data.bin.heat = None
+    data.bin.heat_count = None
+
+
+# field: function which resets the field of a ProcessedData instance
+_OPTIONAL_FIELDS = {
+    'image.images':
+        lambda data: setattr(data.image, 'images', None),
+    'pp.image_on':
+        lambda data: setattr(data.pp, 'image_on', None),
+    'pp.image_off':
+        lambda data: setattr(data.pp, 'image_off', None),
+    'corr[0]':
+        lambda data: data.corr._common.__setitem__(
+            0, CorrelationData.CorrelationDataItem()),
+    'corr[1]':
+        lambda data: data.corr._common.__setitem__(
+            1, CorrelationData.CorrelationDataItem()),
+    'corr.pp':
+        lambda data: setattr(
+            data.corr, '_pp', CorrelationData.CorrelationDataItem()),
+    'bin[0]':
+        lambda data: data.bin._common.__setitem__(0, BinData.BinDataItem()),
+    'bin[1]':
+        lambda data: data.bin._common.__setitem__(1, BinData.BinDataItem()),
+    'bin.heat': _reset_bin_heat,
+    'hist':
+        lambda data: setattr(data, 'hist', HistogramDataTrain()),
+    'pulse.hist':
+        lambda data: setattr(data.pulse, 'hist', HistogramDataPulse()),
+    'pulse.roi.hist':
+        lambda data: setattr(data.pulse.roi, 'hist', HistogramDataPulse()),
+    'trxas':
+        lambda data: setattr(data, 'trxas', XasData()),
+}
@@ -7,9 +7,10 @@ Author: Jun Zhu <jun.zhu@xfel.eu>
 Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
-from collections import deque, OrderedDict
+from collections import deque
 from queue import Empty, Full
-from threading import Lock
+from threading import Condition, Lock
+import time
 
 from .data_model import ProcessedData
 from ..ipc import process_logger as logger
@@ -19,8 +20,8 @@ from ..config import config
 class SimpleQueue:
     """A thread-safe queue for passing data fast between threads.
 
-    It does not provide the functionality of coordination among threads
-    as threading.Queue, but is way more faster.
+    It is simpler than threading.Queue, e.g. it does not support task
+    tracking. get and put do not block by default.
     """
     def __init__(self, maxsize=0):
         """Initialization.
@@ -32,32 +33,61 @@ class SimpleQueue:
         self._queue = deque()
         self._maxsize = maxsize
         self._mutex = Lock()
+        self._not_empty = Condition(self._mutex)
+        self._not_full = Condition(self._mutex)
 
     def get_nowait(self):
         """Pop an item from the queue without blocking."""
         return self.get()
 
-    def get(self):
-        with self._mutex:
-            if len(self._queue) > 0:
-                return self._queue.popleft()
+    def get(self, block=False, timeout=None):
+        """Pop an item from the queue.
+
+        :param bool block: True for waiting until an item is available.
+        :param float timeout: maximum time to wait in seconds. Only used
+            when block is True. None for waiting forever.
+
+        :raises Empty: if no item is available.
+        """
+        with self._not_empty:
+            if block and not self._queue:
+                self._not_empty.wait_for(lambda: self._queue, timeout)
+            if self._queue:
+                item = self._queue.popleft()
+                self._not_full.notify()
+                return item
             raise Empty
 
     def put_nowait(self, item):
         """Put an item into the queue without blocking."""
         self.put(item)
 
-    def put(self, item):
-        with self._mutex:
-            if 0 < self._maxsize <= len(self._queue):
+    def put(self, item, block=False, timeout=None):
+        """Put an item into the queue.
+
+        :param bool block: True for waiting until a free slot is available.
+        :param float timeout: maximum time to wait in seconds. Only used
+            when block is True. None for waiting forever.
+
+        :raises Full: if no free slot is available.
+        """
+        with self._not_full:
+            if block and self._full():
+                self._not_full.wait_for(lambda: not self._full(), timeout)
+            if self._full():
                 raise Full
             self._queue.append(item)
+            self._not_empty.notify()
 
     def put_pop(self, item):
         with self._mutex:
             if 0 < self._maxsize < len(self._queue):
                 self._queue.popleft()
             self._queue.append(item)
+            self._not_empty.notify()
+
+    def _full(self):
+        return 0 < self._maxsize <= len(self._queue)
 
     def qsize(self):
         with self._mutex:
@@ -69,11 +99,29 @@ class SimpleQueue:
 
     def full(self):
         with self._mutex:
-            return 0 < self._maxsize <= len(self._queue)
+            return self._full()
 
     def clear(self):
         with self._mutex:
             self._queue.clear()
+            self._not_full.notify_all()
+
+
+class _TrainSlot:
+    """Data of a train which is being correlated."""
+
+    __slots__ = ['tid', 'mask', 'meta', 'raw', 'trace', 'arrival']
+
+    def __init__(self, tid):
+        self.tid = tid
+        # bit i is set if the i-th source in the catalog has been found
+        self.mask = 0
+        self.meta = dict()
+        self.raw = dict()
+        # TrainTrace if the train is traced
+        self.trace = None
+        # the time when the first data item arrived
+        self.arrival = time.time()
 
 
 class CorrelateQueue(SimpleQueue):
@@ -83,10 +131,21 @@ class CorrelateQueue(SimpleQueue):
     one can pop the data out of the queue only if all required data items
     are correlated.
 
+    Trains being correlated are stored in a fixed-size table indexed by
+    "train ID % capacity". A train is dropped if its slot is taken by a
+    newer train or a newer train has been correlated.
+
+    The numbers of dropped trains and missing sources are summarized in
+    a warning at most every DROP_REPORT_INTERVAL seconds.
+
     It has the same interface as the Python internal threading.Queue
     """
     _cache_size = config["CORRELATION_QUEUE_CACHE_SIZE"]
 
+    # minimum interval between two summaries of the dropped trains
+    # in second
+    DROP_REPORT_INTERVAL = 10.
+
     def __init__(self, catalog, maxsize=0):
         """Initialization.
 
@@ -97,59 +156,173 @@ class CorrelateQueue(SimpleQueue):
 
         self._catalog = catalog
 
-        self._cached = OrderedDict()
+        self._capacity = self._cache_size
+        self._slots = [None] * self._capacity
+
+        # the catalog version which the following are built from
+        self._catalog_version = None
+        # source name: bit in the mask
+        self._bits = dict()
+        # source names in the order of bits
+        self._sources = []
+        self._full_mask = 0
+
+        # source name: number of dropped trains where it was missing
+        self._drop_counts = dict()
+        # number of trains dropped since the latest correlated train
+        self._n_dropped = 0
+        # IDs of the latest dropped trains
+        self._dropped_tids = deque(maxlen=self._capacity)
+        # number of trains dropped and drop counts since the latest
+        # summary, and when it was reported
+        self._report_n_dropped = 0
+        self._report_counts = dict()
+        self._report_ts = time.monotonic()
 
         # keep the latest correlated data and tid
         self._correlated = None
         self._correlated_tid = -1
 
-    def put(self, item, again=False):
+    @property
+    def drop_counts(self):
+        """Number of dropped trains where each source was missing."""
+        return self._drop_counts.copy()
+
+    def _update_source_bits(self):
+        catalog = self._catalog
+        if catalog.version == self._catalog_version:
+            return
+
+        self._sources = list(catalog)
+        self._bits = {src: 1 << i for i, src in enumerate(self._sources)}
+        self._full_mask = (1 << len(self._sources)) - 1
+        self._catalog_version = catalog.version
+
+        # the masks of cached trains are invalid now
+        for slot in self._slots:
+            if slot is not None:
+                slot.mask = self._source_mask(slot.meta)
+
+    def _source_mask(self, meta):
+        bits = self._bits
+        mask = 0
+        for src in meta:
+            mask |= bits.get(src, 0)
+        return mask
+
+    def _drop(self, slot):
+        """Drop a train and record the missing sources."""
+        self._count_drop(slot.tid)
+        missing = self._full_mask & ~slot.mask
+        names = []
+        for i, src in enumerate(self._sources):
+            if missing >> i & 1:
+                self._drop_counts[src] = self._drop_counts.get(src, 0) + 1
+                self._report_counts[src] = self._report_counts.get(src, 0) + 1
+                names.append(src)
+        logger.warning(f"Failed to correlate all the source items for "
+                       f"train {slot.tid}! Missing: {', '.join(names)}")
+
+    def _count_drop(self, tid):
+        self._n_dropped += 1
+        self._report_n_dropped += 1
+        self._dropped_tids.append(tid)
+
+    def _report_drops(self):
+        """Summarize the trains dropped since the latest summary."""
+        now = time.monotonic()
+        if now - self._report_ts < self.DROP_REPORT_INTERVAL:
+            return
+        self._report_ts = now
+
+        if self._report_n_dropped == 0:
+            return
+
+        msg = (f"{self._report_n_dropped} trains were dropped in the last "
+               f"{self.DROP_REPORT_INTERVAL:.0f} s!")
+        if self._report_counts:
+            msg += " Missing: " + ", ".join(
+                f"{src} (x{n})"
+                for src, n in sorted(self._report_counts.items()))
+        logger.warning(msg)
+        self._report_n_dropped = 0
+        self._report_counts.clear()
+
+    def put(self, item, again=False, block=False, timeout=None):
         """Queue interface.
 
         :param dict item: data after being transformed by DataTransformer.
             It should have keys "meta", "raw" and "catalog" according to
-            the protocol.
+            the protocol, and optionally "trace" if the train is traced.
+            The correlated data also has "n_dropped", the number of trains
+            dropped since the previous correlated one.
         :param bool again: whether this item has been tried to put into
             the queue before.
+        :param bool block: True for waiting until a free slot is available
+            if the item has been correlated.
+        :param float timeout: maximum time to wait in seconds.
         """
-        def _found_all(catalog, meta):
-            for k in catalog:
-                if k not in meta:
-                    return False
-            return True
-
         new_meta, new_raw = item['meta'], item['raw']
         if len(new_meta) == 0:
             return
 
-        catalog = self._catalog
+        self._update_source_bits()
 
         tid = next(iter(new_meta.values()))["tid"]
         if tid > self._correlated_tid:
-            # update cached data
-            cached = self._cached.setdefault(
-                tid, {'meta': dict(), 'raw': dict()})
-
-            cached_meta = cached['meta']
-            cached_raw = cached['raw']
-
-            cached_meta.update(new_meta)
-            cached_raw.update(new_raw)
-
-            if _found_all(catalog, cached_meta):
-                self._correlated = {
-                    'catalog': catalog.__copy__(),
-                    'meta': cached_meta,
-                    'raw': cached_raw,
-                    'processed': ProcessedData(tid)
-                }
-                self._correlated_tid = tid
-
-                while True:
-                    # delete old data
-                    key, _ = self._cached.popitem(last=False)
-                    if key == tid:
-                        break
+            idx = tid % self._capacity
+            slot = self._slots[idx]
+            if slot is None or slot.tid < tid:
+                if slot is not None:
+                    # slots only hold trains newer than the correlated one
+                    self._drop(slot)
+                slot = _TrainSlot(tid)
+                self._slots[idx] = slot
+            elif slot.tid > tid and tid not in self._dropped_tids:
+                # the slot has been taken by a newer train
+                self._count_drop(tid)
+                logger.warning(f"Train {tid} is dropped since its slot "
+                               f"has been taken by train {slot.tid}")
+
+            if slot.tid == tid:
+                slot.meta.update(new_meta)
+                slot.raw.update(new_raw)
+                slot.mask |= self._source_mask(new_meta)
+                if slot.trace is None:
+                    slot.trace = item.get('trace')
+
+                if slot.mask == self._full_mask:
+                    self._correlated = {
+                        'catalog': self._catalog.snapshot(),
+                        'meta': slot.meta,
+                        'raw': slot.raw,
+                        'processed': ProcessedData(tid)
+                    }
+                    if slot.trace is not None:
+                        slot.trace.add("Correlation", slot.arrival)
+                        self._correlated['trace'] = slot.trace
+                    prev_tid = self._correlated_tid
+                    self._correlated_tid = tid
+                    self._slots[idx] = None
+
+                    # Older trains can no longer be correlated. Only the
+                    # trains between the previous correlated one and this
+                    # one can be in the slots.
+                    if tid - prev_tid <= self._capacity:
+                        indices = (t % self._capacity
+                                   for t in range(prev_tid + 1, tid))
+                    else:
+                        indices = range(self._capacity)
+                    for i in indices:
+                        s = self._slots[i]
+                        if s is not None and s.tid < tid:
+                            self._drop(s)
+                            self._slots[i] = None
+
+                    self._correlated['n_dropped'] = self._n_dropped
+                    self._n_dropped = 0
+
+                    self._report_drops()
         else:
             if not again:
                 logger.warning(f"Train ID of the new item: {tid} is smaller "
@@ -158,21 +331,20 @@ class CorrelateQueue(SimpleQueue):
 
         if self._correlated is not None:
             # just correlated or the following line raises Full
-            super().put(self._correlated)
+            super().put(self._correlated, block=block, timeout=timeout)
             self._correlated = None
 
-        if len(self._cached) > self._cache_size:
-            k, v = self._cached.popitem(last=False)
-            msg = f"Failed to correlate all the source items for train {k}! "
-            logger.warning(msg + f"{len(v['meta'])} out of "
-                                 f"{len(catalog)} are available.")
-
     def put_nowait(self, item, again=False):
         self.put(item, again=again)
 
     def clear(self):
         """Override."""
-        self._cached.clear()
+        self._slots = [None] * self._capacity
         self._correlated = None
         self._correlated_tid = -1
+        self._n_dropped = 0
+        self._dropped_tids.clear()
+        self._drop_counts.clear()
+        self._report_n_dropped = 0
+        self._report_counts.clear()
         super().clear()
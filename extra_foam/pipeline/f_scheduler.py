@@ -0,0 +1,128 @@
+"""
+Distributed under the terms of the BSD 3-Clause License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Author: Jun Zhu <jun.zhu@xfel.eu>
+Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
+All rights reserved.
+"""
+import math
+
+
+class TaskScheduler:
+    """TaskScheduler class.
+
+    Schedule the tasks of a worker according to their rolling costs and
+    the arrival rate of trains.
+
+    When processing every train fully takes longer than the interval
+    between two trains, only every k-th train is processed fully and the
+    optional tasks are skipped for the others. The other tasks, e.g. the
+    statistics processors, still see every train.
+    """
+    def __init__(self, *, max_stride=10, alpha=0.1):
+        """Initialization.
+
+        :param int max_stride: maximum k.
+        :param float alpha: smoothing factor of the exponential moving
+            averages of the costs and the interval between trains.
+        """
+        self._max_stride = max_stride
+        self._alpha = alpha
+
+        self._optional_tasks = set()
+        # task: rolling cost in second
+        self._costs = dict()
+
+        # rolling interval between two trains in second
+        self._interval = None
+        # train ID and arrival time of the previous train
+        self._prev = None
+
+        self._stride = 1
+        self._full = True
+
+    @property
+    def stride(self):
+        return self._stride
+
+    @property
+    def full(self):
+        """Whether the current train is processed fully."""
+        return self._full
+
+    @property
+    def costs(self):
+        return self._costs.copy()
+
+    def set_optional_tasks(self, tasks):
+        """Set the tasks which can be skipped.
+
+        :param list tasks: a list of processors.
+        """
+        self._optional_tasks = set(tasks)
+
+    def _ema(self, prev, v):
+        if prev is None:
+            return v
+        return prev + self._alpha * (v - prev)
+
+    def record(self, task, cost):
+        """Record the time spent on a task.
+
+        :param _BaseProcessor task: processor.
+        :param float cost: processing time in second.
+        """
+        self._costs[task] = self._ema(self._costs.get(task), cost)
+
+    def arrive(self, tid, timestamp):
+        """Schedule a newly arrived train.
+
+        :param int tid: train ID.
+        :param float timestamp: arrival time in second.
+        """
+        if self._prev is not None:
+            prev_tid, prev_timestamp = self._prev
+            if tid > prev_tid:
+                # Trains which were dropped upstream are taken into
+                # account, so that it is the arrival rate at the source.
+                self._interval = self._ema(
+                    self._interval,
+                    (timestamp - prev_timestamp) / (tid - prev_tid))
+        self._prev = (tid, timestamp)
+
+        self._stride = self._calc_stride()
+        self._full = tid % self._stride == 0
+
+    def _calc_stride(self):
+        if self._interval is None:
+            return 1
+
+        full_cost = sum(self._costs.values())
+        if full_cost <= self._interval:
+            return 1
+
+        cheap_cost = sum(v for k, v in self._costs.items()
+                         if k not in self._optional_tasks)
+        if cheap_cost >= self._interval:
+            return self._max_stride
+
+        # (full_cost + (k - 1) * cheap_cost) / k <= interval
+        stride = math.ceil(
+            (full_cost - cheap_cost) / (self._interval - cheap_cost))
+        return min(stride, self._max_stride)
+
+    def skip(self, task):
+        """Whether to skip a task for the current train.
+
+        :param _BaseProcessor task: processor.
+        """
+        return not self._full and task in self._optional_tasks
+
+    def reset(self):
+        """Reset the arrival history."""
+        self._interval = None
+        self._prev = None
+        self._stride = 1
+        self._full = True
@@ -0,0 +1,225 @@
+"""
+Distributed under the terms of the BSD 3-Clause License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Author: Jun Zhu <jun.zhu@xfel.eu>
+Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
+All rights reserved.
+"""
+from collections import deque
+import multiprocessing as mp
+import multiprocessing.util
+from queue import Empty, Full
+import sys
+from threading import Condition, Thread
+import time
+
+if sys.version_info < (3, 8):
+    # backport of pickle protocol 5
+    import pickle5 as pickle
+else:
+    import pickle
+
+
+# pickle protocol which supports out-of-band buffers
+PROTOCOL = 5
+
+# sentinel which stops the feeder thread
+_STOP = object()
+
+
+def serialize(obj, buffer_callback=None):
+    """Pickle an object with its buffers out-of-band.
+
+    Numpy arrays (and any other object which supports pickle protocol 5)
+    are not copied into the pickled skeleton.
+
+    :param obj: object to be serialized.
+    :param callable buffer_callback: called with each PickleBuffer. If it
+        returns True, the buffer will be serialized in-band. If None, all
+        the buffers are collected and returned.
+
+    :return tuple: (skeleton, a list of PickleBuffer).
+    """
+    buffers = []
+    if buffer_callback is None:
+        skeleton = pickle.dumps(
+            obj, protocol=PROTOCOL, buffer_callback=buffers.append)
+    else:
+        skeleton = pickle.dumps(
+            obj, protocol=PROTOCOL, buffer_callback=buffer_callback)
+    return skeleton, buffers
+
+
+def deserialize(skeleton, buffers=()):
+    """Restore an object from its skeleton and out-of-band buffers.
+
+    :param bytes skeleton: pickled skeleton.
+    :param iterable buffers: buffers in the same order as they were
+        returned by serialize. Numpy arrays will be created on top of
+        them without copying.
+    """
+    return pickle.loads(skeleton, buffers=buffers)
+
+
+class OutOfBandQueue:
+    """OutOfBandQueue class.
+
+    A multi-processing queue which sends the pickled skeleton and each
+    out-of-band buffer of an object as separate frames through a pipe.
+
+    Buffers are written to the pipe directly from the memory of the
+    objects being sent and are received into pre-allocated bytearrays
+    which are used by the restored objects. Thus, each buffer is copied
+    only once from one process to another.
+
+    It implements the subset of the multiprocessing.Queue interface used
+    by the pipes. It must be instantiated before the processes which
+    share it are started.
+    """
+    def __init__(self, maxsize=0):
+        """Initialization.
+
+        :param int maxsize: max number of items allowed in the queue. If
+            it is less than or equal to zero, the size is infinite.
+        """
+        self._reader, self._writer = mp.Pipe(duplex=False)
+        self._rlock = mp.Lock()
+        self._wlock = mp.Lock()
+        # number of free places in the queue
+        self._n_free = mp.BoundedSemaphore(maxsize) if maxsize > 0 else None
+
+        self._reset_feeder()
+        mp.util.register_after_fork(self, OutOfBandQueue._reset_feeder)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_buffer', '_not_empty', '_feeder', '_join_feeder'):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_feeder()
+
+    def _reset_feeder(self):
+        # (skeleton, buffers) waiting to be sent by the feeder thread
+        self._buffer = deque()
+        self._not_empty = Condition()
+        self._feeder = None
+        self._join_feeder = None
+
+    def _start_feeder(self):
+        self._feeder = Thread(target=self._feed, daemon=True)
+        self._feeder.start()
+
+        # send all the buffered items before the process exits, like
+        # multiprocessing.Queue
+        self._join_feeder = mp.util.Finalize(
+            None, OutOfBandQueue._finalize_feeder,
+            args=(self._buffer, self._not_empty, self._feeder),
+            exitpriority=-5)
+
+    @staticmethod
+    def _finalize_feeder(buffer, not_empty, feeder):
+        with not_empty:
+            buffer.append(_STOP)
+            not_empty.notify()
+        feeder.join()
+
+    def _feed(self):
+        while True:
+            with self._not_empty:
+                while not self._buffer:
+                    self._not_empty.wait()
+                item = self._buffer.popleft()
+
+            if item is _STOP:
+                break
+            skeleton, buffers = item
+
+            with self._wlock:
+                self._writer.send_bytes(pickle.dumps(
+                    (skeleton, [b.raw().nbytes for b in buffers]),
+                    protocol=PROTOCOL))
+                for buf in buffers:
+                    self._writer.send_bytes(buf.raw())
+
+    def put(self, item, block=True, timeout=None):
+        """Put an item into the queue.
+
+        The item is sent by a feeder thread, like multiprocessing.Queue.
+
+        :raises Full: if the queue is full.
+        """
+        if self._n_free is not None \
+                and not self._n_free.acquire(block, timeout):
+            raise Full
+
+        try:
+            item = serialize(item)
+        except BaseException:
+            if self._n_free is not None:
+                self._n_free.release()
+            raise
+
+        with self._not_empty:
+            if self._feeder is None:
+                self._start_feeder()
+            self._buffer.append(item)
+            self._not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        """Remove and return an item from the queue.
+
+        :raises Empty: if no item is available.
+        """
+        if not block:
+            timeout = 0.
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        if not self._rlock.acquire(True, timeout):
+            raise Empty
+
+        try:
+            if deadline is not None:
+                if not self._reader.poll(
+                        max(0., deadline - time.monotonic())):
+                    raise Empty
+
+            skeleton, sizes = pickle.loads(self._reader.recv_bytes())
+            buffers = []
+            for n_bytes in sizes:
+                buf = bytearray(n_bytes)
+                if n_bytes > 0:
+                    self._reader.recv_bytes_into(buf)
+                else:
+                    self._reader.recv_bytes()
+                buffers.append(buf)
+        finally:
+            self._rlock.release()
+
+        if self._n_free is not None:
+            self._n_free.release()
+
+        return deserialize(skeleton, buffers)
+
+    def get_nowait(self):
+        """Remove and return an item from the queue without blocking.
+
+        :raises Empty: if no item is available.
+        """
+        return self.get(False)
+
+    def put_nowait(self, item):
+        """Put an item into the queue without blocking.
+
+        :raises Full: if the queue is full.
+        """
+        self.put(item, False)
+
+    def cancel_join_thread(self):
+        """Do not wait for the buffered items to be sent on exit."""
+        if self._join_feeder is not None:
+            self._join_feeder.cancel()
@@ -0,0 +1,170 @@
+"""
+Distributed under the terms of the BSD 3-Clause License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Author: Jun Zhu <jun.zhu@xfel.eu>
+Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
+All rights reserved.
+"""
+import ctypes
+import multiprocessing as mp
+from queue import Full
+
+import numpy as np
+
+from .f_serialization import deserialize, serialize
+
+
+# start address of each buffer in a slot is aligned to a cache line
+_ALIGNMENT = 64
+
+
+class SharedMemoryRing:
+    """SharedMemoryRing class.
+
+    A fixed number of fixed-size shared-memory slots for passing data
+    between processes. Large out-of-band buffers (pickle protocol 5) of
+    the object, e.g. those of numpy arrays, are copied into a free slot
+    directly while the rest of the object is pickled. Only the pickled
+    skeleton, the index of the slot and the locations of the buffers go
+    through a multi-processing queue.
+
+    It implements the subset of the multiprocessing.Queue interface used
+    by the pipes. It must be instantiated before the processes which
+    share it are started.
+    """
+
+    _FREE = 0
+    _BUSY = 1
+
+    def __init__(self, n_slots, slot_size, *, min_array_size=65536):
+        """Initialization.
+
+        :param int n_slots: number of slots.
+        :param int slot_size: size of each slot in bytes.
+        :param int min_array_size: buffers smaller than this (in bytes)
+            will be pickled in-band.
+        """
+        if n_slots < 1:
+            raise ValueError("Number of slots must be positive!")
+
+        self._slot_size = slot_size
+        self._min_array_size = min_array_size
+
+        self._slots = [mp.RawArray(ctypes.c_uint8, slot_size)
+                       for _ in range(n_slots)]
+        self._states = mp.RawArray(ctypes.c_int8, n_slots)
+        self._lock = mp.Lock()
+        # number of free slots
+        self._n_free = mp.Semaphore(n_slots)
+
+        # (slot index, pickled skeleton, [(offset, size) of buffers])
+        self._descriptors = mp.Queue(maxsize=n_slots)
+
+        # numpy views of the slots, created lazily in each process
+        self._buffers = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_buffers'] = None
+        return state
+
+    @property
+    def n_slots(self):
+        return len(self._slots)
+
+    @property
+    def slot_size(self):
+        return self._slot_size
+
+    def _buffer(self, idx):
+        if self._buffers is None:
+            self._buffers = [np.frombuffer(s, dtype=np.uint8)
+                             for s in self._slots]
+        return self._buffers[idx]
+
+    def _acquire(self, block, timeout):
+        if not self._n_free.acquire(block, timeout):
+            return None
+
+        with self._lock:
+            for i, state in enumerate(self._states):
+                if state == self._FREE:
+                    self._states[i] = self._BUSY
+                    return i
+
+    def _release(self, idx):
+        with self._lock:
+            self._states[idx] = self._FREE
+        self._n_free.release()
+
+    def put(self, item, block=True, timeout=None):
+        """Put an item into the ring.
+
+        :raises Full: if no free slot is available.
+        """
+        idx = self._acquire(block, timeout)
+        if idx is None:
+            raise Full
+
+        buffer = self._buffer(idx)
+        locations = []
+
+        def _to_slot(buf):
+            n_bytes = buf.raw().nbytes
+            if n_bytes < self._min_array_size:
+                return True
+
+            start = 0
+            if locations:
+                end = locations[-1][0] + locations[-1][1]
+                start = -(-end // _ALIGNMENT) * _ALIGNMENT
+            if start + n_bytes > len(buffer):
+                # fall back to in-band pickling if the slot is full
+                return True
+
+            buffer[start:start + n_bytes] = np.frombuffer(
+                buf.raw(), dtype=np.uint8)
+            locations.append((start, n_bytes))
+            return False
+
+        try:
+            skeleton, _ = serialize(item, buffer_callback=_to_slot)
+            self._descriptors.put_nowait((idx, skeleton, locations))
+        except BaseException:
+            self._release(idx)
+            raise
+
+    def get(self, block=True, timeout=None):
+        """Remove and return an item from the ring.
+
+        :raises Empty: if no item is available.
+        """
+        idx, skeleton, locations = self._descriptors.get(block, timeout)
+        buffer = self._buffer(idx)
+        try:
+            # The slot will be reused by the producer once it is released,
+            # so the data must be copied out.
+            buffers = [bytearray(buffer[start:start + n_bytes])
+                       for start, n_bytes in locations]
+        finally:
+            self._release(idx)
+        return deserialize(skeleton, buffers)
+
+    def get_nowait(self):
+        """Remove and return an item from the ring without blocking.
+
+        :raises Empty: if no item is available.
+        """
+        return self.get(False)
+
+    def put_nowait(self, item):
+        """Put an item into the ring without blocking.
+
+        :raises Full: if no free slot is available.
+        """
+        self.put(item, False)
+
+    def cancel_join_thread(self):
+        self._descriptors.cancel_join_thread()
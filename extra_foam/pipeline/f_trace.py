@@ -0,0 +1,91 @@
+"""
+Distributed under the terms of the BSD 3-Clause License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Author: Jun Zhu <jun.zhu@xfel.eu>
+Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
+All rights reserved.
+"""
+from contextlib import contextmanager
+import time
+
+from ..config import config
+
+
+class TrainTrace:
+    """TrainTrace class.
+
+    Record the time spent on each stage of a train in the pipeline. The
+    trace is passed along with the train from the bridge client to the
+    GUI. Wall-clock timestamps are used so that the spans recorded in
+    different processes are comparable.
+    """
+
+    __slots__ = ['_tid', '_spans']
+
+    def __init__(self, tid):
+        """Initialization.
+
+        :param int tid: train ID.
+        """
+        self._tid = tid
+        # [(stage, start, end)]
+        self._spans = []
+
+    @classmethod
+    def sampled(cls, tid):
+        """Return a new trace if the train is sampled; otherwise, None.
+
+        :param int tid: train ID.
+        """
+        sampling = config["PIPELINE_TRACE_SAMPLING"]
+        if sampling > 0 and tid % sampling == 0:
+            return cls(tid)
+        return None
+
+    @property
+    def tid(self):
+        return self._tid
+
+    @property
+    def spans(self):
+        return self._spans
+
+    def add(self, stage, start, end=None):
+        """Add a span.
+
+        :param str stage: name of the stage.
+        :param float start: start time of the stage.
+        :param float end: end time of the stage. If None, the current time
+            is used.
+        """
+        if end is None:
+            end = time.time()
+        self._spans.append((stage, start, end))
+
+    @contextmanager
+    def span(self, stage):
+        """Record the span of the enclosed code block.
+
+        :param str stage: name of the stage.
+        """
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.add(stage, t0)
+
+    def durations(self):
+        """Return the time (in second) spent on each stage.
+
+        :return dict: {stage: duration}.
+        """
+        ret = dict()
+        for stage, start, end in self._spans:
+            ret[stage] = ret.get(stage, 0.) + end - start
+        return ret
+
+    def to_dict(self):
+        return {'tid': self._tid, 'spans': [list(s) for s in self._spans]}
+
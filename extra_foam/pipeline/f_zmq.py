@@ -8,11 +8,12 @@ Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
 from collections import deque
-from threading import Event
+from threading import Condition, Event
+import time
 
 import zmq
 
-from karabo_bridge import Client
+from karabo_bridge import deserialize
 
 from ..config import config
 from ..utils import run_in_thread
@@ -21,30 +22,37 @@ from ..utils import run_in_thread
 class BridgeProxy:
     """A proxy bridge which can connect to more than one server.
 
-    The current implementation has the following limits:
-    1. All the connections must be alive;
-    2. It is blocked, which means if one connection is fast and the other
-       is slow, the overall performance is limited by the slow one.
+    It keeps an outstanding request to every server and buffers the data
+    from each of them in a small prefetch queue. Therefore, a slow or
+    stalled server does not block the data flow from the others. If the
+    prefetch queue of a server is full, the oldest data will be dropped.
     """
 
     POLL_TIMEOUT = 100  # timeout of the poller in milliseconds
+    # re-send the request to a server if it has not replied for this long,
+    # in seconds
+    RECONNECT_TIMEOUT = 10.
 
     def __init__(self):
 
         self._context = None
 
-        self._client = None
-        self._frontend = None
+        self._endpoints = []
         self._backend = dict()
-        self._backend_ready = deque()
+
+        # endpoint: queue of prefetched data
+        self._prefetched = dict()
+        # endpoints in the order of being read by the consumer
+        self._turns = deque()
+        self._cv = Condition()
 
         self._running = False
         self._stopped = Event()
         self._stopped.set()
 
     @property
-    def client(self):
-        return self._client
+    def connected(self):
+        return self._context is not None
 
     def connect(self, endpoints):
         """Connect the backend to one or more endpoints.
@@ -57,22 +65,23 @@ class BridgeProxy:
             raise ValueError("Endpoints must be either a string or "
                              "a tuple/list of string!")
 
-        context = zmq.Context()
-
-        for end in endpoints:
-            backend = context.socket(zmq.DEALER)
-            backend.connect(end)
-            self._backend[end] = backend
-
-        frontendpoint = "inproc://frontend"
-        self._frontend = context.socket(zmq.ROUTER)
-        self._frontend.bind(frontendpoint)
+        self._endpoints = list(endpoints)
+        prefetch = config['BRIDGE_PREFETCH']
+        with self._cv:
+            self._prefetched = {end: deque(maxlen=prefetch)
+                                for end in endpoints}
+            self._turns = deque(endpoints)
 
-        self._client = Client(frontendpoint,
-                              context=context,
-                              timeout=config['BRIDGE_TIMEOUT'])
+        self._context = zmq.Context()
 
-        self._context = context
+    def _connect_backend(self, end):
+        backend = self._context.socket(zmq.DEALER)
+        backend.setsockopt(zmq.LINGER, 0)
+        backend.connect(end)
+        # REP socket on the server side expects an empty delimiter frame
+        backend.send_multipart([b'', b'next'])
+        self._backend[end] = backend
+        return backend
 
     @run_in_thread()
     def start(self):
@@ -80,49 +89,81 @@ class BridgeProxy:
         if self._running:
             raise RuntimeError(f"{self.__class__} is already running!")
 
-        frontend = self._frontend
-
         poller = zmq.Poller()
-        poller.register(frontend, zmq.POLLIN)
-        for address, bk in self._backend.items():
-            poller.register(bk, zmq.POLLIN)
-            self._backend_ready.append(address)
+        # time of the latest request sent to each server
+        requested = dict()
+        for end in self._endpoints:
+            poller.register(self._connect_backend(end), zmq.POLLIN)
+            requested[end] = time.monotonic()
 
         self._stopped.clear()
         self._running = True
         while self._running:
             socks = dict(poller.poll(timeout=self.POLL_TIMEOUT))
 
-            if socks.get(frontend) == zmq.POLLIN:
-                message = frontend.recv_multipart()
-                if len(self._backend_ready) > 0:
-                    address = self._backend_ready.popleft()
-                    self._backend[address].send_multipart(message)
-
-            for address, bk in self._backend.items():
+            for end, bk in list(self._backend.items()):
                 if socks.get(bk) == zmq.POLLIN:
-                    message = bk.recv_multipart()
-                    frontend.send_multipart(message)
-                    self._backend_ready.append(address)
+                    msg = bk.recv_multipart(copy=False)
+                    # ask for the next one before decoding the current one
+                    bk.send_multipart([b'', b'next'])
+                    requested[end] = time.monotonic()
+
+                    with self._cv:
+                        self._prefetched[end].append(deserialize(msg[1:]))
+                        self._cv.notify()
+
+                elif time.monotonic() - requested[end] > \
+                        self.RECONNECT_TIMEOUT:
+                    # The reply may never come, e.g. the server was
+                    # restarted. Reset the socket and request again.
+                    poller.unregister(bk)
+                    bk.close()
+                    poller.register(self._connect_backend(end), zmq.POLLIN)
+                    requested[end] = time.monotonic()
 
         # clean up and close all sockets to avoid problems with buffer
 
-        poller.unregister(frontend)
         for bk in self._backend.values():
             poller.unregister(bk)
-
-        for bk in self._backend.values():
-            bk.setsockopt(zmq.LINGER, 0)
+            bk.close()
         self._backend.clear()
-        self._backend_ready.clear()
-        self._frontend.setsockopt(zmq.LINGER, 0)
-        self._frontend = None
-        self._client = None
+        with self._cv:
+            for queue in self._prefetched.values():
+                queue.clear()
         self._context.destroy(linger=0)
         self._context = None
 
         self._stopped.set()
 
+    def next(self, timeout=None, *, with_endpoint=False):
+        """Return the next available data.
+
+        The servers with data available are read in turn.
+
+        :param float timeout: maximum time to wait in seconds. None for
+            waiting forever.
+        :param bool with_endpoint: True for returning (endpoint, data).
+
+        :raises TimeoutError: if no data is available before timeout.
+        """
+        def _pop():
+            turns = self._turns
+            for _ in range(len(turns)):
+                end = turns[0]
+                turns.rotate(-1)
+                queue = self._prefetched[end]
+                if queue:
+                    return end, queue.popleft()
+            return None, None
+
+        with self._cv:
+            if self._cv.wait_for(
+                    lambda: any(self._prefetched.values()), timeout):
+                end, data = _pop()
+                return (end, data) if with_endpoint else data
+
+        raise TimeoutError(f"No data received in the last {timeout} s")
+
     def stop(self):
         """Stop the proxy running in a thread."""
         self._running = False
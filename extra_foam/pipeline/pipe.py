@@ -8,14 +8,16 @@ Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
 from abc import ABC, abstractmethod
-import multiprocessing as mp
 from queue import Empty, Full
 import time
 
 from .f_zmq import BridgeProxy
 from .f_queue import CorrelateQueue, SimpleQueue
+from .f_serialization import OutOfBandQueue
+from .f_shm import SharedMemoryRing
+from .f_trace import TrainTrace
 from .processors.base_processor import _RedisParserMixin
-from ..config import config, DataSource
+from ..config import config, DataSource, PumpProbeMode
 from ..utils import profiler, run_in_thread
 from ..ipc import RedisSubscriber
 from ..ipc import process_logger as logger
@@ -34,6 +36,8 @@ class _PipeBase(ABC):
     this Queue.
     """
     _pipeline_dtype = ('catalog', 'meta', 'raw', 'processed')
+    # keys which are passed along only if they are present
+    _pipeline_optional_dtype = ('trace', 'n_dropped')
 
     def __init__(self, update_ev, pause_ev, close_ev, *, final=False):
         """Initialization.
@@ -49,6 +53,9 @@ class _PipeBase(ABC):
 
         self._cache = SimpleQueue(maxsize=1)
 
+        # maximum time to block in the loop of the running thread
+        self._timeout = config["PIPELINE_WAIT_TIMEOUT"]
+
         self._meta = MetaProxy()
         self._mon = MonProxy()
 
@@ -93,8 +100,8 @@ class _PipeInBase(_PipeBase):
         """Connect to specified output pipe."""
         pass
 
-    def get(self):
-        return self._cache.get_nowait()
+    def get(self, block=False, timeout=None):
+        return self._cache.get(block=block, timeout=timeout)
 
 
 class _PipeOutBase(_PipeBase):
@@ -104,8 +111,8 @@ class _PipeOutBase(_PipeBase):
         """Accept a connection."""
         pass
 
-    def put(self, item):
-        self._cache.put_nowait(item)
+    def put(self, item, block=False, timeout=None):
+        self._cache.put(item, block=block, timeout=timeout)
 
     def put_pop(self, item):
         self._cache.put_pop(item)
@@ -124,6 +131,13 @@ class KaraboBridge(_PipeInBase, _RedisParserMixin):
         # override SimpleQueue
         self._cache = CorrelateQueue(self._catalog, maxsize=1)
 
+        # endpoint: {source name: train ID} of its latest data
+        self._endpoint_sources = dict()
+        # names of the last published available sources and when they
+        # were published or refreshed
+        self._avail_sources = None
+        self._avail_sources_ts = 0.
+
     def _update_source_items(self):
         """Updated requested source items."""
         sub = self._sub
@@ -185,52 +199,96 @@ class KaraboBridge(_PipeInBase, _RedisParserMixin):
                 client, src_type = self._update_connection(proxy)
 
                 data_in = None
+                self._endpoint_sources.clear()
+                self._avail_sources = None
                 self.clear()
                 self.finish_updating()
 
             # this cannot be in a thread since SourceCatalog is not thread-safe
             self._update_source_items()
 
-            if self.running and proxy.client is not None:
-                if not self._catalog.main_detector:
-                    # skip the pipeline if the main detector is not specified
-                    logger.error(f"{config['DETECTOR']} source unspecified!")
-                    time.sleep(1)  # sleep a little long
-                    continue
+            if not self.running:
+                self._pause_ev.wait(self._timeout)
+                continue
 
-                if data_in is None:
-                    try:
-                        # always pull the latest data from the bridge
-                        raw, meta = self._recv_imp(proxy.client)
+            if not proxy.connected:
+                self._update_ev.wait(self._timeout)
+                continue
 
-                        self._update_available_sources(meta)
+            if not self._catalog.main_detector:
+                # skip the pipeline if the main detector is not specified
+                logger.error(f"{config['DETECTOR']} source unspecified!")
+                time.sleep(1)  # sleep a little long
+                continue
 
-                        # extract new raw and meta
-                        new_raw, new_meta, _ = DataTransformer.transform_euxfel(
-                            raw, meta, catalog=self._catalog, source_type=src_type)
+            if data_in is None:
+                try:
+                    # always pull the latest data from the bridge
+                    endpoint, (raw, meta) = self._recv_imp(proxy)
+                    t0 = time.time()
+
+                    self._update_available_sources(endpoint, meta)
+
+                    # extract new raw and meta
+                    new_raw, new_meta, _ = DataTransformer.transform_euxfel(
+                        raw, meta, catalog=self._catalog, source_type=src_type)
+
+                    data_in = {"meta": new_meta, "raw": new_raw}
+                    if new_meta:
+                        trace = TrainTrace.sampled(
+                            next(iter(new_meta.values()))["tid"])
+                        if trace is not None:
+                            trace.add("Bridge", t0)
+                            data_in["trace"] = trace
+                    again = False
+                except TimeoutError:
+                    pass
 
-                        data_in = {"meta": new_meta, "raw": new_raw}
-                        again = False
-                    except TimeoutError:
-                        pass
+            if data_in is not None:
+                try:
+                    self._cache.put(data_in, again=again,
+                                    block=True, timeout=self._timeout)
+                    data_in = None
+                    again = False
+                except Full:
+                    again = True
 
-                if data_in is not None:
-                    try:
-                        self._cache.put(data_in, again=again)
-                        data_in = None
-                        again = False
-                    except Full:
-                        again = True
+    def _update_available_sources(self, endpoint, meta):
+        """Publish the available sources.
 
-            time.sleep(0.001)
+        The available sources are the union of the sources in the latest
+        data from each endpoint. They are only published when they change.
+        Otherwise, the expiration time of the published ones is extended
+        at the interval at which the GUI updates them. The train IDs are
+        therefore those at the time when the sources were published.
 
-    def _update_available_sources(self, meta):
-        sources = {k: v["timestamp.tid"] for k, v in meta.items()}
-        self._mon.set_available_sources(sources)
+        :param str endpoint: endpoint which sent the data.
+        :param dict meta: meta data.
+        """
+        now = time.monotonic()
+        self._endpoint_sources[endpoint] = {
+            k: v["timestamp.tid"] for k, v in meta.items()}
+        sources = dict()
+        for v in self._endpoint_sources.values():
+            sources.update(v)
+        names = frozenset(sources)
+        if names == self._avail_sources:
+            if now - self._avail_sources_ts < \
+                    0.001 * config['SOURCE_AVAIL_UPDATE_TIMER']:
+                return
+            if self._mon.refresh_available_sources():
+                self._avail_sources_ts = now
+                return
+            # the key has expired or the connection failed
+
+        if self._mon.set_available_sources(sources) is not None:
+            self._avail_sources = names
+            self._avail_sources_ts = now
 
     @profiler("Receive Data from Bridge")
-    def _recv_imp(self, client):
-        return client.next()
+    def _recv_imp(self, proxy):
+        return proxy.next(timeout=config['BRIDGE_TIMEOUT'],
+                          with_endpoint=True)
 
     def connect(self, pipe_out):
         """Override."""
@@ -238,11 +296,18 @@ class KaraboBridge(_PipeInBase, _RedisParserMixin):
 
 
 class MpInQueue(_PipeInBase):
-    """A pipe which uses a multi-processing queue to receive data."""
+    """A pipe which uses a multi-processing queue to receive data.
+
+    Numpy arrays are sent out-of-band as separate frames.
+    """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self._client = mp.Queue(maxsize=config["PIPELINE_MAX_QUEUE_SIZE"])
+        self._client = self._create_client()
+
+    def _create_client(self):
+        """Create the client which receives data from the other process."""
+        return OutOfBandQueue(maxsize=config["PIPELINE_MAX_QUEUE_SIZE"])
 
     @run_in_thread(daemon=True)
     def run(self):
@@ -256,18 +321,15 @@ class MpInQueue(_PipeInBase):
 
             if data_in is None:
                 try:
-                    data_in = self._client.get_nowait()
+                    data_in = self._client.get(timeout=self._timeout)
                 except Empty:
-                    pass
-
-            if data_in is not None:
-                try:
-                    self._cache.put_nowait(data_in)
-                    data_in = None
-                except Full:
-                    pass
+                    continue
 
-            time.sleep(0.001)
+            try:
+                self._cache.put(data_in, block=True, timeout=self._timeout)
+                data_in = None
+            except Full:
+                pass
 
         self._client.cancel_join_thread()
 
@@ -280,6 +342,23 @@ class MpInQueue(_PipeInBase):
                                       f"(input) to {type(pipe_out)} (output)")
 
 
+class MpInShmQueue(MpInQueue):
+    """A pipe which uses a shared-memory ring to receive data.
+
+    Large arrays are passed through shared-memory slots and only a small
+    descriptor goes through a multi-processing queue. It can be connected
+    to a MpOutQueue like MpInQueue.
+    """
+    def _create_client(self):
+        """Override."""
+        # Each slot is released as soon as its data has been copied out
+        # by the receiver. One more slot is needed for the data being
+        # written by the sender.
+        return SharedMemoryRing(
+            config["PIPELINE_MAX_QUEUE_SIZE"] + 1,
+            int(config["PIPELINE_SHM_SLOT_SIZE"] * 1024 ** 2))
+
+
 class MpOutQueue(_PipeOutBase):
     """A pipe which uses a multi-processing queue to dispatch data."""
     def __init__(self, *args, **kwargs):
@@ -299,31 +378,215 @@ class MpOutQueue(_PipeOutBase):
 
             if data_out is None:
                 try:
-                    data = self._cache.get_nowait()
+                    data = self._cache.get(block=True, timeout=self._timeout)
 
                     if self._final:
                         data_out = data['processed']
 
+                        # do not send heavy fields which are not
+                        # consumed by any opened window
+                        fields = self._meta.get_subscribed_fields()
+                        if fields is not None:
+                            data_out.strip(fields)
+
+                        trace = data.get('trace')
+                        data_out.trace = trace
+
                         tid = data_out.tid
-                        self._mon.add_tid_with_timestamp(tid)
+                        self._mon.add_tid_with_timestamp(
+                            tid,
+                            None if trace is None else trace.durations(),
+                            data.get('n_dropped', 0))
                         logger.info(f"Train {tid} processed!")
                     else:
                         data_out = {key: data[key] for key
                                     in self._pipeline_dtype}
+                        for key in self._pipeline_optional_dtype:
+                            if key in data:
+                                data_out[key] = data[key]
+                        if 'worker' in data:
+                            # index of the pulse worker which owns the data
+                            data_out['worker'] = data['worker']
                 except Empty:
-                    pass
+                    if self._final:
+                        # e.g. the pipeline has been paused or stopped
+                        self._mon.flush_performance_records()
+                    continue
+
+            try:
+                self._client.put(data_out, timeout=self._timeout)
+                data_out = None
+            except Full:
+                pass
+
+        self._client.cancel_join_thread()
+
+    def accept(self, connection):
+        """Override."""
+        self._client = connection
+
+
+class MpOutDispatchQueue(MpOutQueue):
+    """A pipe which dispatches data to more than one pulse worker.
+
+    Each train is sent to one of the workers in turn. The two trains in a
+    pump-probe pair are sent to the same worker. While recording dark,
+    each train is sent to all the workers to keep their darks the same
+    but only its owner forwards the processed data.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._clients = []
+
+    def _dispatch(self, tid):
+        """Return the owner of a train and whether to broadcast it.
 
-            if data_out is not None:
+        :param int tid: train ID.
+        """
+        mode = self._meta.hget(mt.PUMP_PROBE_PROC, 'mode')
+        mode = PumpProbeMode.UNDEFINED if mode is None \
+            else PumpProbeMode(int(mode))
+        if mode == PumpProbeMode.EVEN_TRAIN_ON:
+            key = tid // 2
+        elif mode == PumpProbeMode.ODD_TRAIN_ON:
+            key = (tid - 1) // 2
+        else:
+            key = tid
+
+        broadcast = self._meta.hget(
+            mt.IMAGE_PROC, 'recording dark') == 'True'
+        return key % len(self._clients), broadcast
+
+    @run_in_thread(daemon=True)
+    def run(self):
+        """Override."""
+        # client index: data to be sent
+        pending = dict()
+        while not self.closing:
+            if self.updating:
+                pending.clear()
+                self.clear()
+                self.finish_updating()
+
+            if not pending:
                 try:
-                    self._client.put_nowait(data_out)
-                    data_out = None
+                    data = self._cache.get(block=True, timeout=self._timeout)
+                except Empty:
+                    continue
+
+                owner, broadcast = self._dispatch(data['processed'].tid)
+                data_out = {key: data[key] for key in self._pipeline_dtype}
+                for key in self._pipeline_optional_dtype:
+                    if key in data:
+                        data_out[key] = data[key]
+                data_out['worker'] = owner
+                if broadcast:
+                    pending = {i: data_out for i in range(len(self._clients))}
+                else:
+                    pending = {owner: data_out}
+
+            for i in list(pending):
+                try:
+                    self._clients[i].put(pending[i], timeout=self._timeout)
+                    del pending[i]
                 except Full:
                     pass
 
-            time.sleep(0.001)
+        for client in self._clients:
+            client.cancel_join_thread()
+
+    def accept(self, connection):
+        """Override."""
+        self._clients.append(connection)
+
+
+class MpInMergeQueue(_PipeInBase):
+    """A pipe which receives data from more than one pulse worker.
+
+    The data are released in the order of train ID. A train is held until
+    all the workers have sent a train with a larger or the same train ID,
+    or until it has been held for longer than PIPELINE_MERGE_TIMEOUT.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._n_workers = config["PIPELINE_N_PULSE_WORKERS"]
+        self._merge_timeout = config["PIPELINE_MERGE_TIMEOUT"]
+
+        # the client is shared by all the workers
+        self._client = self._create_client()
+
+    def _create_client(self):
+        """Create the client which receives data from all the workers."""
+        max_size = config["PIPELINE_MAX_QUEUE_SIZE"]
+        if config["PIPELINE_SHM_ENABLED"]:
+            return SharedMemoryRing(
+                self._n_workers * (max_size + 1),
+                int(config["PIPELINE_SHM_SLOT_SIZE"] * 1024 ** 2))
+        return OutOfBandQueue(maxsize=self._n_workers * max_size)
+
+    @run_in_thread(daemon=True)
+    def run(self):
+        """Override."""
+        # the latest train ID received from each worker
+        latest_tids = [-1] * self._n_workers
+        # train ID: (data, time of arrival)
+        pending = dict()
+        released_tid = -1
+        # number of trains dropped since the latest released train
+        n_dropped = 0
+        while not self.closing:
+            if self.updating:
+                latest_tids = [-1] * self._n_workers
+                pending.clear()
+                released_tid = -1
+                n_dropped = 0
+                self.clear()
+                self.finish_updating()
+
+            timeout = self._timeout
+            if pending:
+                deadline = pending[min(pending)][1] + self._merge_timeout
+                timeout = max(0., min(timeout, deadline - time.monotonic()))
+
+            try:
+                data = self._client.get(timeout=timeout)
+                tid = data['processed'].tid
+                latest_tids[data.pop('worker')] = tid
+                if tid > released_tid:
+                    pending[tid] = (data, time.monotonic())
+                else:
+                    n_dropped += 1
+                    logger.warning(f"Train {tid} is dropped since train "
+                                   f"{released_tid} has been released")
+            except Empty:
+                pass
+
+            while pending:
+                tid = min(pending)
+                data, arrival = pending[tid]
+                if min(latest_tids) < tid and \
+                        time.monotonic() - arrival < self._merge_timeout:
+                    break
+
+                if n_dropped:
+                    data['n_dropped'] = data.get('n_dropped', 0) + n_dropped
+                    n_dropped = 0
+
+                try:
+                    self._cache.put(data, block=True, timeout=self._timeout)
+                    del pending[tid]
+                    released_tid = tid
+                except Full:
+                    break
 
         self._client.cancel_join_thread()
 
-    def accept(self, connection):
+    def connect(self, pipe_out):
         """Override."""
-        self._client = connection
+        if isinstance(pipe_out, MpOutQueue):
+            pipe_out.accept(self._client)
+        else:
+            raise NotImplementedError(f"Cannot connect {self.__class__} "
+                                      f"(input) to {type(pipe_out)} (output)")
@@ -10,7 +10,7 @@ from .binning import BinningProcessor
 from .correlation import CorrelationProcessor
 from .image_processor import ImageProcessor
 from .image_roi import ImageRoiPulse, ImageRoiTrain
-from .image_assembler import ImageAssemblerFactory
+from .image_assembler import ImageAssemblerFactory, assemble_deferred
 from .control_data import CtrlDataProcessor
 from .pump_probe import PumpProbeProcessor
 from .xgm import XgmProcessor
@@ -24,6 +24,9 @@ from ...utils import profiler
 
 _IMAGE_DTYPE = config['SOURCE_PROC_IMAGE_DTYPE']
 _RAW_IMAGE_DTYPE = config['SOURCE_RAW_IMAGE_DTYPE']
+# dtypes of the modules data which can be positioned by the EXtra-foam
+# geometry
+_DEFERRED_DTYPES = (np.float32, np.uint16, np.int16)
 
 
 import re
@@ -211,6 +214,66 @@ class StackView:
         return self[tuple(slices)]
 
 
+class _DeferredAssembly:
+    """Modules data to be positioned with an EXtra-foam geometry.
+
+    The positioning is deferred to the ImageProcessor so that the gain
+    and offset correction can be applied while the modules are being
+    positioned.
+    """
+    def __init__(self, geom, modules, out, pulses=None):
+        """Initialization.
+
+        :param geom: EXtra-foam geometry instance.
+        :param array-like modules: modules data. shape = (memory cells,
+            modules, y, x).
+        :param numpy.ndarray out: output array. shape = (memory cells, y, x).
+        :param list pulses: indices of the memory cells to be positioned.
+            If None, all the memory cells are positioned.
+        """
+        self._geom = geom
+        self._modules = modules
+        self._out = out
+        self._pulses = pulses
+
+    @property
+    def out(self):
+        return self._out
+
+    def assemble(self, *, gain=None, offset=None):
+        """Position the modules if they have not been positioned.
+
+        :param numpy.ndarray gain: gain constants of the memory cells
+            to be positioned. shape = (memory cells, y, x).
+        :param numpy.ndarray offset: offset constants of the memory cells
+            to be positioned. shape = (memory cells, y, x).
+        """
+        if self._modules is not None:
+            self._geom.position_all_modules(
+                self._modules, self._out,
+                gain=gain, offset=offset, pulses=self._pulses)
+            self._modules = None
+        return self._out
+
+
+def assemble_deferred(data):
+    """Position the modules whose positioning was deferred.
+
+    The modules are positioned without correction if the ImageProcessor
+    has not done it, e.g. because it failed or was skipped. Otherwise,
+    the downstream processors would see an unfilled image.
+
+    :param dict data: a dictionary which is passed around processors.
+    """
+    assembled = data.get('assembled')
+    if assembled is None:
+        return
+
+    deferred = assembled.pop('deferred', None)
+    if deferred is not None:
+        deferred.assemble()
+
+
 class ImageAssemblerFactory(ABC):
 
     class BaseAssembler(_BaseProcessor, _RedisParserMixin):
@@ -228,6 +291,10 @@ class ImageAssemblerFactory(ABC):
                 quadrants.
             _geom: geometry instance in use.
             _out_array (numpy.ndarray): buffer to store the assembled modules.
+            _deferred (bool): whether to defer positioning the modules to
+                the ImageProcessor when the EXtra-foam geometry is in use.
+            _recording_dark (bool): whether a dark run is being recorded.
+                All the memory cells are assembled in this case.
         """
         def __init__(self):
             """Initialization."""
@@ -240,8 +307,21 @@ class ImageAssemblerFactory(ABC):
             self._quad_position = None
             self._geom = None
             self._out_array = None
+            self._deferred = False
+            self._recording_dark = False
+
+        def defer(self):
+            """Defer positioning the modules to the ImageProcessor.
+
+            The ImageProcessor then applies the gain and offset correction
+            in the same pass over the data.
+            """
+            self._deferred = True
 
         def update(self):
+            self._recording_dark = self._meta.hget(
+                mt.IMAGE_PROC, 'recording dark') == 'True'
+
             if self._require_geom:
                 cfg = self._meta.hget_all(mt.GEOMETRY_PROC)
 
@@ -296,12 +376,14 @@ class ImageAssemblerFactory(ABC):
             """
             raise NotImplementedError
 
-        def _assemble(self, modules):
+        def _assemble(self, modules, pulse_slicer=None):
             """Assemble modules data into assembled image data.
 
             :param array-like modules: modules data. shape = (memory cells,
                 modules, y, x) for pulse-resolved detectors and (y, x) for
                 train-resolved detectors.
+            :param slice pulse_slicer: if given, only the sliced memory
+                cells of pulse-resolved detectors are assembled.
 
             :return numpy.ndarray assembled: assembled detector image(s).
                 shape = (memory cells, y, x) for pulse-resolved detectors
@@ -312,15 +394,30 @@ class ImageAssemblerFactory(ABC):
                 n_modules = modules.shape[1]
                 if n_modules == 1:
                     # single module operation
+                    if pulse_slicer is not None:
+                        modules = modules[pulse_slicer]
                     return modules.astype(image_dtype).squeeze(axis=1)
 
-                n_pulses = modules.shape[0]
+                kwargs = dict()
+                if pulse_slicer is None:
+                    n_pulses = modules.shape[0]
+                elif self._assembler_type == GeomAssembler.OWN:
+                    # the EXtra-foam geometry gathers the memory cells
+                    # while positioning the modules
+                    kwargs['pulses'] = self._get_pulses(modules, pulse_slicer)
+                    n_pulses = len(kwargs['pulses'])
+                else:
+                    # a view of the sliced memory cells
+                    modules = modules[pulse_slicer]
+                    n_pulses = modules.shape[0]
+
                 if self._out_array is None or self._out_array.shape[0] != n_pulses:
                     self._out_array = self._geom.output_array_for_position_fast(
                         extra_shape=(n_pulses, ), dtype=image_dtype)
 
                 try:
-                    self._geom.position_all_modules(modules, out=self._out_array)
+                    self._geom.position_all_modules(
+                        modules, out=self._out_array, **kwargs)
                 # EXtra-foam raises ValueError while EXtra-geom raises
                 # AssertionError if the shape of the output array does not
                 # match the expected one, e.g. after a change of quadrant
@@ -329,12 +426,15 @@ class ImageAssemblerFactory(ABC):
                     # recreate the output array
                     self._out_array = self._geom.output_array_for_position_fast(
                         extra_shape=(n_pulses, ), dtype=image_dtype)
-                    self._geom.position_all_modules(modules, out=self._out_array)
+                    self._geom.position_all_modules(
+                        modules, out=self._out_array, **kwargs)
 
                 return self._out_array
 
             # temporary workaround for Pulse resolved JungFrau without geometry
             if config["DETECTOR"] == "JungFrauPR":
+                if pulse_slicer is not None:
+                    modules = modules[pulse_slicer]
                 shape = modules.shape
                 # Stacking modules vertically along y axis.
                 return modules.reshape(shape[0], -1, shape[-1])
@@ -347,6 +447,46 @@ class ImageAssemblerFactory(ABC):
             # FIXME: why once a while this takes a few ms???
             return modules.astype(image_dtype)
 
+        @staticmethod
+        def _get_pulses(modules, pulse_slicer):
+            """Return the indices of the sliced memory cells."""
+            return list(range(*pulse_slicer.indices(modules.shape[0])))
+
+        def _defer_assembling(self, modules, pulse_slicer=None):
+            """Return a _DeferredAssembly if the positioning can be deferred.
+
+            Otherwise, None.
+
+            :param array-like modules: modules data. shape = (memory cells,
+                modules, y, x).
+            :param slice pulse_slicer: if given, only the sliced memory
+                cells are positioned.
+            """
+            if not self._deferred or self._geom is None \
+                    or self._assembler_type != GeomAssembler.OWN:
+                return None
+
+            if modules.ndim != 4 or modules.shape[1] == 1 \
+                    or modules.dtype not in _DEFERRED_DTYPES:
+                # let _assemble handle it
+                return None
+
+            pulses = None
+            if pulse_slicer is None:
+                n_pulses = modules.shape[0]
+            else:
+                pulses = self._get_pulses(modules, pulse_slicer)
+                n_pulses = len(pulses)
+
+            out_shape = (n_pulses, *self._geom.assembledShape())
+            if self._out_array is None or self._out_array.shape != out_shape:
+                self._out_array = self._geom.output_array_for_position_fast(
+                    extra_shape=(n_pulses, ),
+                    dtype=config["SOURCE_PROC_IMAGE_DTYPE"])
+
+            return _DeferredAssembly(
+                self._geom, modules, self._out_array, pulses)
+
         @profiler("Image Assembler")
         def process(self, data):
             """Override."""
@@ -402,9 +542,29 @@ class ImageAssemblerFactory(ABC):
             except ValueError as e:
                 raise AssemblingError(e)
 
-            data['assembled'] = {
-                'data': self._assemble(modules_data),
-            }
+            # Only the sliced memory cells of pulse-resolved detectors are
+            # assembled. All of them are assembled while recording a dark
+            # run since the dark does not depend on the pulse slicer.
+            pulse_slicer = None
+            if ndim == 4 and not self._recording_dark:
+                pulse_slicer = catalog.get_slicer(src)
+
+            deferred = self._defer_assembling(modules_data, pulse_slicer)
+            if deferred is None:
+                data['assembled'] = {
+                    'data': self._assemble(modules_data, pulse_slicer),
+                }
+            else:
+                # 'data' is filled by the ImageProcessor
+                data['assembled'] = {
+                    'data': deferred.out,
+                    'deferred': deferred,
+                }
+
+            if pulse_slicer is not None:
+                # number of memory cells in the train, which is needed to
+                # check the shapes of the dark and the calibration constants
+                data['assembled']['n_pulses'] = shape[0]
             # Assign the global train ID once the main detector was
             # successfully assembled.
             raw["META timestamp.tid"] = meta[src]["tid"]
@@ -458,7 +618,16 @@ class ImageAssemblerFactory(ABC):
         def _load_geometry(self, filename, quad_positions):
             """Override."""
             if self._assembler_type == GeomAssembler.OWN or self._stack_only:
-                raise AssemblingError("Not implemented!")
+                from ...geometries import AGIPD_1MGeometryFast
+
+                if self._stack_only:
+                    self._geom = AGIPD_1MGeometryFast()
+                else:
+                    try:
+                        self._geom = AGIPD_1MGeometryFast.from_crystfel_geom(
+                            filename)
+                    except (ImportError, ModuleNotFoundError, OSError) as e:
+                        raise AssemblingError(e)
             else:
                 from extra_geom import AGIPD_1MGeometry
 
@@ -7,9 +7,12 @@ Author: Jun Zhu <jun.zhu@xfel.eu>
 Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 from .base_processor import _BaseProcessor
+from .image_assembler import assemble_deferred
 from ..data_model import RawImageData
 from ..exceptions import ImageProcessingError, ProcessingError
 from ...database import Metadata as mt
@@ -23,6 +26,58 @@ from extra_foam.algorithms import (
 )
 
 
+def _prepare_constants(constants, slicer):
+    """Compute the mean of the sliced constants over memory cells.
+
+    It also pages in the memory-mapped constants.
+    """
+    return constants, nanmean_image_data(constants[slicer])
+
+
+class _ConstantsPreparer:
+    """Prepare calibration constants in a background thread."""
+
+    _executor = None
+
+    def __init__(self):
+        self._pending = None
+        self._future = None
+
+    @property
+    def pending(self):
+        """Constants being prepared."""
+        return self._pending
+
+    def submit(self, constants, slicer):
+        """Prepare constants and discard the ones being prepared."""
+        if self._executor is None:
+            self.__class__._executor = ThreadPoolExecutor(max_workers=1)
+
+        self.cancel()
+        self._pending = constants
+        self._future = self._executor.submit(
+            _prepare_constants, constants, slicer)
+
+    def cancel(self):
+        if self._future is not None:
+            self._future.cancel()
+        self._pending = None
+        self._future = None
+
+    def result(self):
+        """Return (constants, mean) if the preparation has finished.
+
+        Otherwise, None.
+        """
+        if self._future is None or not self._future.done():
+            return None
+
+        future = self._future
+        self._pending = None
+        self._future = None
+        return future.result()
+
+
 class ImageProcessor(_BaseProcessor):
     """ImageProcessor class.
 
@@ -42,8 +97,16 @@ class ImageProcessor(_BaseProcessor):
             cell. Shape = (y, x)
         _offset_mean (numpy.ndarray): average of offset constants over memory
             cell. Shape = (y, x)
+        _gain_preparer (_ConstantsPreparer): new gain constants and their
+            average are prepared in the background and swapped in together.
+        _offset_preparer (_ConstantsPreparer): new offset constants and
+            their average are prepared in the background and swapped in
+            together.
         _dark_as_offset (bool): True for using recorded dark trains as offset.
         _recording_dark (bool): whether a dark run is being recorded.
+        _remove_dark (str): counter of the "remove dark" requests. It is
+            not deleted after being read so that all the pulse workers
+            can see the same request.
         _dark_mean (bool): average of recorded dark trains over memory
             cell. Shape = (y, x)
         _image_mask (numpy.ndarray): image mask. For pulse-resolved detectors,
@@ -74,9 +137,12 @@ class ImageProcessor(_BaseProcessor):
         self._compute_offset_mean = False
         self._gain_mean = None
         self._offset_mean = None
+        self._gain_preparer = _ConstantsPreparer()
+        self._offset_preparer = _ConstantsPreparer()
 
         self._dark_as_offset = True
         self._recording_dark = False
+        self._remove_dark = None
         self._dark_mean = None
 
         self._image_mask = None
@@ -111,8 +177,9 @@ class ImageProcessor(_BaseProcessor):
             self._dark_as_offset = dark_as_offset
 
         self._recording_dark = cfg['recording dark'] == 'True'
-        if 'remove dark' in cfg:
-            self._meta.hdel(mt.IMAGE_PROC, 'remove dark')
+        remove_dark = cfg.get('remove dark')
+        if remove_dark != self._remove_dark:
+            self._remove_dark = remove_dark
             del self._dark
             self._dark_mean = None
 
@@ -124,32 +191,69 @@ class ImageProcessor(_BaseProcessor):
         self._poi_indices = [
             int(gp_cfg['poi1_index']), int(gp_cfg['poi2_index'])]
 
+    def run_once(self, data):
+        """Override."""
+        try:
+            super().run_once(data)
+        finally:
+            # The modules must be positioned even if the processing
+            # failed. It has no effect if they have been positioned.
+            assemble_deferred(data)
+
     @profiler("Image Processor (pulse)")
     def process(self, data):
         image_data = data['processed'].image
+        # modules whose positioning was deferred by the assembler. It is
+        # removed from the data in run_once().
+        deferred = data['assembled'].get('deferred')
+        # number of memory cells in the train if the assembler has only
+        # assembled the sliced ones
+        n_pulses = data['assembled'].pop('n_pulses', None)
+        presliced = n_pulses is not None
         assembled = data['assembled']['data']
         catalog = data['catalog']
         det = catalog.main_detector
         pulse_slicer = catalog.get_slicer(det)
 
         if assembled.ndim == 3:
-            sliced_assembled = assembled[pulse_slicer]
-            sliced_indices = list(range(
-                *(pulse_slicer.indices(assembled.shape[0]))))
+            if presliced:
+                sliced_assembled = assembled
+            else:
+                n_pulses = assembled.shape[0]
+                sliced_assembled = assembled[pulse_slicer]
+            sliced_indices = list(range(*(pulse_slicer.indices(n_pulses))))
             n_sliced = len(sliced_indices)
+            train_shape = (n_pulses, *assembled.shape[1:])
         else:
             sliced_assembled = assembled
             sliced_indices = [0]
             n_sliced = 1
-
-        if self._recording_dark:
+            train_shape = assembled.shape
+
+        # The dark is recorded from all the memory cells. The assembler
+        # could still have sliced the train in which the recording started.
+        if self._recording_dark and not presliced:
+            if deferred is not None:
+                # dark must be recorded before the correction
+                deferred.assemble()
+                deferred = None
             self._record_dark(assembled)
 
-        sliced_gain, sliced_offset = self._update_gain_offset(assembled.shape)
-        correct_image_data(sliced_assembled,
-                           gain=sliced_gain,
-                           offset=sliced_offset,
-                           slicer=pulse_slicer)
+        sliced_gain, sliced_offset = self._update_gain_offset(train_shape)
+
+        if deferred is None:
+            correct_image_data(sliced_assembled,
+                               gain=sliced_gain,
+                               offset=sliced_offset,
+                               slicer=pulse_slicer)
+        else:
+            # the constants are sliced in the same way as the modules
+            if presliced:
+                if sliced_gain is not None:
+                    sliced_gain = sliced_gain[pulse_slicer]
+                if sliced_offset is not None:
+                    sliced_offset = sliced_offset[pulse_slicer]
+            deferred.assemble(gain=sliced_gain, offset=sliced_offset)
 
         # Note: This will be needed by the pump_probe_processor to calculate
         #       the mean of assembled images. Also, the on/off indices are
@@ -231,47 +335,44 @@ class ImageProcessor(_BaseProcessor):
         except Exception as e:
             raise ImageProcessingError(str(e))
 
-        self._compute_gain_mean |= new_gain
-        self._compute_offset_mean |= new_offset
-
-        # Set new value before checking shape. It avoids loading data once
-        # again due to the wrong slicer.
-        self._gain = gain
-        self._offset = offset
+        if new_gain or self._compute_gain_mean:
+            self._compute_gain_mean = False
+            self._gain_mean = self._submit_constants(
+                self._gain_preparer, new_gain, gain, self._gain,
+                self._gain_slicer, self._gain_mean)
+            if new_gain and gain is None:
+                self._gain = None
+        prepared = self._gain_preparer.result()
+        if prepared is not None:
+            self._gain, self._gain_mean = prepared
+
+        if new_offset or self._compute_offset_mean:
+            self._compute_offset_mean = False
+            self._offset_mean = self._submit_constants(
+                self._offset_preparer, new_offset, offset, self._offset,
+                self._offset_slicer, self._offset_mean)
+            if new_offset and offset is None:
+                self._offset = None
+        prepared = self._offset_preparer.result()
+        if prepared is not None:
+            self._offset, self._offset_mean = prepared
 
         sliced_gain = None
-        if self._correct_gain:
-            if gain is not None:
-                sliced_gain = gain[self._gain_slicer]
-                if sliced_gain.shape != expected_shape:
-                    raise ImageProcessingError(
-                        f"[Image processor] Shape of the gain constant "
-                        f"{sliced_gain.shape} is different from the data "
-                        f"{expected_shape}")
-                if self._compute_gain_mean:
-                    # For visualization of the gain
-                    self._gain_mean = nanmean_image_data(sliced_gain)
-                    self._compute_gain_mean = False
-            else:
-                if self._compute_gain_mean:
-                    self._gain_mean = None
-                    self._compute_gain_mean = False
+        if self._correct_gain and self._gain is not None:
+            sliced_gain = self._gain[self._gain_slicer]
+            if sliced_gain.shape != expected_shape:
+                raise ImageProcessingError(
+                    f"[Image processor] Shape of the gain constant "
+                    f"{sliced_gain.shape} is different from the data "
+                    f"{expected_shape}")
 
         sliced_offset = None
         if self._correct_offset:
             if self._dark_as_offset:
                 sliced_offset = self._dark
                 self._offset_mean = self._dark_mean
-            elif offset is not None:
-                sliced_offset = offset[self._offset_slicer]
-                if self._compute_offset_mean:
-                    # For visualization of the offset
-                    self._offset_mean = nanmean_image_data(sliced_offset)
-                    self._compute_offset_mean = False
-            else:
-                if self._compute_offset_mean:
-                    self._offset_mean = None
-                    self._compute_offset_mean = False
+            elif self._offset is not None:
+                sliced_offset = self._offset[self._offset_slicer]
 
             if sliced_offset is not None and \
                     sliced_offset.shape != expected_shape:
@@ -282,6 +383,29 @@ class ImageProcessor(_BaseProcessor):
 
         return sliced_gain, sliced_offset
 
+    @staticmethod
+    def _submit_constants(preparer, new, constants, current, slicer, mean):
+        """Prepare new constants or the mean for a new slicer.
+
+        The current constants are used until the preparation has finished.
+
+        :return: the mean to be used in the meantime.
+        """
+        if new:
+            if constants is None:
+                preparer.cancel()
+                return None
+        elif preparer.pending is not None:
+            constants = preparer.pending
+        else:
+            constants = current
+
+        if constants is None:
+            return None
+
+        preparer.submit(constants, slicer)
+        return mean
+
     def _update_pois(self, image_data, assembled):
         if assembled.ndim == 2 or image_data.poi_indices is None:
             return
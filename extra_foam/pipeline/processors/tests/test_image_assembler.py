@@ -122,6 +122,20 @@ class TestAgipdAssembler(_TestDataMixin, unittest.TestCase):
     def testAssembleFileRaw(self):
         self._runAssembleFileTest((4, 2, 512, 128), _RAW_IMAGE_DTYPE)
 
+    def testOwnAssembler(self):
+        from extra_foam.geometries import AGIPD_1MGeometryFast
+
+        self._assembler._assembler_type = GeomAssembler.OWN
+        self._assembler._load_geometry(self._geom_file, self._quad_positions)
+        self.assertIsInstance(self._assembler._geom, AGIPD_1MGeometryFast)
+        self._runAssembleFileTest((4, 512, 128), _IMAGE_DTYPE)
+        self._runAssembleFileTest((4, 2, 512, 128), _RAW_IMAGE_DTYPE)
+
+        self._assembler._stack_only = True
+        self._assembler._load_geometry(self._geom_file, self._quad_positions)
+        self.assertIsInstance(self._assembler._geom, AGIPD_1MGeometryFast)
+        self._runAssembleFileTest((4, 512, 128), _IMAGE_DTYPE)
+
     def _runAssembleFileTest(self, shape, dtype):
         key_name = 'image.data'
         src, catalog = self._create_catalog('SPB_DET_AGIPD1M-1/DET/*CH0:xtdf', key_name)
@@ -419,16 +433,111 @@ class TestLpdAssembler:
         with pytest.raises(TypeError):
             self._assembler.process(data)
 
+        # integer modules are converted to float32 in both implementations
         data['raw'][src] = np.ones((16, 256, 256, 4), dtype=np.int16)
+        self._assembler.process(data)
+
+        assembled_dtype = data['assembled']['data'].dtype
+        assert _IMAGE_DTYPE == assembled_dtype
+
+    @pytest.mark.parametrize("assembler_type", [GeomAssembler.EXTRA_GEOM, GeomAssembler.OWN])
+    def testDeferredAssembly(self, assembler_type):
+        self._load_geometry(assembler_type)
+        self._assembler.defer()
+
+        key_name = 'image.data'
+        src, catalog = self._create_catalog('FXE_DET_LPD1M-1/CAL/APPEND_CORRECTED', key_name)
+
+        modules = np.ones((16, 256, 256, 4), dtype=_RAW_IMAGE_DTYPE)
+        data = {
+            'catalog': catalog,
+            'meta': {
+                src: {
+                    'tid': 10001,
+                    'source_type': DataSource.BRIDGE,
+                }
+            },
+            'raw': {
+                src: modules
+            },
+        }
+        self._assembler.process(data)
+        _check_assembled_result(data, src)
+
         if assembler_type == GeomAssembler.EXTRA_GEOM:
+            # only the EXtra-foam geometry supports the correction
+            assert 'deferred' not in data['assembled']
+            return
+
+        deferred = data['assembled']['deferred']
+        assert deferred.out is data['assembled']['data']
+        gain = np.full(deferred.out.shape, 2, dtype=_IMAGE_DTYPE)
+        offset = np.ones(deferred.out.shape, dtype=_IMAGE_DTYPE)
+        assembled = deferred.assemble(gain=gain, offset=offset)
+        assert assembled is data['assembled']['data']
+        assert 0 == np.nanmax(assembled)
+        # the modules are only positioned once
+        deferred.assemble()
+        assert 0 == np.nanmax(assembled)
+
+        # dtypes which are not supported are left to the assembler
+        data['raw'][src] = np.ones((16, 256, 256, 4), dtype=np.float64)
+        with pytest.raises(TypeError):
             self._assembler.process(data)
 
-            assembled_dtype = data['assembled']['data'].dtype
-            assert _IMAGE_DTYPE == assembled_dtype
-        else:
-            # C++ implementation does not allow any implicit type conversion
-            with pytest.raises(TypeError):
-                self._assembler.process(data)
+    @pytest.mark.parametrize("assembler_type", [GeomAssembler.EXTRA_GEOM, GeomAssembler.OWN])
+    @pytest.mark.parametrize("deferred", [False, True])
+    def testPulseSlicing(self, assembler_type, deferred):
+        self._load_geometry(assembler_type)
+        if deferred:
+            self._assembler.defer()
+
+        key_name = 'image.data'
+        src_name = 'FXE_DET_LPD1M-1/CAL/APPEND_CORRECTED'
+        src = f'{src_name} {key_name}'
+        catalog = SourceCatalog()
+        catalog.add_item(SourceItem('LPD', src_name, [], key_name, slice(1, None, 2), None))
+
+        # (modules, x, y, memory cells)
+        modules = np.ones((16, 256, 256, 5), dtype=_IMAGE_DTYPE)
+        for i in range(5):
+            modules[..., i] = i
+
+        def _new_data():
+            return {
+                'catalog': catalog,
+                'meta': {
+                    src: {
+                        'tid': 10001,
+                        'source_type': DataSource.BRIDGE,
+                    }
+                },
+                'raw': {
+                    src: modules
+                },
+            }
+
+        # only the sliced memory cells are assembled
+        data = _new_data()
+        self._assembler.process(data)
+        assert 5 == data['assembled']['n_pulses']
+        if 'deferred' in data['assembled']:
+            data['assembled']['deferred'].assemble()
+        assembled = data['assembled']['data']
+        assert 2 == assembled.shape[0]
+        assert 1 == np.nanmax(assembled[0])
+        assert 3 == np.nanmax(assembled[1])
+
+        # all the memory cells are assembled while recording dark
+        self._assembler._recording_dark = True
+        data = _new_data()
+        self._assembler.process(data)
+        assert 'n_pulses' not in data['assembled']
+        if 'deferred' in data['assembled']:
+            data['assembled']['deferred'].assemble()
+        assembled = data['assembled']['data']
+        assert 5 == assembled.shape[0]
+        assert 4 == np.nanmax(assembled[4])
 
 
 class TestDSSCAssembler:
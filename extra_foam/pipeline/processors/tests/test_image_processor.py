@@ -7,12 +7,14 @@ Author: Jun Zhu <jun.zhu@xfel.eu>
 Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
+from threading import Event
 import unittest
 from unittest.mock import MagicMock, patch
 
 import numpy as np
 
 from extra_foam.pipeline.processors.image_processor import ImageProcessor
+from extra_foam.pipeline.processors.image_assembler import _DeferredAssembly
 from extra_foam.pipeline.exceptions import ImageProcessingError, ProcessingError
 from extra_foam.pipeline.tests import _TestDataMixin
 
@@ -209,6 +211,113 @@ class TestImageProcessorPr(_TestDataMixin, unittest.TestCase):
         np.testing.assert_array_almost_equal(data['assembled']['data'],
                                              proc._gain * (assembled_gt - proc._dark))
 
+    @patch('extra_foam.pipeline.processors.image_processor.correct_image_data')
+    def testDeferredAssembly(self, correct_image_data):
+        proc = self._proc
+        proc._gain_slicer = slice(None, None)
+        proc._offset_slicer = slice(None, None)
+        proc._correct_gain = True
+        proc._correct_offset = True
+        proc._dark_as_offset = False
+        proc._gain = np.random.randn(4, 2, 2).astype(np.float32)
+        proc._offset = np.random.randn(4, 2, 2).astype(np.float32)
+
+        proc.update = MagicMock()
+
+        def _defer(data):
+            geom = MagicMock()
+            data['assembled']['deferred'] = _DeferredAssembly(
+                geom, MagicMock(), data['assembled']['data'])
+            return geom.position_all_modules
+
+        # the correction is applied while positioning the modules
+        data, processed = self.data_with_assembled(1, (4, 2, 2))
+        position = _defer(data)
+        proc.run_once(data)
+        position.assert_called_once()
+        kwargs = position.call_args[1]
+        np.testing.assert_array_equal(proc._gain, kwargs['gain'])
+        np.testing.assert_array_equal(proc._offset, kwargs['offset'])
+        correct_image_data.assert_not_called()
+        self.assertNotIn('deferred', data['assembled'])
+
+        # dark is recorded before the correction
+        proc._recording_dark = True
+        data, processed = self.data_with_assembled(2, (4, 2, 2))
+        position = _defer(data)
+        proc.run_once(data)
+        position.assert_called_once()
+        self.assertIsNone(position.call_args[1]['gain'])
+        correct_image_data.assert_called_once()
+        proc._recording_dark = False
+
+        # the modules are still positioned if the constants are invalid
+        proc._gain = np.random.randn(3, 2, 2).astype(np.float32)
+        data, processed = self.data_with_assembled(3, (4, 2, 2))
+        position = _defer(data)
+        with self.assertRaises(ImageProcessingError):
+            proc.run_once(data)
+        position.assert_called_once()
+        self.assertIsNone(position.call_args[1]['gain'])
+        self.assertNotIn('deferred', data['assembled'])
+
+        # the modules are still positioned if the update fails
+        proc.update.side_effect = ValueError
+        data, processed = self.data_with_assembled(4, (4, 2, 2))
+        position = _defer(data)
+        with self.assertRaises(ValueError):
+            proc.run_once(data)
+        position.assert_called_once()
+        self.assertIsNone(position.call_args[1]['gain'])
+        self.assertNotIn('deferred', data['assembled'])
+
+    def testNewGainOffsetPreparedInBackground(self):
+        proc = self._proc
+        proc._gain_slicer = slice(None, None)
+        proc._offset_slicer = slice(1, None)
+        proc._dark_as_offset = False
+
+        gain_gt = np.random.randn(4, 2, 2).astype(np.float32)
+        offset_gt = np.random.randn(5, 2, 2).astype(np.float32)
+        proc._cal_sub.update = MagicMock(
+            return_value=(True, gain_gt, True, offset_gt))
+        ready = Event()
+
+        def _prepare(c, s):
+            ready.wait()
+            return c, np.nanmean(c[s], axis=0)
+
+        with patch("extra_foam.pipeline.processors.image_processor._prepare_constants",
+                   side_effect=_prepare) as prepare:
+            proc._update_gain_offset((4, 2, 2))
+            # the current constants are used until the new ones are ready
+            self.assertIsNone(proc._gain)
+            self.assertIsNone(proc._offset)
+
+            proc._cal_sub.update = MagicMock(
+                side_effect=lambda x, y: (False, x, False, y))
+            ready.set()
+            proc._gain_preparer._future.result()
+            proc._offset_preparer._future.result()
+            sliced_gain, sliced_offset = proc._update_gain_offset((4, 2, 2))
+            self.assertEqual(2, prepare.call_count)
+
+        # constants and their mean are swapped in together
+        self.assertIs(gain_gt, proc._gain)
+        np.testing.assert_array_almost_equal(np.nanmean(gain_gt, axis=0), proc._gain_mean)
+        self.assertIs(offset_gt, proc._offset)
+        np.testing.assert_array_almost_equal(np.nanmean(offset_gt[1:], axis=0), proc._offset_mean)
+        np.testing.assert_array_equal(gain_gt, sliced_gain)
+        np.testing.assert_array_equal(offset_gt[1:], sliced_offset)
+
+        # remove
+        proc._cal_sub.update = MagicMock(return_value=(True, None, True, None))
+        proc._update_gain_offset((4, 2, 2))
+        self.assertIsNone(proc._gain)
+        self.assertIsNone(proc._gain_mean)
+        self.assertIsNone(proc._offset)
+        self.assertIsNone(proc._offset_mean)
+
     def testPulseSlicing(self):
         proc = self._proc
 
@@ -255,6 +364,36 @@ class TestImageProcessorPr(_TestDataMixin, unittest.TestCase):
             data['assembled']['sliced'], assembled_gt - self._proc._dark[slicer])
         proc._recording = False
 
+    def testPreslicedAssembly(self):
+        proc = self._proc
+        proc._correct_gain = False
+        proc._correct_offset = True
+        proc._dark_as_offset = False
+        proc._offset_slicer = slice(None, None)
+        offset_gt = np.random.randn(4, 2, 2).astype(np.float32)
+        proc._offset = offset_gt
+
+        # the assembler has only assembled the sliced pulses
+        slicer = slice(1, None, 2)
+        data, processed = self.data_with_assembled(1, (4, 2, 2), slicer=slicer)
+        assembled_gt = data['assembled']['data'][slicer].copy()
+        data['assembled']['data'] = data['assembled']['data'][slicer].copy()
+        data['assembled']['n_pulses'] = 4
+        proc.process(data)
+        np.testing.assert_array_almost_equal(
+            assembled_gt - offset_gt[slicer], data['assembled']['sliced'])
+        self.assertListEqual([1, 3], processed.image.sliced_indices)
+        self.assertNotIn('n_pulses', data['assembled'])
+
+        # the dark is not recorded from the sliced pulses
+        proc._recording_dark = True
+        data, processed = self.data_with_assembled(2, (4, 2, 2), slicer=slicer)
+        data['assembled']['data'] = data['assembled']['data'][slicer].copy()
+        data['assembled']['n_pulses'] = 4
+        proc.process(data)
+        self.assertIsNone(proc._dark)
+        proc._recording_dark = False
+
     def testReferenceUpdate(self):
         proc = self._proc
 
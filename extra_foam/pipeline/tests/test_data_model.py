@@ -217,6 +217,27 @@ class TestProcessedData(unittest.TestCase):
         self.assertEqual(1236, data.tid)
         self.assertEqual(1, data.n_pulses)
 
+    def testStrip(self):
+        data = ProcessedData(1234)
+        data.image.images = [np.ones((2, 2))] * 3
+        data.image.masked_mean = np.ones((2, 2))
+        data.pp.image_on = np.ones((2, 2))
+        data.corr[0].x = np.ones(10)
+        data.corr[0].source = "abc"
+        data.corr[1].x = np.ones(10)
+        data.bin.heat = np.ones((2, 2))
+
+        data.strip({'corr[1]', 'image.images'})
+        self.assertIsNone(data.pp.image_on)
+        self.assertIsNone(data.corr[0].x)
+        self.assertEqual("", data.corr[0].source)
+        self.assertIsNone(data.bin.heat)
+        # requested fields
+        self.assertEqual(3, len(data.image.images))
+        np.testing.assert_array_equal(np.ones(10), data.corr[1].x)
+        # non-optional fields are kept
+        np.testing.assert_array_equal(np.ones((2, 2)), data.image.masked_mean)
+
 
 class TestImageData(unittest.TestCase):
 
@@ -0,0 +1,167 @@
+import unittest
+from unittest.mock import patch
+from collections import namedtuple
+from queue import Empty
+from threading import Event
+
+from extra_foam.pipeline.pipe import (
+    KaraboBridge, MpInMergeQueue, MpInQueue, MpInShmQueue, MpOutDispatchQueue
+)
+from extra_foam.config import config, PumpProbeMode
+
+
+_Processed = namedtuple("_Processed", ["tid"])
+
+
+class TestKaraboBridge(unittest.TestCase):
+    @patch("extra_foam.pipeline.pipe.time.monotonic")
+    @patch.dict(config._data, {"SOURCE_AVAIL_UPDATE_TIMER": 1000})
+    def testUpdateAvailableSources(self, now):
+        pipe = KaraboBridge(Event(), Event(), Event())
+        mon = pipe._mon
+        meta = {"abc": {"timestamp.tid": 1001},
+                "efg": {"timestamp.tid": 1001}}
+
+        with patch.object(mon, "set_available_sources") as set_, \
+                patch.object(mon, "refresh_available_sources") as refresh:
+            now.return_value = 10.
+            pipe._update_available_sources("tcp://a", meta)
+            set_.assert_called_once_with({"abc": 1001, "efg": 1001})
+            set_.reset_mock()
+
+            # unchanged sources are not published again
+            now.return_value = 10.5
+            pipe._update_available_sources("tcp://a", meta)
+            set_.assert_not_called()
+            refresh.assert_not_called()
+
+            # heartbeat
+            now.return_value = 11.
+            refresh.return_value = 1
+            pipe._update_available_sources("tcp://a", meta)
+            set_.assert_not_called()
+            refresh.assert_called_once()
+            refresh.reset_mock()
+
+            # the key has expired
+            now.return_value = 12.
+            refresh.return_value = 0
+            pipe._update_available_sources("tcp://a", meta)
+            refresh.assert_called_once()
+            set_.assert_called_once()
+            set_.reset_mock()
+
+            # sources changed
+            now.return_value = 12.1
+            meta["xyz"] = {"timestamp.tid": 1002}
+            pipe._update_available_sources("tcp://a", meta)
+            set_.assert_called_once()
+
+    @patch("extra_foam.pipeline.pipe.time.monotonic")
+    @patch.dict(config._data, {"SOURCE_AVAIL_UPDATE_TIMER": 1000})
+    def testUpdateAvailableSourcesMultiEndpoints(self, now):
+        pipe = KaraboBridge(Event(), Event(), Event())
+        mon = pipe._mon
+        now.return_value = 10.
+
+        with patch.object(mon, "set_available_sources") as set_, \
+                patch.object(mon, "refresh_available_sources") as refresh:
+            # messages from two endpoints arrive alternately
+            pipe._update_available_sources(
+                "tcp://a", {"abc": {"timestamp.tid": 1001}})
+            set_.reset_mock()
+            for tid in range(1001, 1011):
+                pipe._update_available_sources(
+                    "tcp://b", {"efg": {"timestamp.tid": tid}})
+                pipe._update_available_sources(
+                    "tcp://a", {"abc": {"timestamp.tid": tid + 1}})
+            # the union of the sources is published only once
+            set_.assert_called_once_with({"abc": 1001, "efg": 1001})
+            refresh.assert_not_called()
+
+
+class TestMpInQueue(unittest.TestCase):
+    @patch('extra_foam.pipeline.pipe.SharedMemoryRing')
+    @patch('extra_foam.pipeline.pipe.OutOfBandQueue')
+    def testCreateClient(self, queue, ring):
+        pipe = MpInQueue(Event(), Event(), Event())
+        queue.assert_called_once()
+        ring.assert_not_called()
+        self.assertIs(queue.return_value, pipe._client)
+
+        queue.reset_mock()
+        # no queue is created and then discarded
+        pipe = MpInShmQueue(Event(), Event(), Event())
+        queue.assert_not_called()
+        ring.assert_called_once()
+        self.assertIs(ring.return_value, pipe._client)
+
+
+class TestDispatchAndMerge(unittest.TestCase):
+    def setUp(self):
+        self._pause_ev = Event()
+        self._pause_ev.set()
+        self._close_ev = Event()
+
+    def tearDown(self):
+        self._close_ev.set()
+
+    def testDispatch(self):
+        pipe = MpOutDispatchQueue(Event(), self._pause_ev, self._close_ev)
+        for _ in range(3):
+            pipe.accept(None)
+
+        cfg = {}
+        with patch.object(pipe._meta, "hget",
+                          side_effect=lambda name, key: cfg.get(key)):
+            self.assertTupleEqual((2, False), pipe._dispatch(1001))
+            self.assertTupleEqual((0, False), pipe._dispatch(1002))
+
+            # on and off trains are sent to the same worker
+            cfg['mode'] = str(int(PumpProbeMode.EVEN_TRAIN_ON))
+            self.assertEqual(pipe._dispatch(1002)[0], pipe._dispatch(1003)[0])
+            self.assertNotEqual(pipe._dispatch(1003)[0],
+                                pipe._dispatch(1004)[0])
+            cfg['mode'] = str(int(PumpProbeMode.ODD_TRAIN_ON))
+            self.assertEqual(pipe._dispatch(1003)[0], pipe._dispatch(1004)[0])
+            self.assertNotEqual(pipe._dispatch(1002)[0],
+                                pipe._dispatch(1003)[0])
+
+            cfg['recording dark'] = 'True'
+            self.assertTrue(pipe._dispatch(1001)[1])
+
+    @patch.dict(config._data, {"PIPELINE_N_PULSE_WORKERS": 2,
+                               "PIPELINE_SHM_ENABLED": False,
+                               "PIPELINE_MERGE_TIMEOUT": 0.2})
+    def testMerge(self):
+        pipe = MpInMergeQueue(Event(), self._pause_ev, self._close_ev)
+        pipe.start()
+
+        client = pipe._client
+        for worker, tid in [(1, 1002), (0, 1001), (0, 1003), (1, 1004)]:
+            client.put({'processed': _Processed(tid), 'worker': worker})
+
+        for tid in [1001, 1002, 1003]:
+            self.assertEqual(
+                tid, pipe.get(block=True, timeout=1)['processed'].tid)
+
+        # 1004 is held until timeout since worker 0 may still send a
+        # train with a smaller train ID
+        with self.assertRaises(Empty):
+            pipe.get(block=True, timeout=0.05)
+        self.assertEqual(
+            1004, pipe.get(block=True, timeout=1)['processed'].tid)
+
+        # late train is dropped
+        with patch('extra_foam.ipc.ProcessLogger.warning') as warning:
+            client.put({'processed': _Processed(1000), 'worker': 0})
+            client.put({'processed': _Processed(1006), 'worker': 0})
+            client.put({'processed': _Processed(1005), 'worker': 1})
+            data = pipe.get(block=True, timeout=1)
+            self.assertEqual(1005, data['processed'].tid)
+            # the dropped train is counted in the next released one
+            self.assertEqual(1, data['n_dropped'])
+            warning.assert_called_once()
+        data = pipe.get(block=True, timeout=1)
+        self.assertEqual(1006, data['processed'].tid)
+        self.assertNotIn('n_dropped', data)
@@ -52,6 +52,32 @@ class TestSimpleQueue(unittest.TestCase):
         t2.join()
         self.assertTrue(queue.empty())
 
+    def testBlocking(self):
+        queue = SimpleQueue(maxsize=1)
+        with self.assertRaises(Empty):
+            queue.get(block=True, timeout=0.01)
+
+        queue.put(1, block=True, timeout=0.01)
+        with self.assertRaises(Full):
+            queue.put(2, block=True, timeout=0.01)
+
+        # a waiting producer is woken up by the consumer
+        t = Thread(target=queue.put, args=(2,),
+                   kwargs={'block': True, 'timeout': 5})
+        t.start()
+        self.assertEqual(1, queue.get(block=True, timeout=5))
+        t.join()
+        self.assertEqual(2, queue.get())
+
+        # a waiting consumer is woken up by the producer
+        results = []
+        t = Thread(target=lambda: results.append(
+            queue.get(block=True, timeout=5)))
+        t.start()
+        queue.put_pop(3)
+        t.join()
+        self.assertListEqual([3], results)
+
 
 @patch.dict(config._data, {"DETECTOR": "ABC"})
 class TestCorrelateQueue(unittest.TestCase):
@@ -127,4 +153,99 @@ class TestCorrelateQueue(unittest.TestCase):
             data = self._create_data(1000 + i, {"ABC": "a", "Motor": "b"})
             queue.put(data)
         warning.assert_called_once()
-        self.assertEqual(cache_size(), len(queue._cached))
+        self.assertEqual(cache_size(),
+                         len([s for s in queue._slots if s is not None]))
+        self.assertDictEqual({'c ppt': 1}, queue.drop_counts)
+
+    @patch('extra_foam.ipc.ProcessLogger.warning')
+    def testDropStatistics(self, warning):
+        catalog = self._create_catalog({"ABC": "a", "Motor": "b"})
+        queue = CorrelateQueue(catalog, maxsize=2)
+
+        queue.put(self._create_data(1001, {"ABC": "a"}))
+        queue.put(self._create_data(1002, {"Motor": "b"}))
+        queue.put(self._create_data(1003, {"ABC": "a", "Motor": "b"}))
+        out = queue.get_nowait()
+        self.assertEqual(1003, out["processed"].tid)
+        self.assertEqual(2, out["n_dropped"])
+        # trains older than the correlated one are dropped
+        self.assertTrue(all(s is None for s in queue._slots))
+        self.assertDictEqual({'a ppt': 1, 'b ppt': 1}, queue.drop_counts)
+        self.assertEqual(2, warning.call_count)
+        warning.assert_any_call("Failed to correlate all the source items "
+                                "for train 1001! Missing: b ppt")
+
+        # the source masks are updated when the catalog changes
+        queue.put(self._create_data(1004, {"ABC": "a"}))
+        self.assertTrue(queue.empty())
+        catalog.remove_item("b ppt")
+        queue.put(self._create_data(1004, {"ABC": "a"}))
+        out = queue.get_nowait()
+        self.assertEqual(1004, out["processed"].tid)
+        self.assertEqual(0, out["n_dropped"])
+
+        queue.clear()
+        self.assertTrue(all(s is None for s in queue._slots))
+        self.assertDictEqual({}, queue.drop_counts)
+
+    @patch('extra_foam.ipc.ProcessLogger.warning')
+    @patch("extra_foam.pipeline.f_queue.CorrelateQueue._cache_size",
+           new_callable=PropertyMock, return_value=4)
+    def testEviction(self, cache_size, warning):
+        catalog = self._create_catalog({"ABC": "a", "Motor": "b"})
+        queue = CorrelateQueue(catalog, maxsize=10)
+
+        queue.put(self._create_data(1001, {"ABC": "a", "Motor": "b"}))
+        queue.put(self._create_data(1003, {"ABC": "a"}))
+        queue.put(self._create_data(1004, {"ABC": "a"}))
+        queue.put(self._create_data(1002, {"ABC": "a", "Motor": "b"}))
+        # only the trains between the correlated ones are evicted
+        self.assertEqual(0, queue.get_nowait()["n_dropped"])
+        self.assertEqual(0, queue.get_nowait()["n_dropped"])
+        self.assertEqual([1003, 1004],
+                         sorted(s.tid for s in queue._slots if s is not None))
+        queue.put(self._create_data(1004, {"Motor": "b"}))
+        self.assertEqual(1, queue.get_nowait()["n_dropped"])
+        self.assertTrue(all(s is None for s in queue._slots))
+
+        # the data of a train whose slot has been taken by a newer train
+        queue.put(self._create_data(1009, {"ABC": "a"}))
+        warning.reset_mock()
+        queue.put(self._create_data(1005, {"ABC": "a"}))
+        queue.put(self._create_data(1005, {"Motor": "b"}))
+        warning.assert_called_once()
+        queue.put(self._create_data(1009, {"Motor": "b"}))
+        self.assertEqual(1, queue.get_nowait()["n_dropped"])
+
+        # a train dropped by a newer train in its slot is counted once
+        queue.put(self._create_data(1010, {"ABC": "a"}))
+        queue.put(self._create_data(1014, {"ABC": "a"}))
+        queue.put(self._create_data(1010, {"Motor": "b"}))
+        queue.put(self._create_data(1014, {"Motor": "b"}))
+        self.assertEqual(1, queue.get_nowait()["n_dropped"])
+
+    @patch('extra_foam.ipc.ProcessLogger.warning')
+    @patch("extra_foam.pipeline.f_queue.time.monotonic")
+    def testDropReport(self, now, warning):
+        now.return_value = 0.
+        catalog = self._create_catalog({"ABC": "a", "Motor": "b"})
+        queue = CorrelateQueue(catalog, maxsize=10)
+
+        queue.put(self._create_data(1001, {"ABC": "a"}))
+        queue.put(self._create_data(1002, {"ABC": "a", "Motor": "b"}))
+        warning.reset_mock()
+
+        now.return_value = queue.DROP_REPORT_INTERVAL
+        queue.put(self._create_data(1003, {"Motor": "b"}))
+        queue.put(self._create_data(1004, {"ABC": "a", "Motor": "b"}))
+        self.assertEqual(2, warning.call_count)
+        warning.assert_called_with(
+            f"2 trains were dropped in the last "
+            f"{queue.DROP_REPORT_INTERVAL:.0f} s! "
+            f"Missing: a ppt (x1), b ppt (x1)")
+
+        # not reported again within the interval
+        warning.reset_mock()
+        queue.put(self._create_data(1005, {"ABC": "a"}))
+        queue.put(self._create_data(1006, {"ABC": "a", "Motor": "b"}))
+        warning.assert_called_once()
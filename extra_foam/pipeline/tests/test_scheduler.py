@@ -0,0 +1,43 @@
+import unittest
+
+from extra_foam.pipeline.f_scheduler import TaskScheduler
+
+
+class TestTaskScheduler(unittest.TestCase):
+    def testGeneral(self):
+        scheduler = TaskScheduler(max_stride=5, alpha=1.0)
+        cheap, heavy = object(), object()
+        scheduler.set_optional_tasks([heavy])
+
+        # no information about the arrival rate
+        scheduler.arrive(1000, 0.0)
+        self.assertEqual(1, scheduler.stride)
+        self.assertFalse(scheduler.skip(heavy))
+
+        scheduler.record(cheap, 0.02)
+        scheduler.record(heavy, 0.05)
+        scheduler.arrive(1001, 0.1)
+        # processing fully is fast enough
+        self.assertEqual(1, scheduler.stride)
+
+        scheduler.record(heavy, 0.2)
+        # two trains were dropped upstream
+        scheduler.arrive(1004, 0.4)
+        # (0.22 + 0.02 * (k - 1)) / k <= 0.1
+        self.assertEqual(3, scheduler.stride)
+        scheduler.arrive(1005, 0.5)
+        self.assertTrue(scheduler.full)
+        self.assertFalse(scheduler.skip(heavy))
+        scheduler.arrive(1006, 0.6)
+        self.assertFalse(scheduler.full)
+        self.assertTrue(scheduler.skip(heavy))
+        self.assertFalse(scheduler.skip(cheap))
+
+        # even the cheap tasks are too slow
+        scheduler.record(cheap, 0.2)
+        scheduler.arrive(1007, 0.7)
+        self.assertEqual(5, scheduler.stride)
+
+        scheduler.reset()
+        self.assertEqual(1, scheduler.stride)
+        self.assertTrue(scheduler.full)
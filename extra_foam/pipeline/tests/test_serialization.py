@@ -0,0 +1,79 @@
+import unittest
+import multiprocessing as mp
+from queue import Empty, Full
+
+import numpy as np
+
+from extra_foam.pipeline.f_serialization import (
+    deserialize, OutOfBandQueue, serialize
+)
+from extra_foam.pipeline.data_model import ProcessedData
+
+
+def _echo(queue_in, queue_out):
+    queue_out.put_nowait(queue_in.get(timeout=5))
+
+
+class TestSerialization(unittest.TestCase):
+    def testOutOfBand(self):
+        processed = ProcessedData(1001)
+        processed.image.images = [np.ones((10, 10))]
+        data = {'processed': processed,
+                'array': np.arange(100, dtype=np.float32),
+                'transposed': np.arange(12).reshape(3, 4).T}
+
+        skeleton, buffers = serialize(data)
+        self.assertGreaterEqual(len(buffers), 3)
+        # arrays are not in the skeleton
+        self.assertNotIn(data['array'].tobytes(), skeleton)
+
+        out = deserialize(skeleton, [bytearray(b) for b in buffers])
+        self.assertEqual(1001, out['processed'].tid)
+        np.testing.assert_array_equal(data['array'], out['array'])
+        np.testing.assert_array_equal(data['transposed'], out['transposed'])
+        np.testing.assert_array_equal(np.ones((10, 10)),
+                                      out['processed'].image.images[0])
+
+
+class TestOutOfBandQueue(unittest.TestCase):
+    def testGeneral(self):
+        queue = OutOfBandQueue(maxsize=2)
+        with self.assertRaises(Empty):
+            queue.get_nowait()
+        with self.assertRaises(Empty):
+            queue.get(timeout=0.01)
+
+        data = np.random.rand(100, 100)
+        queue.put_nowait({'data': data, 'empty': np.array([]), 'tid': 1})
+        queue.put_nowait({'data': data.T, 'tid': 2})
+        with self.assertRaises(Full):
+            queue.put_nowait(data)
+        with self.assertRaises(Full):
+            queue.put(data, timeout=0.01)
+
+        out = queue.get(timeout=1)
+        self.assertEqual(1, out['tid'])
+        np.testing.assert_array_equal(data, out['data'])
+        self.assertEqual(0, out['empty'].size)
+        self.assertTrue(out['data'].flags.writeable)
+        out = queue.get(timeout=1)
+        self.assertEqual(2, out['tid'])
+        np.testing.assert_array_equal(data.T, out['data'])
+
+        # a place is released after get
+        queue.put_nowait(data)
+        # the item will never be received
+        queue.cancel_join_thread()
+
+    def testMultiProcesses(self):
+        queue_in = OutOfBandQueue(maxsize=1)
+        queue_out = OutOfBandQueue(maxsize=1)
+
+        proc = mp.Process(target=_echo, args=(queue_in, queue_out))
+        proc.start()
+
+        data = np.random.rand(1000, 300)
+        queue_in.put_nowait(data)
+        out = queue_out.get(timeout=5)
+        proc.join()
+        np.testing.assert_array_equal(data, out)
@@ -0,0 +1,76 @@
+import unittest
+import multiprocessing as mp
+from queue import Empty, Full
+
+import numpy as np
+
+from extra_foam.pipeline.f_shm import SharedMemoryRing
+
+
+def _echo(ring_in, ring_out):
+    ring_out.put_nowait(ring_in.get(timeout=5))
+
+
+class TestSharedMemoryRing(unittest.TestCase):
+    def _get(self, ring):
+        # multiprocessing.Queue uses a feeder thread
+        return ring.get(timeout=1)
+
+    def testGeneral(self):
+        ring = SharedMemoryRing(2, 1024 ** 2, min_array_size=1024)
+        self.assertEqual(2, ring.n_slots)
+        self.assertEqual(1024 ** 2, ring.slot_size)
+
+        with self.assertRaises(Empty):
+            ring.get_nowait()
+
+        large = np.arange(100 * 100, dtype=np.float32).reshape(100, 100)
+        small = np.ones(10)
+        ring.put_nowait({'large': large, 'small': small, 'tid': 1001,
+                         'transposed': large.T})
+
+        out = self._get(ring)
+        self.assertEqual(1001, out['tid'])
+        np.testing.assert_array_equal(large, out['large'])
+        np.testing.assert_array_equal(large.T, out['transposed'])
+        np.testing.assert_array_equal(small, out['small'])
+        self.assertEqual(np.float32, out['large'].dtype)
+        # data must be copied out of the slot
+        self.assertFalse(np.shares_memory(out['large'], ring._buffer(0)))
+        self.assertTrue(out['large'].flags.writeable)
+
+    def testFull(self):
+        ring = SharedMemoryRing(2, 1024 ** 2, min_array_size=1024)
+        data = np.zeros((100, 100))
+        ring.put_nowait(data)
+        ring.put_nowait(data)
+        with self.assertRaises(Full):
+            ring.put_nowait(data)
+        with self.assertRaises(Full):
+            ring.put(data, timeout=0.01)
+
+        # slot is released after get
+        self._get(ring)
+        ring.put_nowait(data)
+
+    def testFallbackInBand(self):
+        # the second array does not fit into the slot
+        ring = SharedMemoryRing(1, 50000, min_array_size=1024)
+        data = [np.ones(5000), np.ones(5000) * 2]
+        ring.put_nowait(data)
+        out = self._get(ring)
+        np.testing.assert_array_equal(data[0], out[0])
+        np.testing.assert_array_equal(data[1], out[1])
+
+    def testMultiProcesses(self):
+        ring_in = SharedMemoryRing(1, 1024 ** 2)
+        ring_out = SharedMemoryRing(1, 1024 ** 2)
+
+        proc = mp.Process(target=_echo, args=(ring_in, ring_out))
+        proc.start()
+
+        data = np.random.rand(200, 300)
+        ring_in.put_nowait(data)
+        out = ring_out.get(timeout=5)
+        proc.join()
+        np.testing.assert_array_equal(data, out)
@@ -0,0 +1,38 @@
+import unittest
+from unittest.mock import patch
+
+from extra_foam.config import config
+from extra_foam.pipeline.f_trace import TrainTrace
+
+
+class TestTrainTrace(unittest.TestCase):
+    def testSampling(self):
+        with patch.dict(config._data, {"PIPELINE_TRACE_SAMPLING": 10}):
+            self.assertIsNone(TrainTrace.sampled(1001))
+            trace = TrainTrace.sampled(1010)
+            self.assertEqual(1010, trace.tid)
+            self.assertListEqual([], trace.spans)
+
+        with patch.dict(config._data, {"PIPELINE_TRACE_SAMPLING": 0}):
+            self.assertIsNone(TrainTrace.sampled(1010))
+
+    @patch("extra_foam.pipeline.f_trace.time.time")
+    def testSpans(self, now):
+        trace = TrainTrace(1001)
+
+        trace.add("Bridge", 1.0, 1.5)
+        now.return_value = 3.0
+        trace.add("Correlation", 1.0)
+
+        now.side_effect = [3.5, 4.0]
+        with trace.span("ImageProcessor"):
+            pass
+
+        self.assertDictEqual({
+            'tid': 1001,
+            'spans': [["Bridge", 1.0, 1.5],
+                      ["Correlation", 1.0, 3.0],
+                      ["ImageProcessor", 3.5, 4.0]]
+        }, trace.to_dict())
+        self.assertDictEqual({'Bridge': 0.5, 'Correlation': 2.0,
+                              'ImageProcessor': 0.5}, trace.durations())
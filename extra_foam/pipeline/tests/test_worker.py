@@ -2,7 +2,9 @@ import unittest
 from unittest.mock import MagicMock, patch
 import multiprocessing as mp
 
-from extra_foam.pipeline.exceptions import ProcessingError, StopPipelineError
+from extra_foam.pipeline.exceptions import (
+    ProcessingError, SkipTrainError, StopPipelineError
+)
 from extra_foam.pipeline.worker import TrainWorker, PulseWorker
 from extra_foam.config import config
 
@@ -49,3 +51,29 @@ class TestWorker(unittest.TestCase):
                 worker._run_tasks({})
             debug.reset_mock()
             error.reset_mock()
+
+    @patch('extra_foam.ipc.ProcessLogger.debug')
+    @patch('extra_foam.ipc.ProcessLogger.error')
+    def testRunTasksInParallelPulseWorker(self, error, debug):
+        worker = PulseWorker(self._pause_ev, self._close_ev, index=1)
+        for proc in worker._tasks:
+            proc.update = MagicMock()
+            proc.process = MagicMock()
+
+        processed = MagicMock()
+        processed.tid = 1001
+
+        worker._run_tasks({'processed': processed, 'worker': 1})
+        for proc in worker._tasks:
+            proc.process.assert_called_once()
+            proc.process.reset_mock()
+
+        # the train is owned by another worker
+        with self.assertRaises(SkipTrainError):
+            worker._run_tasks({'processed': processed, 'worker': 0})
+        for proc in worker._tasks:
+            if proc in worker._sync_tasks:
+                proc.process.assert_called_once()
+            else:
+                proc.process.assert_not_called()
+        error.assert_not_called()
@@ -1,5 +1,5 @@
 import unittest
-from threading import Thread
+from threading import Event, Thread
 
 import zmq
 import msgpack
@@ -13,67 +13,117 @@ def _simple_data_in_karabo(src):
     return meta, data
 
 
+def _get_free_tcp_port():
+    import socket
+
+    tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tcp.bind(('', 0))
+    _, port = tcp.getsockname()
+    tcp.close()
+    return port
+
+
 class TestZmq(unittest.TestCase):
 
     class Server(Thread):
-        def __init__(self, ctx, endpoint, *, src='A'):
+        def __init__(self, ctx, endpoint, *, src='A', stalled=False):
             super().__init__()
             self._socket = ctx.socket(zmq.REP)
+            self._socket.setsockopt(zmq.LINGER, 0)
             self._socket.bind(endpoint)
             self.dumps = msgpack.Packer(use_bin_type=True).pack
 
             self._src = src
+            self._stalled = stalled
+            self._stop_ev = Event()
 
         def run(self):
-            for i in range(4):
+            while not self._stop_ev.is_set():
+                if self._stalled or not self._socket.poll(timeout=10):
+                    self._stop_ev.wait(0.01)
+                    continue
+
                 #  Wait for next request from client
                 message = self._socket.recv()
                 if message == b"next":
                     #  Send reply back to client
                     meta, data = _simple_data_in_karabo(self._src)
                     self._socket.send_multipart([self.dumps(meta), self.dumps(data)])
+            self._socket.close()
 
-    def testMultiServerConnection(self):
-        import socket
-
-        def _get_free_tcp_port():
-            tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            tcp.bind(('', 0))
-            _, port = tcp.getsockname()
-            tcp.close()
-            return port
+        def stop(self):
+            self._stop_ev.set()
+            self.join()
 
-        endpoints = []
+    def setUp(self):
+        self._ctx = zmq.Context()
+        self._servers = []
 
-        proxy = BridgeProxy()
-        ctx = zmq.Context()
+    def tearDown(self):
+        for server in self._servers:
+            server.stop()
+        self._ctx.destroy(linger=0)
 
-        # start 3 'REP' server
-        for src in ['A', 'B', 'C']:
+    def _start_servers(self, srcs, stalled=()):
+        endpoints = []
+        for src in srcs:
             endpoint = f"tcp://127.0.0.1:{_get_free_tcp_port()}"
-            server = self.Server(ctx, endpoint, src=src)
+            server = self.Server(self._ctx, endpoint, src=src,
+                                 stalled=src in stalled)
             server.start()
+            self._servers.append(server)
             endpoints.append(endpoint)
+        return endpoints
+
+    def testMultiServerConnection(self):
+        endpoints = self._start_servers(['A', 'B', 'C'])
 
+        proxy = BridgeProxy()
         for _ in range(2):
             proxy.connect(endpoints)
             proxy.start()  # run in thread
+            self.assertTrue(proxy.connected)
 
             data = []
-            for i in range(6):
-                data.append(proxy.client.next())
-
-            # data in different servers will arrive in turn
-            self.assertEqual(
-                [({'A': {'a': 1, 'b': 2}}, {'A': {}}),
-                 ({'B': {'a': 1, 'b': 2}}, {'B': {}}),
-                 ({'C': {'a': 1, 'b': 2}}, {'C': {}}),
-                 ({'A': {'a': 1, 'b': 2}}, {'A': {}}),
-                 ({'B': {'a': 1, 'b': 2}}, {'B': {}}),
-                 ({'C': {'a': 1, 'b': 2}}, {'C': {}})], data)
+            for i in range(30):
+                data.append(proxy.next(timeout=1, with_endpoint=True))
+
+            # data from all the servers arrive
+            srcs = set()
+            for end, (raw, meta) in data:
+                src = next(iter(raw))
+                self.assertDictEqual({src: {'a': 1, 'b': 2}}, raw)
+                self.assertDictEqual({src: {}}, meta)
+                self.assertEqual(endpoints.index(end), 'ABC'.index(src))
+                srcs.add(src)
+            self.assertSetEqual({'A', 'B', 'C'}, srcs)
 
             # test stop and connect again
             proxy.stop()
-            self.assertIsNone(proxy._client)
+            self.assertFalse(proxy.connected)
+
+    def testStalledServer(self):
+        endpoints = self._start_servers(['A', 'B', 'C'], stalled=['B'])
+
+        proxy = BridgeProxy()
+        proxy.connect(endpoints)
+        proxy.start()
+
+        srcs = set()
+        for i in range(10):
+            raw, _ = proxy.next(timeout=1)
+            srcs.add(next(iter(raw)))
+        # the stalled server does not block the others
+        self.assertSetEqual({'A', 'C'}, srcs)
+
+        proxy.stop()
+
+    def testTimeout(self):
+        proxy = BridgeProxy()
+        proxy.connect(self._start_servers(['A'], stalled=['A']))
+        proxy.start()
+
+        with self.assertRaises(TimeoutError):
+            proxy.next(timeout=0.05)
 
-        ctx.destroy(linger=0)
+        proxy.stop()
@@ -11,11 +11,15 @@ import multiprocessing as mp
 from threading import Event
 from queue import Empty, Full
 import sys
-import traceback
 import time
+import traceback
 
-from .exceptions import StopPipelineError, ProcessingError
-from .pipe import KaraboBridge, MpInQueue, MpOutQueue
+from .exceptions import StopPipelineError, ProcessingError, SkipTrainError
+from .f_scheduler import TaskScheduler
+from .pipe import (
+    KaraboBridge, MpInMergeQueue, MpInQueue, MpInShmQueue,
+    MpOutDispatchQueue, MpOutQueue
+)
 from .processors import (
     DigitizerProcessor,
     AzimuthalIntegProcessorPulse, AzimuthalIntegProcessorTrain,
@@ -23,6 +27,7 @@ from .processors import (
     Broker,
     CorrelationProcessor,
     ImageAssemblerFactory,
+    assemble_deferred,
     ImageProcessor,
     CtrlDataProcessor,
     PostPulseFilter,
@@ -50,11 +55,17 @@ class ProcessWorker(mp.Process):
         register_foam_process(name, self)
 
         self._slow_policy = config["PIPELINE_SLOW_POLICY"]
+        # maximum time to block before checking the pause/close events
+        self._timeout = config["PIPELINE_WAIT_TIMEOUT"]
 
         self._input = None  # pipe-in
         self._output = None  # pipe-out
 
         self._tasks = []
+        # tasks which are only run for every k-th train when the worker
+        # cannot keep up with the arrival rate
+        self._scheduler = TaskScheduler(
+            max_stride=config["PIPELINE_DEGRADE_MAX_STRIDE"])
 
         self._pause_ev = pause_ev
         self._close_ev = close_ev
@@ -93,30 +104,43 @@ class ProcessWorker(mp.Process):
             if data_out is None:
                 try:
                     # get the data from pipe-in
-                    data_out = self._input.get()
+                    data_out = self._input.get(block=True,
+                                               timeout=self._timeout)
+                except Empty:
+                    continue
 
-                    try:
-                        self._run_tasks(data_out)
-                    except StopPipelineError:
-                        data_out = None
+                if self._slow_policy == PipelineSlowPolicy.DEGRADE:
+                    self._schedule(data_out['processed'].tid)
 
-                except Empty:
-                    pass
+                try:
+                    self._run_tasks(data_out)
+                except StopPipelineError:
+                    data_out = None
+                    continue
 
-            if data_out is not None:
-                # TODO: still put the data but signal the data has been dropped.
-                if self._slow_policy == PipelineSlowPolicy.WAIT:
-                    try:
-                        self._output.put(data_out)
-                        data_out = None
-                    except Full:
-                        pass
-                else:
-                    # always keep the latest data in the cache
-                    self._output.put_pop(data_out)
+            # TODO: still put the data but signal the data has been dropped.
+            if self._slow_policy != PipelineSlowPolicy.DROP:
+                try:
+                    self._output.put(data_out, block=True,
+                                     timeout=self._timeout)
                     data_out = None
+                except Full:
+                    pass
+            else:
+                # always keep the latest data in the cache
+                self._output.put_pop(data_out)
+                data_out = None
 
-            time.sleep(0.001)
+    def _schedule(self, tid):
+        """Decide whether to process the train fully.
+
+        :param int tid: train ID.
+        """
+        stride = self._scheduler.stride
+        self._scheduler.arrive(tid, time.monotonic())
+        if self._scheduler.stride != stride:
+            logger.info(f"{self._name}: process every "
+                        f"{self._scheduler.stride} train(s) fully")
 
     def _run_tasks(self, data):
         """Run all tasks for once:
@@ -124,25 +148,44 @@ class ProcessWorker(mp.Process):
         :param dict data: a dictionary which is passed around processors.
         """
         for task in self._tasks:
-            try:
-                task.run_once(data)
-            except StopPipelineError as e:
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                logger.debug(repr(traceback.format_tb(exc_traceback))
-                             + repr(e))
-                logger.error(repr(e))
-                raise
-            except ProcessingError as e:
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                logger.debug(repr(traceback.format_tb(exc_traceback))
-                             + repr(e))
-                logger.error(repr(e))
-            except Exception as e:
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                logger.debug(f"Unexpected Exception!: " +
-                             repr(traceback.format_tb(exc_traceback)) +
-                             repr(e))
-                logger.error(repr(e))
+            self._run_task(task, data)
+
+    def _run_task(self, task, data):
+        """Run a task for once.
+
+        :param _BaseProcessor task: processor.
+        :param dict data: a dictionary which is passed around processors.
+        """
+        if self._scheduler.skip(task):
+            return
+
+        trace = data.get('trace')
+        if trace is not None:
+            trace_t0 = time.time()
+        t0 = time.perf_counter()
+        try:
+            task.run_once(data)
+        except StopPipelineError as e:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            logger.debug(repr(traceback.format_tb(exc_traceback))
+                         + repr(e))
+            logger.error(repr(e))
+            raise
+        except ProcessingError as e:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            logger.debug(repr(traceback.format_tb(exc_traceback))
+                         + repr(e))
+            logger.error(repr(e))
+        except Exception as e:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            logger.debug(f"Unexpected Exception!: " +
+                         repr(traceback.format_tb(exc_traceback)) +
+                         repr(e))
+            logger.error(repr(e))
+        finally:
+            self._scheduler.record(task, time.perf_counter() - t0)
+            if trace is not None:
+                trace.add(task.__class__.__name__, trace_t0)
 
     @property
     def closing(self):
@@ -158,41 +201,127 @@ class ProcessWorker(mp.Process):
     def notify_update(self):
         self._input_update_ev.set()
         self._output_update_ev.set()
+        self._scheduler.reset()
 
 
-class PulseWorker(ProcessWorker):
-    """Pipeline worker for pulse-resolved data."""
+class PulseDispatcher(ProcessWorker):
+    """Pipeline worker which dispatches trains to pulse workers.
+
+    It is only used when there are more than one pulse worker. It runs
+    the processors which are cheap and need to see every train, e.g. the
+    ones calculating moving averages.
+    """
     def __init__(self, pause_ev, close_ev):
         """Initialization."""
-        super().__init__('pulse worker', pause_ev, close_ev)
+        super().__init__('pulse dispatcher', pause_ev, close_ev)
 
         self._input = KaraboBridge(self._input_update_ev, pause_ev, close_ev)
-        self._output = MpOutQueue(self._output_update_ev, pause_ev, close_ev)
+        self._output = MpOutDispatchQueue(
+            self._output_update_ev, pause_ev, close_ev)
 
         self._broker = Broker()
         self._ctrl_data_proc = CtrlDataProcessor()
         self._xgm_proc = XgmProcessor()
         self._digitizer_proc = DigitizerProcessor()
+
+        self._tasks = [
+            self._broker,
+            self._xgm_proc,
+            self._digitizer_proc,
+            self._ctrl_data_proc,
+        ]
+
+
+class PulseWorker(ProcessWorker):
+    """Pipeline worker for pulse-resolved data."""
+    def __init__(self, pause_ev, close_ev, *, index=None):
+        """Initialization.
+
+        :param int index: index of the worker if it is one of the pulse
+            workers which receive data from a PulseDispatcher. None for
+            the only pulse worker which receives data from the bridge.
+        """
+        if index is None:
+            super().__init__('pulse worker', pause_ev, close_ev)
+        else:
+            super().__init__(f'pulse worker {index}', pause_ev, close_ev)
+
+        self._index = index
+
+        if index is None:
+            self._input = KaraboBridge(
+                self._input_update_ev, pause_ev, close_ev)
+        else:
+            in_queue = MpInShmQueue if config["PIPELINE_SHM_ENABLED"] \
+                else MpInQueue
+            self._input = in_queue(self._input_update_ev, pause_ev, close_ev)
+        self._output = MpOutQueue(self._output_update_ev, pause_ev, close_ev)
+
+        self._tasks = []
+        if index is None:
+            # these processors run in the PulseDispatcher otherwise
+            self._broker = Broker()
+            self._ctrl_data_proc = CtrlDataProcessor()
+            self._xgm_proc = XgmProcessor()
+            self._digitizer_proc = DigitizerProcessor()
+
+            self._tasks.extend([
+                self._broker,
+                self._xgm_proc,
+                self._digitizer_proc,
+                self._ctrl_data_proc,
+            ])
+
         self._assembler = ImageAssemblerFactory.create(config['DETECTOR'])
         self._image_proc = ImageProcessor()
+        # the ImageProcessor positions the modules and applies the
+        # gain/offset correction in a single pass
+        self._assembler.defer()
         self._image_roi = ImageRoiPulse()
         self._ai_proc = AzimuthalIntegProcessorPulse()
         self._post_pulse_filter = PostPulseFilter()
         self._pp_proc = PumpProbeProcessor()
 
-        self._tasks = [
-            self._broker,
-            self._xgm_proc,
-            self._digitizer_proc,
-            self._ctrl_data_proc,
+        self._tasks.extend([
             self._assembler,
             self._image_proc,
             self._image_roi,
             self._ai_proc,
             self._post_pulse_filter,
             self._pp_proc,
+        ])
+
+        self._scheduler.set_optional_tasks([self._ai_proc])
+
+        # tasks for trains owned by the other pulse workers
+        self._sync_tasks = [
+            self._assembler,
+            self._image_proc,
         ]
 
+    def _run_task(self, task, data):
+        """Override."""
+        super()._run_task(task, data)
+
+        if task is self._image_proc:
+            # in case the ImageProcessor was skipped or failed before it
+            # positioned the modules
+            assemble_deferred(data)
+
+    def _run_tasks(self, data):
+        """Override."""
+        owner = data.get('worker', self._index)
+        if owner == self._index:
+            super()._run_tasks(data)
+            return
+
+        # The train is owned by another pulse worker. It is only used to
+        # keep the states, e.g. dark, of all the pulse workers the same.
+        for task in self._sync_tasks:
+            self._run_task(task, data)
+        raise SkipTrainError(f"Train {data['processed'].tid} is owned by "
+                             f"pulse worker {owner}")
+
 
 class TrainWorker(ProcessWorker):
     """Pipeline worker for train-resolved data."""
@@ -200,7 +329,13 @@ class TrainWorker(ProcessWorker):
         """Initialization."""
         super().__init__('train worker', pause_ev, close_ev)
 
-        self._input = MpInQueue(self._input_update_ev, pause_ev, close_ev)
+        if config["PIPELINE_N_PULSE_WORKERS"] > 1:
+            in_queue = MpInMergeQueue
+        elif config["PIPELINE_SHM_ENABLED"]:
+            in_queue = MpInShmQueue
+        else:
+            in_queue = MpInQueue
+        self._input = in_queue(self._input_update_ev, pause_ev, close_ev)
         self._output = MpOutQueue(self._output_update_ev, pause_ev, close_ev,
                                   final=True)
 
@@ -221,3 +356,5 @@ class TrainWorker(ProcessWorker):
             self._binning_proc,
             self._tr_xas,
         ]
+
+        self._scheduler.set_optional_tasks([self._ai_proc])
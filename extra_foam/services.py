@@ -24,10 +24,10 @@ import redis
 from . import __version__
 from .config import AnalysisType, config, PipelineSlowPolicy
 from .database import Metadata as mt
-from .ipc import init_redis_connection
+from .ipc import init_redis_connection, redis_unix_socket_path
 from .logger import logger
 from .gui import MainGUI, mkQApp
-from .pipeline import PulseWorker, TrainWorker
+from .pipeline import PulseDispatcher, PulseWorker, TrainWorker
 from .processes import register_foam_process
 from .utils import check_system_resource, query_yes_no
 from .gui.windows import FileStreamControllerWindow
@@ -103,6 +103,8 @@ def start_redis_server(host='127.0.0.1', port=6379, *, password=None):
         password = ''
     command = [executable,
                "--port", str(port),
+               "--unixsocket", redis_unix_socket_path(port),
+               "--unixsocketperm", "700",
                "--requirepass", password,
                "--loglevel", "warning",
                "--logfile", config["REDIS_LOGFILE"]]
@@ -274,9 +276,24 @@ class Foam:
             self._pause_ev = mp.Event()
             self._close_ev = mp.Event()
 
-            self.pulse_worker = PulseWorker(self._pause_ev, self._close_ev)
+            n_pulse_workers = config["PIPELINE_N_PULSE_WORKERS"]
+            if n_pulse_workers > 1:
+                self.pulse_dispatcher = PulseDispatcher(
+                    self._pause_ev, self._close_ev)
+                self.pulse_workers = [
+                    PulseWorker(self._pause_ev, self._close_ev, index=i)
+                    for i in range(n_pulse_workers)]
+                for worker in self.pulse_workers:
+                    worker.input.connect(self.pulse_dispatcher.output)
+            else:
+                self.pulse_dispatcher = None
+                self.pulse_workers = [
+                    PulseWorker(self._pause_ev, self._close_ev)]
+            self.pulse_worker = self.pulse_workers[0]
+
             self.train_worker = TrainWorker(self._pause_ev, self._close_ev)
-            self.train_worker.input.connect(self.pulse_worker.output)
+            for worker in self.pulse_workers:
+                self.train_worker.input.connect(worker.output)
 
             self._gui = MainGUI(self._pause_ev, self._close_ev)
             self._gui.input.connect(self.train_worker.output)
@@ -294,7 +311,10 @@ class Foam:
         self._gui.stop_sgn.connect(self._pause_ev.clear)
         self._gui.start()
 
-        self.pulse_worker.start()
+        if self.pulse_dispatcher is not None:
+            self.pulse_dispatcher.start()
+        for worker in self.pulse_workers:
+            worker.start()
         self.train_worker.start()
 
         return self
@@ -323,9 +343,16 @@ def application():
     parser.add_argument("--pipeline_slow_policy",
                         help="Pipeline policy when the processing rate is "
                              "slower than the arrival rate (0 for always "
-                             "process the latest data and 1 for wait until "
-                             "processing of the current data finishes)",
-                        choices=[0, 1],
+                             "process the latest data, 1 for wait until "
+                             "processing of the current data finishes and "
+                             "2 for wait but only process every k-th train "
+                             "fully)",
+                        choices=[0, 1, 2],
+                        default=1,
+                        type=int)
+    parser.add_argument("--n_pulse_workers",
+                        help="Number of processes for processing "
+                             "pulse-resolved data",
                         default=1,
                         type=int)
     parser.add_argument("--redis_address", help="Address of the Redis server",
@@ -355,7 +382,8 @@ def application():
 
     # update global configuration
     config.load(detector, topic,
-                PIPELINE_SLOW_POLICY=PipelineSlowPolicy(args.pipeline_slow_policy))
+                PIPELINE_SLOW_POLICY=PipelineSlowPolicy(args.pipeline_slow_policy),
+                PIPELINE_N_PULSE_WORKERS=args.n_pulse_workers)
 
     foam = Foam(redis_address=redis_address).init()
 
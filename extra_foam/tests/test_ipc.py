@@ -1,14 +1,23 @@
 import unittest
-from unittest.mock import patch
+import os.path as osp
+from queue import Empty, Full
+import socket
+import tempfile
+from threading import Barrier, Thread as RealThread
+from unittest.mock import call, MagicMock, patch
 import time
 
+import numpy as np
+
 from redis.client import PubSub, Redis
 
+from extra_foam.config import config
 from extra_foam.logger import logger
 from extra_foam.services import start_redis_server
 from extra_foam.ipc import (
-    init_redis_connection, redis_connection, RedisConnection, RedisSubscriber,
-    RedisPSubscriber, _global_connections
+    init_redis_connection, redis_connection, ProcessLogger, RedisConnection,
+    RedisSubscriber, RedisPSubscriber, SharedArrayWriter,
+    _global_connections, _is_local_host, read_shared_array
 )
 from extra_foam.pipeline.worker import ProcessWorker
 from extra_foam.processes import wait_until_redis_shutdown
@@ -16,6 +25,35 @@ from extra_foam.processes import wait_until_redis_shutdown
 logger.setLevel("CRITICAL")
 
 
+class TestSharedArray(unittest.TestCase):
+    def testWriteAndRead(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with patch.dict(config._data, {"PIPELINE_SHM_DIR": tmp_dir}):
+                writer = SharedArrayWriter()
+                a = np.arange(12, dtype=np.float32).reshape(3, 4)
+                path1 = writer.write("abc:efg", a)
+                self.assertEqual(tmp_dir, osp.dirname(path1))
+
+                b = read_shared_array(path1)
+                self.assertIs(np.ndarray, type(b))
+                np.testing.assert_array_equal(a, b)
+                # copy-on-write
+                b[0, 0] = 100
+                np.testing.assert_array_equal(a, read_shared_array(path1))
+
+                # the previous segment is unlinked
+                path2 = writer.write("abc:efg", 2 * a)
+                self.assertNotEqual(path1, path2)
+                self.assertFalse(osp.exists(path1))
+                np.testing.assert_array_equal(2 * a, read_shared_array(path2))
+                # but the mapped one is still valid
+                self.assertEqual(100, b[0, 0])
+
+                writer.remove("abc:efg")
+                with self.assertRaises(FileNotFoundError):
+                    read_shared_array(path2)
+
+
 class TestRedisConnection(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -150,3 +188,112 @@ class TestRedisConnection(unittest.TestCase):
         self.assertIsNone(_global_connections['RedisSubscriber'][0]()._sub)
         self.assertIsNone(_global_connections['RedisPSubscriber'][0]()._sub)
         self.assertIsNone(_global_connections['RedisPSubscriber'][0]()._sub)
+
+
+class TestUnixSocketConnection(unittest.TestCase):
+    def testLocalHost(self):
+        self.assertTrue(_is_local_host('127.0.0.1'))
+        self.assertTrue(_is_local_host('localhost'))
+        self.assertTrue(_is_local_host(socket.gethostname()))
+
+    @patch("extra_foam.ipc.redis.Redis")
+    def testInitConnection(self, client):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = osp.join(tmp_dir, "redis.sock")
+            with patch.dict(config._data,
+                            {"REDIS_UNIX_DOMAIN_SOCKET_PATH": path}):
+                # socket does not exist
+                init_redis_connection('127.0.0.1', 6379, password='abc')
+                client.assert_called_with(
+                    host='127.0.0.1', port=6379, password='abc',
+                    decode_responses=False)
+
+                server = socket.socket(socket.AF_UNIX)
+                server.bind(path)
+                try:
+                    client.reset_mock()
+                    init_redis_connection('127.0.0.1', 6379, password='abc')
+                    self.assertEqual(2, client.call_count)
+                    client.assert_any_call(
+                        unix_socket_path=path, password='abc',
+                        decode_responses=True)
+
+                    # remote server
+                    with patch("extra_foam.ipc._is_local_host",
+                               return_value=False):
+                        init_redis_connection('10.0.0.1', 6379)
+                        client.assert_called_with(
+                            host='10.0.0.1', port=6379, password=None,
+                            decode_responses=False)
+                finally:
+                    server.close()
+
+
+class TestProcessLogger(unittest.TestCase):
+    @patch("extra_foam.ipc.Thread")
+    @patch("extra_foam.ipc.redis_connection")
+    def testBatchAndCollapse(self, connection, thread):
+        pipe = connection.return_value.pipeline.return_value
+
+        logger_ = ProcessLogger()
+        logger_.REPEAT_INTERVAL = 10
+
+        logger_.info("Train 1001 processed!")
+        # publish in a background thread
+        thread.return_value.start.assert_called_once()
+
+        for _ in range(300):
+            logger_.error("ROI FOM is not available")
+        logger_.info("Train 1002 processed!")
+        logger_._flush([])
+        pipe.publish.assert_has_calls([
+            call("log:info", "Train 1001 processed!"),
+            call("log:error", "ROI FOM is not available"),
+            call("log:info", "Train 1002 processed!")])
+        self.assertEqual(3, pipe.publish.call_count)
+        pipe.execute.assert_called_once()
+
+        # repetitions are published as a count
+        pipe.reset_mock()
+        logger_.flush()
+        pipe.publish.assert_called_once_with(
+            "log:error", "ROI FOM is not available (x299)")
+
+        # messages are dropped when the queue is full
+        pipe.reset_mock()
+        logger_._queue = MagicMock()
+        logger_._queue.put_nowait.side_effect = Full
+        logger_._queue.get_nowait.side_effect = Empty
+        logger_.error("ROI FOM is not available")
+        logger_.flush()
+        pipe.publish.assert_called_once_with(
+            "log:warning", "1 log messages dropped!")
+
+    @patch("extra_foam.ipc.Thread")
+    @patch("extra_foam.ipc.redis_connection")
+    def testLogFromThreads(self, connection, thread):
+        pipe = connection.return_value.pipeline.return_value
+
+        logger_ = ProcessLogger()
+        logger_.MAX_QUEUE_SIZE = 10
+        barrier = Barrier(4)
+
+        def log():
+            barrier.wait()
+            for i in range(100):
+                logger_.info(f"Train {i} processed!")
+
+        threads = [RealThread(target=log) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # the publishing thread is started only once
+        thread.return_value.start.assert_called_once()
+        self.assertEqual(10, logger_._queue.qsize())
+        self.assertEqual(390, logger_._n_dropped)
+
+        logger_.flush()
+        pipe.publish.assert_any_call("log:warning", "390 log messages dropped!")
+        self.assertEqual(0, logger_._n_dropped)
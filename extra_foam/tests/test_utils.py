@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import patch
+from threading import Barrier, Thread as RealThread
+
+from extra_foam.utils import (
+    LatencyHistogram, _ProfilerRegistry, profiler, profiler_registry
+)
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def testPercentiles(self):
+        hist = LatencyHistogram()
+        self.assertIsNone(hist.percentile(50))
+        self.assertDictEqual({'count': 0}, hist.snapshot())
+
+        for _ in range(98):
+            hist.record(0.001)
+        hist.record(0.1)
+        hist.record(1000.)  # larger than MAX_LATENCY
+
+        snapshot = hist.snapshot()
+        self.assertEqual(100, snapshot['count'])
+        self.assertEqual(1000., snapshot['max'])
+        self.assertAlmostEqual((0.098 + 0.1 + 1000.) / 100, snapshot['mean'])
+        # the relative error is less than 19%
+        self.assertTrue(0.001 <= snapshot['p50'] < 0.00119)
+        self.assertTrue(0.001 <= snapshot['p95'] < 0.00119)
+        self.assertTrue(0.1 <= snapshot['p99'] < 0.119)
+        self.assertEqual(1000., hist.percentile(100))
+
+        hist.record(1e-7)  # smaller than MIN_LATENCY
+        self.assertEqual(hist.MIN_LATENCY, hist.percentile(0))
+
+        self.assertEqual(101, hist.snapshot(reset=True)['count'])
+        self.assertDictEqual({'count': 0}, hist.snapshot())
+        hist.record(0.001)
+
+        hist.reset()
+        self.assertEqual(0, hist.count)
+
+    @patch("extra_foam.utils.Thread")
+    def testProfiler(self, thread):
+        @profiler("Test profiler")
+        def f(a, b=1):
+            return a + b
+
+        self.assertEqual(3, f(1, b=2))
+        self.assertEqual(2, f(1))
+        self.assertEqual(2, profiler_registry.snapshot()["Test profiler"]['count'])
+
+        # the histograms are reset after being written into Redis
+        self.assertEqual(
+            2, profiler_registry.snapshot(reset=True)["Test profiler"]['count'])
+        self.assertEqual(0, profiler_registry.snapshot()["Test profiler"]['count'])
+
+    @patch("extra_foam.utils.Thread")
+    def testProfilerRegistryThreads(self, thread):
+        registry = _ProfilerRegistry()
+        barrier = Barrier(4)
+
+        def f(i):
+            barrier.wait()
+            for _ in range(100):
+                registry.histogram(f"h{i % 2}").record(0.001)
+
+        threads = [RealThread(target=f, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # the background thread is started only once
+        thread.assert_called_once()
+        snapshot = registry.snapshot()
+        self.assertEqual(200, snapshot["h0"]['count'])
+        self.assertEqual(200, snapshot["h1"]['count'])
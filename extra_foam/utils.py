@@ -9,21 +9,181 @@ All rights reserved.
 """
 import os
 import psutil
+import math
 import multiprocessing as mp
 import functools
 import subprocess
-from threading import RLock, Thread
+from threading import Lock, RLock, Thread
 import time
 
 from .logger import logger
 
 
-# profiler will only print out information if the execution of the given
-# function takes more than the threshold value.
-PROFILER_THREASHOLD = 1.0  # in ms
+# interval for writing the latency histograms of the profiled functions
+# into Redis, in second
+PROFILER_SNAPSHOT_INTERVAL = 5.0
+
+
+class LatencyHistogram:
+    """Histogram of latencies with fixed, logarithmically spaced buckets.
+
+    The upper bound of the i-th bucket is MIN_LATENCY * 2 ** (i / 4), so
+    that the relative error of the percentiles is less than 19%. The last
+    bucket also counts all the latencies larger than MAX_LATENCY.
+    """
+
+    MIN_LATENCY = 1e-5  # in second
+    MAX_LATENCY = 100.  # in second
+    _BUCKETS_PER_OCTAVE = 4
+
+    def __init__(self):
+        self._n_buckets = 1 + math.ceil(self._BUCKETS_PER_OCTAVE * math.log2(
+            self.MAX_LATENCY / self.MIN_LATENCY))
+        self._lock = Lock()
+        self._reset()
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._counts = [0] * self._n_buckets
+        self._count = 0
+        self._sum = 0.
+        self._max = 0.
+
+    def _upper_bound(self, i):
+        return self.MIN_LATENCY * 2 ** (i / self._BUCKETS_PER_OCTAVE)
+
+    def record(self, dt):
+        """Record a latency.
+
+        :param float dt: latency in second.
+        """
+        if dt <= self.MIN_LATENCY:
+            i = 0
+        else:
+            i = min(math.ceil(self._BUCKETS_PER_OCTAVE * math.log2(
+                dt / self.MIN_LATENCY)), self._n_buckets - 1)
+
+        with self._lock:
+            self._counts[i] += 1
+            self._count += 1
+            self._sum += dt
+            if dt > self._max:
+                self._max = dt
+
+    @property
+    def count(self):
+        return self._count
+
+    def percentile(self, q):
+        """Return the upper bound of the bucket of the q-th percentile.
+
+        :param float q: percentile in [0, 100].
+        """
+        if self._count == 0:
+            return None
+
+        threshold = q / 100. * self._count
+        n = 0
+        for i, c in enumerate(self._counts):
+            n += c
+            if n >= threshold and n > 0:
+                if i == self._n_buckets - 1:
+                    return self._max
+                return min(self._upper_bound(i), self._max)
+        return self._max
+
+    def snapshot(self, reset=False):
+        """Return the statistics of the latencies.
+
+        :param bool reset: True for resetting the histogram after taking
+            the snapshot.
+
+        :return dict: count, mean, p50, p95, p99 and max. The latencies
+            are in second.
+        """
+        with self._lock:
+            if self._count == 0:
+                return {'count': 0}
+
+            ret = {
+                'count': self._count,
+                'mean': self._sum / self._count,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+                'max': self._max,
+            }
+            if reset:
+                self._reset()
+            return ret
+
+
+class _ProfilerRegistry:
+    """Latency histograms of the profiled functions in a process.
+
+    The histograms are written into Redis and reset by a background
+    thread every PROFILER_SNAPSHOT_INTERVAL seconds, i.e. the statistics
+    are those of the latest interval.
+    """
+    def __init__(self):
+        self._pid = None
+        self._histograms = dict()
+        self._lock = Lock()
+
+    def histogram(self, info):
+        pid = os.getpid()
+        if self._pid == pid:
+            try:
+                return self._histograms[info]
+            except KeyError:
+                pass
+
+        with self._lock:
+            if self._pid != pid:
+                # do not inherit the histograms from the parent process
+                self._pid = pid
+                self._histograms = dict()
+                Thread(target=self._run, daemon=True).start()
+
+            return self._histograms.setdefault(info, LatencyHistogram())
+
+    def snapshot(self, reset=False):
+        """Return {name: statistics} of all the profiled functions.
+
+        :param bool reset: True for resetting the histograms after taking
+            the snapshots.
+        """
+        with self._lock:
+            histograms = list(self._histograms.items())
+        return {k: v.snapshot(reset=reset) for k, v in histograms}
+
+    def _run(self):
+        from .database import MonProxy
+
+        mon = MonProxy()
+        process = mp.current_process().name
+        while True:
+            time.sleep(PROFILER_SNAPSHOT_INTERVAL)
+            try:
+                mon.set_profiler_stats(process, self.snapshot(reset=True))
+            except Exception:
+                # e.g. no connection has been initialized in this process
+                pass
+
+
+profiler_registry = _ProfilerRegistry()
 
 
 def profiler(info, *, process_time=False):
+    """Record the latencies of a function in a histogram.
+
+    :param str info: name of the histogram.
+    :param bool process_time: True for measuring the process time
+        instead of the wall-clock time.
+    """
     def wrap(f):
         @functools.wraps(f)
         def timed_f(*args, **kwargs):
@@ -34,9 +194,7 @@ def profiler(info, *, process_time=False):
 
             t0 = timer()
             result = f(*args, **kwargs)
-            dt_ms = 1000 * (timer() - t0)
-            if dt_ms > PROFILER_THREASHOLD:
-                logger.debug(f"Process time spent on {info}: {dt_ms:.3f} ms")
+            profiler_registry.histogram(info).record(timer() - t0)
             return result
         return timed_f
     return wrap
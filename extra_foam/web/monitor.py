@@ -9,6 +9,7 @@ All rights reserved.
 """
 import sys
 import argparse
+from datetime import datetime
 
 import dash
 import dash_core_components as dcc
@@ -19,6 +20,7 @@ import plotly.graph_objs as go
 
 from ..ipc import init_redis_connection
 from ..database import Metadata, MetaProxy, MonProxy
+from ..database.mondata import PERFORMANCE_BUCKETS
 
 
 class Color:
@@ -94,6 +96,30 @@ def get_processor_params(proc=None):
     return [{'param': k, 'value': v} for k, v in query.items()]
 
 
+def get_latency_breakdown():
+    """Query and parse the latencies of the traced trains."""
+    query = mon_proxy.get_latency_breakdown()
+    if query is None:
+        return []
+    return [{'stage': stage, **{k: f"{1000 * v:.1f}" for k, v in stats.items()}}
+            for stage, stats in query]
+
+
+def get_profiler_stats():
+    """Query and parse the latency statistics of the profiled functions."""
+    query = mon_proxy.get_profiler_stats()
+    if query is None:
+        return []
+    ret = []
+    for process, name, stats in query:
+        row = {'process': process, 'name': name, 'count': stats['count']}
+        for k in ('p50', 'p95', 'p99', 'max'):
+            if k in stats:
+                row[k] = f"{1000 * stats[k]:.2f}"
+        ret.append(row)
+    return ret
+
+
 # define callback functions
 
 @app.callback(output=[Output('Detector', 'children'),
@@ -176,6 +202,83 @@ def update_performance(n_intervals):
     return figure
 
 
+@app.callback(output=Output('performance_history', 'figure'),
+              inputs=[Input('slow_interval', 'n_intervals')],
+              state=[State('bucket_radio', 'value')])
+def update_performance_history(n_intervals, bucket):
+    ret = mon_proxy.get_downsampled_records(bucket)
+    if ret is None:
+        raise dash.exceptions.PreventUpdate()
+
+    width = PERFORMANCE_BUCKETS[bucket][0]
+    times = [datetime.fromtimestamp(r['timestamp']) for r in ret]
+    traces = [
+        # the rate of the bucket being aggregated is not known yet
+        go.Scatter(x=times, y=[None if r.get('partial') else
+                               r['n_trains'] / width for r in ret],
+                   name='Processing rate (Hz)', mode='lines',
+                   line=dict(color=Color.GRAPH)),
+        go.Bar(x=times, y=[r['n_dropped'] for r in ret],
+               name='Dropped trains', yaxis='y2',
+               marker=dict(color=Color.TITLE)),
+    ]
+    stages = sorted({k for r in ret for k in r['durations']})
+    for stage in stages:
+        traces.append(go.Scatter(
+            x=times, y=[1000 * r['durations'].get(stage, float('nan'))
+                        for r in ret],
+            name=f"{stage} (ms)", mode='lines', yaxis='y3'))
+
+    figure = {
+        'data': traces,
+        'layout': {
+            'xaxis': {
+                'title': 'Time',
+                'domain': [0, 0.9],
+            },
+            'yaxis': {
+                'title': 'Processing rate (Hz)',
+            },
+            'yaxis2': {
+                'title': 'Dropped trains',
+                'overlaying': 'y',
+                'side': 'right',
+            },
+            'yaxis3': {
+                'title': 'Stage duration (ms)',
+                'overlaying': 'y',
+                'side': 'right',
+                'anchor': 'free',
+                'position': 1.,
+            },
+            'font': {
+                'family': 'Courier New, monospace',
+                'size': 16,
+                'color': Color.INFO,
+            },
+            'margin': {
+                'l': 100, 'b': 50, 't': 50, 'r': 50,
+            },
+            'paper_bgcolor': Color.SHADE,
+            'plot_bgcolor': Color.SHADE,
+        }
+    }
+
+    return figure
+
+
+@app.callback(output=Output('latency_table', 'data'),
+              inputs=[Input('slow_interval', 'n_intervals')])
+def update_latency_breakdown(n_intervals):
+    return get_latency_breakdown()
+
+
+@app.callback(output=Output('profiler_table', 'data'),
+              inputs=[Input('slow_interval', 'n_intervals')])
+def update_profiler_stats(n_intervals):
+    return get_profiler_stats()
+
+
 def get_monitor_layout():
     """define content and layout of the web page."""
     return html.Div(
@@ -208,6 +311,70 @@ def get_monitor_layout():
                     id='performance',
                 )]
             ),
+            html.Div(
+                children=[
+                    dcc.RadioItems(
+                        id='bucket_radio',
+                        options=[{'label': k, 'value': k}
+                                 for k in PERFORMANCE_BUCKETS],
+                        value='1s',
+                        labelStyle={'display': 'inline-block'},
+                    ),
+                    dcc.Graph(
+                        id='performance_history',
+                    ),
+                ]
+            ),
+            html.Div(
+                id='latency',
+                children=[
+                    dt.DataTable(
+                        id='latency_table',
+                        columns=[{'name': 'Stage', 'id': 'stage'},
+                                 {'name': 'p50 (ms)', 'id': 'p50'},
+                                 {'name': 'p95 (ms)', 'id': 'p95'},
+                                 {'name': 'p99 (ms)', 'id': 'p99'},
+                                 {'name': 'max (ms)', 'id': 'max'}],
+                        data=get_latency_breakdown(),
+                        style_header={
+                            'color': Color.TEXT,
+                        },
+                        style_cell={
+                            'backgroundColor': Color.BKG,
+                            'color': Color.INFO,
+                            'fontWeight': 'bold',
+                            'fontSize': '18px',
+                            'text-align': 'left',
+                        },
+                    ),
+                ]
+            ),
+            html.Div(
+                id='profiler',
+                children=[
+                    dt.DataTable(
+                        id='profiler_table',
+                        columns=[{'name': 'Process', 'id': 'process'},
+                                 {'name': 'Function', 'id': 'name'},
+                                 {'name': 'Count', 'id': 'count'},
+                                 {'name': 'p50 (ms)', 'id': 'p50'},
+                                 {'name': 'p95 (ms)', 'id': 'p95'},
+                                 {'name': 'p99 (ms)', 'id': 'p99'},
+                                 {'name': 'max (ms)', 'id': 'max'}],
+                        data=get_profiler_stats(),
+                        style_header={
+                            'color': Color.TEXT,
+                        },
+                        style_cell={
+                            'backgroundColor': Color.BKG,
+                            'color': Color.INFO,
+                            'fontWeight': 'bold',
+                            'fontSize': '18px',
+                            'text-align': 'left',
+                        },
+                    ),
+                ]
+            ),
             html.Div(
                 children=[
                     html.Div(
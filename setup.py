@@ -309,6 +309,7 @@ setup(
         'psutil>=5.6.2',
         'imageio>=2.5.0',
         'pyyaml>=5.2',
+        'pickle5>=0.0.9;python_version<"3.8"',
     ],
     extras_require={
         'docs': [
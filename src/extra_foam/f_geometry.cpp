@@ -21,6 +21,74 @@
 namespace py = pybind11;
 
 
+template<typename GeometryBase, typename T>
+void declare_positionAllModules(py::class_<GeometryBase>& base)
+{
+  // Modules with an integer dtype, e.g. raw data, are converted to float
+  // while being positioned, without an intermediate copy. Only the memory
+  // cells in "pulses" are positioned if it is not empty.
+  base.def("positionAllModules",
+    (void (GeometryBase::*)(const xt::pytensor<T, 4>&, xt::pytensor<float, 3>&,
+                            const std::vector<size_t>&) const)
+    &GeometryBase::positionAllModules,
+    py::arg("src").noconvert(), py::arg("dst").noconvert(),
+    py::arg("pulses") = std::vector<size_t>());
+  base.def("positionAllModules",
+    (void (GeometryBase::*)(const std::vector<xt::pytensor<T, 3>>&, xt::pytensor<float, 3>&,
+                            const std::vector<size_t>&) const)
+    &GeometryBase::positionAllModules,
+    py::arg("src").noconvert(), py::arg("dst").noconvert(),
+    py::arg("pulses") = std::vector<size_t>());
+
+  // Gain and/or offset correction is applied while positioning the modules.
+  base.def("positionAllModulesOffset",
+    (void (GeometryBase::*)(const xt::pytensor<T, 4>&, xt::pytensor<float, 3>&,
+                            const xt::pytensor<float, 3>&,
+                            const std::vector<size_t>&) const)
+    &GeometryBase::template positionAllModules<foam::OffsetPolicy>,
+    py::arg("src").noconvert(), py::arg("dst").noconvert(), py::arg("offset").noconvert(),
+    py::arg("pulses") = std::vector<size_t>());
+  base.def("positionAllModulesOffset",
+    (void (GeometryBase::*)(const std::vector<xt::pytensor<T, 3>>&, xt::pytensor<float, 3>&,
+                            const xt::pytensor<float, 3>&,
+                            const std::vector<size_t>&) const)
+    &GeometryBase::template positionAllModules<foam::OffsetPolicy>,
+    py::arg("src").noconvert(), py::arg("dst").noconvert(), py::arg("offset").noconvert(),
+    py::arg("pulses") = std::vector<size_t>());
+
+  base.def("positionAllModulesGain",
+    (void (GeometryBase::*)(const xt::pytensor<T, 4>&, xt::pytensor<float, 3>&,
+                            const xt::pytensor<float, 3>&,
+                            const std::vector<size_t>&) const)
+    &GeometryBase::template positionAllModules<foam::GainPolicy>,
+    py::arg("src").noconvert(), py::arg("dst").noconvert(), py::arg("gain").noconvert(),
+    py::arg("pulses") = std::vector<size_t>());
+  base.def("positionAllModulesGain",
+    (void (GeometryBase::*)(const std::vector<xt::pytensor<T, 3>>&, xt::pytensor<float, 3>&,
+                            const xt::pytensor<float, 3>&,
+                            const std::vector<size_t>&) const)
+    &GeometryBase::template positionAllModules<foam::GainPolicy>,
+    py::arg("src").noconvert(), py::arg("dst").noconvert(), py::arg("gain").noconvert(),
+    py::arg("pulses") = std::vector<size_t>());
+
+  base.def("positionAllModulesGainOffset",
+    (void (GeometryBase::*)(const xt::pytensor<T, 4>&, xt::pytensor<float, 3>&,
+                            const xt::pytensor<float, 3>&, const xt::pytensor<float, 3>&,
+                            const std::vector<size_t>&) const)
+    &GeometryBase::positionAllModules,
+    py::arg("src").noconvert(), py::arg("dst").noconvert(),
+    py::arg("gain").noconvert(), py::arg("offset").noconvert(),
+    py::arg("pulses") = std::vector<size_t>());
+  base.def("positionAllModulesGainOffset",
+    (void (GeometryBase::*)(const std::vector<xt::pytensor<T, 3>>&, xt::pytensor<float, 3>&,
+                            const xt::pytensor<float, 3>&, const xt::pytensor<float, 3>&,
+                            const std::vector<size_t>&) const)
+    &GeometryBase::positionAllModules,
+    py::arg("src").noconvert(), py::arg("dst").noconvert(),
+    py::arg("gain").noconvert(), py::arg("offset").noconvert(),
+    py::arg("pulses") = std::vector<size_t>());
+}
+
 template<typename Geometry>
 void declare_1MGeometry(py::module &m, std::string&& detector)
 {
@@ -29,22 +97,10 @@ void declare_1MGeometry(py::module &m, std::string&& detector)
 
   py::class_<GeometryBase> base(m, py_base_class_name.c_str());
 
-  base.def("positionAllModules",
-    (void (GeometryBase::*)(const xt::pytensor<float, 4>&, xt::pytensor<float, 3>&) const)
-    &GeometryBase::positionAllModules,
-    py::arg("src").noconvert(), py::arg("dst").noconvert());
-  base.def("positionAllModules",
-    (void (GeometryBase::*)(const xt::pytensor<uint16_t, 4>&, xt::pytensor<float, 3>&) const)
-    &GeometryBase::positionAllModules,
-    py::arg("src").noconvert(), py::arg("dst").noconvert());
-  base.def("positionAllModules",
-    (void (GeometryBase::*)(const std::vector<xt::pytensor<float, 3>>&, xt::pytensor<float, 3>&) const)
-    &GeometryBase::positionAllModules,
-    py::arg("src").noconvert(), py::arg("dst").noconvert());
-  base.def("positionAllModules",
-    (void (GeometryBase::*)(const std::vector<xt::pytensor<uint16_t, 3>>&, xt::pytensor<float, 3>&) const)
-    &GeometryBase::positionAllModules,
-    py::arg("src").noconvert(), py::arg("dst").noconvert());
+  declare_positionAllModules<GeometryBase, float>(base);
+  declare_positionAllModules<GeometryBase, uint16_t>(base);
+  declare_positionAllModules<GeometryBase, int16_t>(base);
+
   base.def("assembledShape", &GeometryBase::assembledShape)
     .def_readonly_static("n_quads", &GeometryBase::n_quads)
     .def_readonly_static("n_modules", &GeometryBase::n_modules)
@@ -73,4 +129,6 @@ PYBIND11_MODULE(geometry, m)
   declare_1MGeometry<foam::LPD_1MGeometry>(m, "LPD");
 
   declare_1MGeometry<foam::DSSC_1MGeometry>(m, "DSSC");
+
+  declare_1MGeometry<foam::AGIPD_1MGeometry>(m, "AGIPD");
 }
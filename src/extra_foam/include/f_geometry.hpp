@@ -13,6 +13,7 @@
 #include <cassert>
 #include <cmath>
 #include <array>
+#include <vector>
 #include <type_traits>
 #include <algorithm>
 
@@ -28,11 +29,101 @@
 #endif
 
 #include "f_traits.hpp"
-#include <algorithm>
+#include "f_imageproc.hpp"
 
 namespace foam
 {
 
+using stridesType = std::array<std::ptrdiff_t, 2>;
+
+/**
+ * Copy a run of pixels from a module to the assembled image.
+ */
+class CopyRunPolicy
+{
+public:
+
+  template<typename T, typename U>
+  void operator()(const T* src, std::ptrdiff_t src_step, U* dst, std::ptrdiff_t dst_step,
+                  const std::array<std::ptrdiff_t, 2>& pos, size_t n) const
+  {
+    // the source data type, e.g. uint16 for raw data, is converted on the fly
+    if (src_step == 1 && dst_step == 1)
+    {
+      std::transform(src, src + n, dst, [](T v) { return static_cast<U>(v); });
+    } else
+    {
+      for (size_t i = 0; i < n; ++i, src += src_step, dst += dst_step) *dst = static_cast<U>(*src);
+    }
+  }
+};
+
+/**
+ * Copy a run of pixels from a module to the assembled image and apply
+ * either gain or offset correction.
+ *
+ * @tparam Policy: correction policy (OffsetPolicy or GainPolicy)
+ */
+template<typename Policy, typename V>
+class CorrectRunPolicy
+{
+  const V* constants_;
+  stridesType strides_;
+
+public:
+
+  /**
+   * @param constants: pointer to the constants of the memory cell in the
+   *                   assembled layout.
+   * @param strides: strides (y, x) of the constants.
+   */
+  CorrectRunPolicy(const V* constants, const stridesType& strides)
+    : constants_(constants), strides_(strides) {}
+
+  template<typename T, typename U>
+  void operator()(const T* src, std::ptrdiff_t src_step, U* dst, std::ptrdiff_t dst_step,
+                  const std::array<std::ptrdiff_t, 2>& pos, size_t n) const
+  {
+    const V* c = constants_ + pos[0] * strides_[0] + pos[1] * strides_[1];
+    for (size_t i = 0; i < n; ++i, src += src_step, dst += dst_step, c += strides_[1])
+    {
+      *dst = Policy::correct(static_cast<U>(*src), static_cast<U>(*c));
+    }
+  }
+};
+
+/**
+ * Copy a run of pixels from a module to the assembled image and apply
+ * both gain and offset correction.
+ */
+template<typename V>
+class CorrectGainOffsetRunPolicy
+{
+  const V* gain_;
+  stridesType gain_strides_;
+  const V* offset_;
+  stridesType offset_strides_;
+
+public:
+
+  CorrectGainOffsetRunPolicy(const V* gain, const stridesType& gain_strides,
+                             const V* offset, const stridesType& offset_strides)
+    : gain_(gain), gain_strides_(gain_strides), offset_(offset), offset_strides_(offset_strides) {}
+
+  template<typename T, typename U>
+  void operator()(const T* src, std::ptrdiff_t src_step, U* dst, std::ptrdiff_t dst_step,
+                  const std::array<std::ptrdiff_t, 2>& pos, size_t n) const
+  {
+    const V* g = gain_ + pos[0] * gain_strides_[0] + pos[1] * gain_strides_[1];
+    const V* o = offset_ + pos[0] * offset_strides_[0] + pos[1] * offset_strides_[1];
+    for (size_t i = 0; i < n; ++i, src += src_step, dst += dst_step,
+                                   g += gain_strides_[1], o += offset_strides_[1])
+    {
+      *dst = static_cast<U>(*g) * (static_cast<U>(*src) - static_cast<U>(*o));
+    }
+  }
+};
+
 template<typename G>
 class Detector1MGeometryBase
 {
@@ -49,27 +140,65 @@ public:
   using shapeType = std::array<size_t, 2>;
   using vector2dType = std::array<double, 2>;
 
+  /**
+   * A run of pixels which are copied from a module to a row of the
+   * assembled image.
+   */
+  struct Run
+  {
+    std::array<std::ptrdiff_t, 2> src; // (ss, fs) index of the first source pixel
+    std::array<std::ptrdiff_t, 2> src_inc; // increment of the (ss, fs) index per pixel
+    std::array<std::ptrdiff_t, 2> dst; // (y, x) index of the first destination pixel
+    size_t length;
+  };
+
+  using runsType = std::array<std::vector<Run>, n_modules>;
+
   ~Detector1MGeometryBase() = default;
 
   /**
    * Position all the modules at the correct area of the given assembled image.
    *
    * @param src: multi-pulse, multiple-module data. shape=(memory cells, modules, y, x)
+   *             or a vector of module data, which has a shape of (memory cells, y, x).
    * @param dst: assembled data. shape=(memory cells, y, x)
+   * @param pulses: indices of the memory cells to be positioned. The i-th image
+   *                in dst is positioned from the memory cell pulses[i]. All the
+   *                memory cells are positioned if empty.
    */
-  template<typename M, typename E,
-    EnableIf<std::decay_t<M>, IsModulesArray> = false, EnableIf<E, IsImageArray> = false>
-  void positionAllModules(M&& src, E& dst) const;
+  template<typename M, typename E, EnableIf<E, IsImageArray> = false>
+  void positionAllModules(M&& src, E& dst, const std::vector<size_t>& pulses = {}) const;
 
   /**
-   * Position all the modules at the correct area of the given assembled image.
+   * Position all the modules and apply either gain or offset correction
+   * in a single pass.
    *
-   * @param src: a vector of module data, which has a shape of (modules, y, x)
+   * @tparam Policy: correction policy (OffsetPolicy or GainPolicy)
+   *
+   * @param src: multi-pulse, multiple-module data. shape=(memory cells, modules, y, x)
+   *             or a vector of module data, which has a shape of (memory cells, y, x).
    * @param dst: assembled data. shape=(memory cells, y, x)
+   * @param constants: correction constants, which has the same shape as dst.
+   * @param pulses: indices of the memory cells to be positioned.
    */
-  template<typename M, typename E,
-    EnableIf<std::decay_t<M>, IsModulesVector> = false, EnableIf<E, IsImageArray> = false>
-  void positionAllModules(M&& src, E& dst) const;
+  template<typename Policy, typename M, typename E, EnableIf<E, IsImageArray> = false>
+  void positionAllModules(M&& src, E& dst, const E& constants,
+                          const std::vector<size_t>& pulses = {}) const;
+
+  /**
+   * Position all the modules and apply both gain and offset correction
+   * in a single pass.
+   *
+   * @param src: multi-pulse, multiple-module data. shape=(memory cells, modules, y, x)
+   *             or a vector of module data, which has a shape of (memory cells, y, x).
+   * @param dst: assembled data. shape=(memory cells, y, x)
+   * @param gain: gain constants, which has the same shape as dst.
+   * @param offset: offset constants, which has the same shape as dst.
+   * @param pulses: indices of the memory cells to be positioned.
+   */
+  template<typename M, typename E, EnableIf<E, IsImageArray> = false>
+  void positionAllModules(M&& src, E& dst, const E& gain, const E& offset,
+                          const std::vector<size_t>& pulses = {}) const;
 
   /**
    * Return the shape (y, x) of the assembled image.
@@ -80,6 +209,11 @@ public:
     return {std::ceil(size[0]), std::ceil(size[1])};
   }
 
+  /**
+   * Return the runs of each module.
+   */
+  const runsType& runs() const { return runs_; }
+
 protected:
 
   Detector1MGeometryBase() = default;
@@ -98,15 +232,94 @@ protected:
   template<typename SrcShape, typename DstShape>
   void checkShape(const SrcShape& ss, const DstShape& ds) const;
 
+  /**
+   * Compile the runs of all the modules from the tile positions.
+   *
+   * It must be called by the constructors of the derived classes once the
+   * tile positions are known. The geometry does not change afterwards, so
+   * the tile arithmetic is not repeated for every train.
+   */
+  void compileRuns();
+
+  /**
+   * Position all the modules with the run policy returned by make_policy
+   * for each image in dst.
+   */
+  template<typename M, typename E, typename F>
+  void positionAllModulesImp(M&& src, E& dst, const std::vector<size_t>& pulses,
+                             F&& make_policy) const;
+
   /**
    * Position a single module at the assembled image.
    *
-   * @param src: data from a single module. shape=(memory cells, y, x).
-   * @param dst: assembled single image. shape=(y, x)
-   * @param pos: two diagonal corner positions of each tile. shape=(tiles, 2, 3)
+   * @param src: pointer to the first pixel of the module data.
+   * @param ss: strides (ss, fs) of the module data.
+   * @param dst: pointer to the first pixel of the assembled image.
+   * @param ds: strides (y, x) of the assembled image.
+   * @param im: index of the module.
+   * @param policy: policy which copies a run of pixels.
+   */
+  template<typename T, typename U, typename P>
+  void positionModule(const T* src, const stridesType& ss,
+                      U* dst, const stridesType& ds, size_t im, const P& policy) const;
+
+  /**
+   * Return the shape (memory cells, modules, y, x) of the modules data.
+   */
+  template<typename M, EnableIf<M, IsModulesArray> = false>
+  static std::array<size_t, 4> modulesShape(const M& src)
+  {
+    auto s = src.shape();
+    return {static_cast<size_t>(s[0]), static_cast<size_t>(s[1]),
+            static_cast<size_t>(s[2]), static_cast<size_t>(s[3])};
+  }
+
+  template<typename M, EnableIf<M, IsModulesVector> = false>
+  static std::array<size_t, 4> modulesShape(const M& src)
+  {
+    auto s = src[0].shape();
+    return {static_cast<size_t>(s[0]), src.size(),
+            static_cast<size_t>(s[1]), static_cast<size_t>(s[2])};
+  }
+
+  /**
+   * Return the pointer to the first pixel and the strides (ss, fs) of
+   * a module in a memory cell.
    */
-  template<typename M, typename N, typename T>
-  void positionModule(M&& src, N& dst, T&& pos) const;
+  template<typename M, EnableIf<M, IsModulesArray> = false>
+  static auto moduleData(const M& src, std::ptrdiff_t ip, std::ptrdiff_t im)
+  {
+    auto& st = src.strides();
+    return std::make_pair(src.data() + ip * st[0] + im * st[1],
+                          stridesType {static_cast<std::ptrdiff_t>(st[2]),
+                                       static_cast<std::ptrdiff_t>(st[3])});
+  }
+
+  template<typename M, EnableIf<M, IsModulesVector> = false>
+  static auto moduleData(const M& src, std::ptrdiff_t ip, std::ptrdiff_t im)
+  {
+    auto& st = src[im].strides();
+    return std::make_pair(src[im].data() + ip * st[0],
+                          stridesType {static_cast<std::ptrdiff_t>(st[1]),
+                                       static_cast<std::ptrdiff_t>(st[2])});
+  }
+
+  /**
+   * Return the pointer to the first pixel and the strides (y, x) of an
+   * image in an array of images.
+   */
+  template<typename E>
+  static auto imageData(E& arr, std::ptrdiff_t ip)
+  {
+    auto& st = arr.strides();
+    return std::make_pair(arr.data() + ip * st[0],
+                          stridesType {static_cast<std::ptrdiff_t>(st[1]),
+                                       static_cast<std::ptrdiff_t>(st[2])});
+  }
+
+private:
+
+  runsType runs_;
 };
 
 template<typename G>
@@ -117,60 +330,75 @@ template<typename G>
 constexpr size_t Detector1MGeometryBase<G>::n_modules;
 
 template<typename G>
-template<typename M, typename E, EnableIf<std::decay_t<M>, IsModulesArray>, EnableIf<E, IsImageArray>>
-void Detector1MGeometryBase<G>::positionAllModules(M&& src, E& dst) const
+template<typename M, typename E, EnableIf<E, IsImageArray>>
+void Detector1MGeometryBase<G>::positionAllModules(M&& src, E& dst,
+                                                   const std::vector<size_t>& pulses) const
 {
-  auto ss = src.shape();
-  auto ds = dst.shape();
-  this->checkShape(ss, ds);
+  positionAllModulesImp(src, dst, pulses, [] (std::ptrdiff_t) { return CopyRunPolicy(); });
+}
 
-  size_t n_pulses = ss[0];
-  auto norm_pos = static_cast<const G*>(this)->corner_pos_ / static_cast<const G*>(this)->pixelSize();
-#if defined(FOAM_WITH_TBB)
-  tbb::parallel_for(tbb::blocked_range2d<int>(0, n_modules, 0, n_pulses),
-    [&src, &dst, &norm_pos, this] (const tbb::blocked_range2d<int> &block)
-    {
-      for(int im=block.rows().begin(); im != block.rows().end(); ++im)
-      {
-        for(int ip=block.cols().begin(); ip != block.cols().end(); ++ip)
-        {
-#else
-      for (size_t im = 0; im < n_modules; ++im)
-        {
-        for (size_t ip = 0; ip < n_pulses; ++ip)
-        {
-#endif
-          auto&& dst_view = xt::view(dst, ip, xt::all(), xt::all());
-          positionModule(
-            xt::view(src, ip, im, xt::all(), xt::all()),
-            dst_view,
-            xt::view(norm_pos, im, xt::all(), xt::all(), xt::all())
-          );
-        }
-      }
-#if defined(FOAM_WITH_TBB)
-    }
-  );
-#endif
+template<typename G>
+template<typename Policy, typename M, typename E, EnableIf<E, IsImageArray>>
+void Detector1MGeometryBase<G>::positionAllModules(M&& src, E& dst, const E& constants,
+                                                   const std::vector<size_t>& pulses) const
+{
+  if (dst.shape() != constants.shape())
+    throw std::invalid_argument("Inconsistent data shape!");
+
+  using value_type = typename E::value_type;
+  positionAllModulesImp(src, dst, pulses, [&constants] (std::ptrdiff_t ip)
+  {
+    auto c = imageData(constants, ip);
+    return CorrectRunPolicy<Policy, value_type>(c.first, c.second);
+  });
+}
+
+template<typename G>
+template<typename M, typename E, EnableIf<E, IsImageArray>>
+void Detector1MGeometryBase<G>::positionAllModules(M&& src, E& dst, const E& gain, const E& offset,
+                                                   const std::vector<size_t>& pulses) const
+{
+  if (dst.shape() != gain.shape() || dst.shape() != offset.shape())
+    throw std::invalid_argument("Inconsistent data shape!");
+
+  using value_type = typename E::value_type;
+  positionAllModulesImp(src, dst, pulses, [&gain, &offset] (std::ptrdiff_t ip)
+  {
+    auto g = imageData(gain, ip);
+    auto o = imageData(offset, ip);
+    return CorrectGainOffsetRunPolicy<value_type>(g.first, g.second, o.first, o.second);
+  });
 }
 
 template<typename G>
-template<typename M, typename E, EnableIf<std::decay_t<M>, IsModulesVector>, EnableIf<E, IsImageArray>>
-void Detector1MGeometryBase<G>::positionAllModules(M&& src, E& dst) const
+template<typename M, typename E, typename F>
+void Detector1MGeometryBase<G>::positionAllModulesImp(M&& src, E& dst,
+                                                      const std::vector<size_t>& pulses,
+                                                      F&& make_policy) const
 {
-  auto ms = src[0].shape();
-  auto ss = std::array<size_t, 4> {static_cast<size_t>(ms[0]),
-                                   src.size(),
-                                   static_cast<size_t>(ms[1]),
-                                   static_cast<size_t>(ms[2])};
+  auto ss = modulesShape(src);
+  if (!pulses.empty())
+  {
+    for (auto p : pulses)
+    {
+      if (p >= ss[0])
+      {
+        std::stringstream fmt;
+        fmt << "Pulse index " << p << " is out of range for modules data with "
+            << ss[0] << " memory cells!";
+        throw std::out_of_range(fmt.str());
+      }
+    }
+    // only the selected memory cells are positioned
+    ss[0] = pulses.size();
+  }
   auto ds = dst.shape();
   this->checkShape(ss, ds);
 
   size_t n_pulses = ss[0];
-  auto norm_pos = static_cast<const G*>(this)->corner_pos_ / static_cast<const G*>(this)->pixelSize();
 #if defined(FOAM_WITH_TBB)
   tbb::parallel_for(tbb::blocked_range2d<int>(0, n_modules, 0, n_pulses),
-    [&src, &dst, &norm_pos, this] (const tbb::blocked_range2d<int> &block)
+    [&src, &dst, &pulses, &make_policy, this] (const tbb::blocked_range2d<int> &block)
     {
       for(int im=block.rows().begin(); im != block.rows().end(); ++im)
       {
@@ -182,12 +410,9 @@ void Detector1MGeometryBase<G>::positionAllModules(M&& src, E& dst) const
         for (size_t ip = 0; ip < n_pulses; ++ip)
         {
 #endif
-          auto&& dst_view = xt::view(dst, ip, xt::all(), xt::all());
-          positionModule(
-            xt::view(src[im], ip, xt::all(), xt::all()),
-            dst_view,
-            xt::view(norm_pos, im, xt::all(), xt::all(), xt::all())
-          );
+          auto m = moduleData(src, pulses.empty() ? ip : static_cast<std::ptrdiff_t>(pulses[ip]), im);
+          auto d = imageData(dst, ip);
+          positionModule(m.first, m.second, d.first, d.second, im, make_policy(ip));
         }
       }
 #if defined(FOAM_WITH_TBB)
@@ -258,10 +483,70 @@ void Detector1MGeometryBase<G>::checkShape(const SrcShape& ss, const DstShape& d
 }
 
 template<typename G>
-template<typename M, typename N, typename T>
-void Detector1MGeometryBase<G>::positionModule(M&& src, N& dst, T&& pos) const
+void Detector1MGeometryBase<G>::compileRuns()
+{
+  auto norm_pos = static_cast<const G*>(this)->corner_pos_ / static_cast<const G*>(this)->pixelSize();
+  auto center = assembledDim().second;
+  // caveat: tile shape has layout (ss, fs)
+  auto ht = static_cast<std::ptrdiff_t>(G::tile_shape[0]);
+  auto wt = static_cast<std::ptrdiff_t>(G::tile_shape[1]);
+  // number of rows and columns of a tile in the assembled image
+  std::ptrdiff_t n_rows = G::ss_along_x ? wt : ht;
+  std::ptrdiff_t n_cols = G::ss_along_x ? ht : wt;
+  for (size_t im = 0; im < n_modules; ++im)
+  {
+    auto& runs = runs_[im];
+    runs.clear();
+    runs.reserve(G::n_tiles_per_module * n_rows);
+    for (size_t it = 0; it < G::n_tiles_per_module; ++it)
+    {
+      auto x0 = norm_pos(im, it, 0, 0);
+      auto y0 = norm_pos(im, it, 0, 1);
+
+      int ix_dir = (norm_pos(im, it, 1, 0) - x0 > 0) ? 1 : -1;
+      int iy_dir = (norm_pos(im, it, 1, 1) - y0 > 0) ? 1 : -1;
+
+      std::ptrdiff_t ix0_dst = ix_dir > 0 ? std::floor(x0 + center[0]) : std::ceil(x0 + center[0]) - 1;
+      std::ptrdiff_t iy0_dst = iy_dir > 0 ? std::floor(y0 + center[1]) : std::ceil(y0 + center[1]) - 1;
+      auto origin = G::tileOrigin(it);
+
+      // Each row of a tile in the assembled image is a run. Runs are always
+      // written from left to right and the source is read backward instead
+      // if the tile is flipped along x.
+      std::ptrdiff_t c0 = ix_dir > 0 ? 0 : n_cols - 1;
+      for (std::ptrdiff_t r = 0; r < n_rows; ++r)
+      {
+        Run run;
+        run.dst = {iy0_dst + r * iy_dir, ix0_dst - c0};
+        if (G::ss_along_x)
+        {
+          run.src = {origin[0] + c0, origin[1] + r};
+          run.src_inc = {ix_dir, 0};
+        } else
+        {
+          run.src = {origin[0] + r, origin[1] + c0};
+          run.src_inc = {0, ix_dir};
+        }
+        run.length = n_cols;
+        runs.push_back(run);
+      }
+    }
+  }
+}
+
+template<typename G>
+template<typename T, typename U, typename P>
+void Detector1MGeometryBase<G>::positionModule(const T* src, const stridesType& ss,
+                                               U* dst, const stridesType& ds,
+                                               size_t im, const P& policy) const
 {
-  static_cast<const G*>(this)->positionModuleImp(std::forward<M>(src), dst, std::forward<T>(pos));
+  for (const auto& run : runs_[im])
+  {
+    const T* src_ptr = src + run.src[0] * ss[0] + run.src[1] * ss[1];
+    std::ptrdiff_t src_step = run.src_inc[0] * ss[0] + run.src_inc[1] * ss[1];
+    U* dst_ptr = dst + run.dst[0] * ds[0] + run.dst[1] * ds[1];
+    policy(src_ptr, src_step, dst_ptr, ds[1], run.dst, run.length);
+  }
 }
 
 /**
@@ -304,8 +589,13 @@ private:
 
   friend Detector1MGeometryBase<LPD_1MGeometry>;
 
-  template<typename M, typename N, typename T>
-  void positionModuleImp(M&& src, N& dst, T&& pos) const;
+  // whether the slow-scan direction of a module is along x
+  static constexpr bool ss_along_x = false;
+
+  /**
+   * Return the (ss, fs) index of the first pixel of a tile in the module.
+   */
+  static std::array<std::ptrdiff_t, 2> tileOrigin(size_t it);
 
 public:
 
@@ -328,6 +618,7 @@ const LPD_1MGeometry::shapeType LPD_1MGeometry::module_shape {256, 256};
 // (ss/y, fs/x)
 const LPD_1MGeometry::shapeType LPD_1MGeometry::tile_shape {32, 128};
 constexpr size_t LPD_1MGeometry::n_tiles_per_module;
+constexpr bool LPD_1MGeometry::ss_along_x;
 const LPD_1MGeometry::quadOrientType LPD_1MGeometry::quad_orientations {
   std::array<int, 2>{1, 1}, std::array<int, 2>{1, 1}, std::array<int, 2>{1, 1}, std::array<int, 2>{1, 1}
 };
@@ -382,6 +673,8 @@ LPD_1MGeometry::LPD_1MGeometry()
       corner_pos_(im, it, 1, 2) = 0.0;
     }
   }
+
+  compileRuns();
 }
 
 LPD_1MGeometry::LPD_1MGeometry(
@@ -398,36 +691,16 @@ LPD_1MGeometry::LPD_1MGeometry(
       corner_pos_(im, it, 1, 2) = 0.0;
     }
   }
+
+  compileRuns();
 }
 
-template<typename M, typename N, typename T>
-void LPD_1MGeometry::positionModuleImp(M&& src, N& dst, T&& pos) const
+std::array<std::ptrdiff_t, 2> LPD_1MGeometry::tileOrigin(size_t it)
 {
-  auto center = assembledDim().second;
-  auto shape = src.shape(); // caveat: shape has layout (y, x)
-  size_t n_tiles = n_tiles_per_module;
-  size_t wt = tile_shape[1];
-  size_t ht = tile_shape[0];
-  for (size_t it = 0; it < n_tiles; ++it)
-  {
-    auto x0 = pos(it, 0, 0);
-    auto y0 = pos(it, 0, 1);
-
-    int ix_dir = (pos(it, 1, 0) - x0 > 0) ? 1 : -1;
-    int iy_dir = (pos(it, 1, 1) - y0 > 0) ? 1 : -1;
-
-    size_t ix0 = (it / 8) * wt;
-    size_t iy0 = it < 8 ? (7 - it % 8) * ht : (it % 8) * ht;
-    size_t ix0_dst = ix_dir > 0 ? std::floor(x0 + center[0]) : std::ceil(x0 + center[0]) - 1;
-    size_t iy0_dst = iy_dir > 0 ? std::floor(y0 + center[1]) : std::ceil(y0 + center[1]) - 1;
-    for (size_t iy = iy0, iy_dst = iy0_dst; iy < iy0 + ht; ++iy, iy_dst += iy_dir)
-    {
-      for (size_t ix = ix0, ix_dst = ix0_dst; ix < ix0 + wt; ++ix, ix_dst += ix_dir)
-      {
-        dst(iy_dst, ix_dst) = src(iy, ix);
-      }
-    }
-  }
+  auto ht = static_cast<std::ptrdiff_t>(tile_shape[0]);
+  auto wt = static_cast<std::ptrdiff_t>(tile_shape[1]);
+  std::ptrdiff_t i = it;
+  return {i < 8 ? (7 - i % 8) * ht : (i % 8) * ht, (i / 8) * wt};
 }
 
 /**
@@ -466,8 +739,13 @@ private:
 
   friend Detector1MGeometryBase<DSSC_1MGeometry>;
 
-  template<typename M, typename N, typename T>
-  void positionModuleImp(M&& src, N& dst, T&& pos) const;
+  // whether the slow-scan direction of a module is along x
+  static constexpr bool ss_along_x = false;
+
+  /**
+   * Return the (ss, fs) index of the first pixel of a tile in the module.
+   */
+  static std::array<std::ptrdiff_t, 2> tileOrigin(size_t it);
 
 public:
 
@@ -497,6 +775,7 @@ const DSSC_1MGeometry::shapeType DSSC_1MGeometry::module_shape {128, 512};
 // (ss/y, fs/x)
 const DSSC_1MGeometry::shapeType DSSC_1MGeometry::tile_shape {128, 256};
 constexpr size_t DSSC_1MGeometry::n_tiles_per_module;
+constexpr bool DSSC_1MGeometry::ss_along_x;
 const DSSC_1MGeometry::quadOrientType DSSC_1MGeometry::quad_orientations {
   std::array<int, 2>{-1, 1}, std::array<int, 2>{-1, 1}, std::array<int, 2>{1, -1}, std::array<int, 2>{1, -1}
 };
@@ -540,6 +819,8 @@ DSSC_1MGeometry::DSSC_1MGeometry()
       corner_pos_(im, it, 1, 2) = 0.0;
     }
   }
+
+  compileRuns();
 }
 
 DSSC_1MGeometry::DSSC_1MGeometry(
@@ -560,35 +841,158 @@ DSSC_1MGeometry::DSSC_1MGeometry(
       corner_pos_(im, it, 1, 2) = 0.0;
     }
   }
+
+  compileRuns();
 }
 
-template<typename M, typename N, typename T>
-void DSSC_1MGeometry::positionModuleImp(M&& src, N& dst, T&& pos) const
+std::array<std::ptrdiff_t, 2> DSSC_1MGeometry::tileOrigin(size_t it)
 {
-  auto center = assembledDim().second;
-  size_t n_tiles = n_tiles_per_module;
-  size_t wt = tile_shape[1];
-  size_t ht = tile_shape[0];
-  for (size_t it = 0; it < n_tiles; ++it)
+  return {0, static_cast<std::ptrdiff_t>(it * tile_shape[1])};
+}
+
+/**
+ * AGIPD-1M geometry
+ *
+ *
+ * Layout of AGIPD-1M:                 Tile layout for each module:
+ *
+ *  Q1M1    |    Q4M1                  Q1 and Q2:
+ *  Q1M2    |    Q4M2                    T01 T02 T03 ... T08
+ *  Q1M3    |    Q4M3
+ *  Q1M4    |    Q4M4                  Q3 and Q4:
+ *  -----------------                    T08 ... T03 T02 T01
+ *  Q2M1    |    Q3M1
+ *  Q2M2    |    Q3M2
+ *  Q2M3    |    Q3M3
+ *  Q2M4    |    Q3M4
+ *
+ * Unlike LPD and DSSC, the slow-scan (ss) direction of an AGIPD module is
+ * along the x axis and the fast-scan (fs) direction is along the y axis.
+ *
+ * The tile positions refer to the corner of the first pixel of each tile.
+ *
+ * For details, please see
+ * https://extra-geom.readthedocs.io/en/latest/geometry.html#agipd-1m
+ *
+ */
+class AGIPD_1MGeometry : public Detector1MGeometryBase<AGIPD_1MGeometry>
+{
+public:
+
+  static const shapeType module_shape;
+  static const shapeType tile_shape;
+  static const size_t n_tiles_per_module = 8; // number of tiles per module
+  static const quadOrientType quad_orientations;
+
+private:
+
+  xt::xtensor_fixed<double, xt::xshape<n_modules, n_tiles_per_module, 2, 3>> corner_pos_;
+
+  friend Detector1MGeometryBase<AGIPD_1MGeometry>;
+
+  // whether the slow-scan direction of a module is along x
+  static constexpr bool ss_along_x = true;
+
+  /**
+   * Return the (ss, fs) index of the first pixel of a tile in the module.
+   */
+  static std::array<std::ptrdiff_t, 2> tileOrigin(size_t it);
+
+public:
+
+  static const vectorType& pixelSize()
   {
-    auto x0 = pos(it, 0, 0);
-    auto y0 = pos(it, 0, 1);
+    static const vectorType pixel_size {2e-4, 2e-4, 1.};
+    return pixel_size;
+  }
+
+  AGIPD_1MGeometry();
+
+  explicit
+  AGIPD_1MGeometry(const std::array<std::array<std::array<double, 3>, n_tiles_per_module>, n_modules>& positions);
+
+  ~AGIPD_1MGeometry() = default;
+};
+
+// (ss/x, fs/y)
+const AGIPD_1MGeometry::shapeType AGIPD_1MGeometry::module_shape {512, 128};
+// (ss/x, fs/y)
+const AGIPD_1MGeometry::shapeType AGIPD_1MGeometry::tile_shape {64, 128};
+constexpr size_t AGIPD_1MGeometry::n_tiles_per_module;
+constexpr bool AGIPD_1MGeometry::ss_along_x;
+const AGIPD_1MGeometry::quadOrientType AGIPD_1MGeometry::quad_orientations {
+  std::array<int, 2>{1, -1}, std::array<int, 2>{1, -1}, std::array<int, 2>{-1, 1}, std::array<int, 2>{-1, 1}
+};
 
-    int ix_dir = (pos(it, 1, 0) - x0 > 0) ? 1 : -1;
-    int iy_dir = (pos(it, 1, 1) - y0 > 0) ? 1 : -1;
+AGIPD_1MGeometry::AGIPD_1MGeometry()
+{
+  // first pixel position of the first tile of each module
+  // (upper-left for Q1 and Q2, lower-right for Q3 and Q4)
+  xt::xtensor_fixed<double, xt::xshape<n_modules, 3>> m_pos {
+    { -512,  512, 0},
+    { -512,  384, 0},
+    { -512,  256, 0},
+    { -512,  128, 0},
+    { -512,    0, 0},
+    { -512, -128, 0},
+    { -512, -256, 0},
+    { -512, -384, 0},
+    {  512, -128, 0},
+    {  512, -256, 0},
+    {  512, -384, 0},
+    {  512, -512, 0},
+    {  512,  384, 0},
+    {  512,  256, 0},
+    {  512,  128, 0},
+    {  512,    0, 0}
+  };
 
-    size_t ix0 = it * wt;
-    size_t iy0 = 0;
-    size_t ix0_dst = ix_dir > 0 ? std::floor(x0 + center[0]) : std::ceil(x0 + center[0]) - 1;
-    size_t iy0_dst = iy_dir > 0 ? std::floor(y0 + center[1]) : std::ceil(y0 + center[1]) - 1;
-    for (size_t iy = iy0, iy_dst = iy0_dst; iy < ht; ++iy, iy_dst += iy_dir)
+  auto ht = static_cast<double>(tile_shape[0]);
+  auto wt = static_cast<double>(tile_shape[1]);
+  for (size_t im = 0; im < n_modules; ++im)
+  {
+    auto orient = quad_orientations[im / 4];
+
+    for (size_t it = 0; it < n_tiles_per_module; ++it)
     {
-      for (size_t ix = ix0, ix_dst = ix0_dst; ix < ix0 + wt; ++ix, ix_dst += ix_dir)
-      {
-        dst(iy_dst, ix_dst) = src(iy, ix);
-      }
+      corner_pos_(im, it, 0, 0) = (m_pos(im, 0) + orient[0] * (it * ht)) * pixelSize()(0);
+      corner_pos_(im, it, 0, 1) = m_pos(im, 1) * pixelSize()(1);
+      corner_pos_(im, it, 0, 2) = m_pos(im, 2);
+      // calculate the position of the diagonal corner
+      corner_pos_(im, it, 1, 0) = corner_pos_(im, it, 0, 0) + orient[0] * ht * pixelSize()(0);
+      corner_pos_(im, it, 1, 1) = corner_pos_(im, it, 0, 1) + orient[1] * wt * pixelSize()(1);
+      corner_pos_(im, it, 1, 2) = 0.0;
     }
   }
+
+  compileRuns();
+}
+
+AGIPD_1MGeometry::AGIPD_1MGeometry(
+  const std::array<std::array<std::array<double, 3>, n_tiles_per_module>, n_modules>& positions)
+{
+  for (size_t im = 0; im < n_modules; ++im)
+  {
+    auto orient = quad_orientations[im / 4];
+
+    for (size_t it = 0; it < n_tiles_per_module; ++it)
+    {
+      for (size_t j = 0; j < 3; ++j) corner_pos_(im, it, 0, j) = positions[im][it][j];
+      // calculate the position of the diagonal corner
+      corner_pos_(im, it, 1, 0) = positions[im][it][0]
+                                  + orient[0] * static_cast<double>(tile_shape[0]) * pixelSize()(0);
+      corner_pos_(im, it, 1, 1) = positions[im][it][1]
+                                  + orient[1] * static_cast<double>(tile_shape[1]) * pixelSize()(1);
+      corner_pos_(im, it, 1, 2) = 0.0;
+    }
+  }
+
+  compileRuns();
+}
+
+std::array<std::ptrdiff_t, 2> AGIPD_1MGeometry::tileOrigin(size_t it)
+{
+  return {static_cast<std::ptrdiff_t>(it * tile_shape[0]), 0};
 }
 
 }; //foam
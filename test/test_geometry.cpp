@@ -39,7 +39,7 @@ protected:
 
 
 
-using Geometry1MTypes = ::testing::Types<DSSC_1MGeometry, LPD_1MGeometry>;
+using Geometry1MTypes = ::testing::Types<DSSC_1MGeometry, LPD_1MGeometry, AGIPD_1MGeometry>;
 TYPED_TEST_CASE(Test1MGeometry, Geometry1MTypes);
 
 
@@ -94,5 +94,92 @@ TYPED_TEST(Test1MGeometry, testPositionAllModulesFile)
   this->geom_->positionAllModules(modules, dst);
 }
 
+TYPED_TEST(Test1MGeometry, testPositionAllModulesRaw)
+{
+  auto shape = this->geom_->assembledShape();
+  xt::xtensor<float, 3> dst{xt::zeros<float>({2, static_cast<int>(shape[0]), static_cast<int>(shape[1])})};
+  xt::xtensor<uint16_t, 4> modules { xt::ones<uint16_t>({2, this->nm_, this->mh_, this->mw_}) };
+
+  this->geom_->positionAllModules(modules, dst);
+  EXPECT_EQ(1.f, xt::amax(dst)());
+}
+
+TYPED_TEST(Test1MGeometry, testPositionAllModulesCorrected)
+{
+  auto shape = this->geom_->assembledShape();
+  std::array<size_t, 3> dst_shape {2, shape[0], shape[1]};
+  xt::xtensor<float, 3> dst{xt::zeros<float>(dst_shape)};
+  xt::xtensor<uint16_t, 4> modules { 3 * xt::ones<uint16_t>({2, this->nm_, this->mh_, this->mw_}) };
+  xt::xtensor<float, 3> gain { 2.f * xt::ones<float>(dst_shape) };
+  xt::xtensor<float, 3> offset { xt::ones<float>(dst_shape) };
+
+  this->geom_->template positionAllModules<OffsetPolicy>(modules, dst, offset);
+  EXPECT_EQ(2.f, xt::amax(dst)());
+
+  this->geom_->template positionAllModules<GainPolicy>(modules, dst, gain);
+  EXPECT_EQ(6.f, xt::amax(dst)());
+
+  this->geom_->positionAllModules(modules, dst, gain, offset);
+  EXPECT_EQ(4.f, xt::amax(dst)());
+
+  std::array<size_t, 3> wrong_shape {1, shape[0], shape[1]};
+  xt::xtensor<float, 3> constants_wrong { xt::ones<float>(wrong_shape) };
+  EXPECT_THROW(this->geom_->template positionAllModules<OffsetPolicy>(modules, dst, constants_wrong),
+               std::invalid_argument);
+  EXPECT_THROW(this->geom_->positionAllModules(modules, dst, gain, constants_wrong),
+               std::invalid_argument);
+}
+
+TYPED_TEST(Test1MGeometry, testPositionSelectedPulses)
+{
+  auto shape = this->geom_->assembledShape();
+  std::array<size_t, 3> dst_shape {2, shape[0], shape[1]};
+  xt::xtensor<float, 3> dst{xt::zeros<float>(dst_shape)};
+  xt::xtensor<float, 4> modules { xt::ones<float>({4, this->nm_, this->mh_, this->mw_}) };
+  for (size_t ip = 0; ip < 4; ++ip) xt::view(modules, ip) *= static_cast<float>(ip);
+
+  this->geom_->positionAllModules(modules, dst, std::vector<size_t>{3, 1});
+  EXPECT_EQ(3.f, xt::amax(xt::view(dst, 0))());
+  EXPECT_EQ(1.f, xt::amax(xt::view(dst, 1))());
+
+  // the constants are in the layout of dst
+  xt::xtensor<float, 3> offset { xt::ones<float>(dst_shape) };
+  this->geom_->template positionAllModules<OffsetPolicy>(modules, dst, offset, std::vector<size_t>{2, 3});
+  EXPECT_EQ(1.f, xt::amax(xt::view(dst, 0))());
+  EXPECT_EQ(2.f, xt::amax(xt::view(dst, 1))());
+
+  EXPECT_THROW(this->geom_->positionAllModules(modules, dst, std::vector<size_t>{0, 4}),
+               std::out_of_range);
+  EXPECT_THROW(this->geom_->positionAllModules(modules, dst, std::vector<size_t>{0, 1, 2}),
+               std::invalid_argument);
+}
+
+TYPED_TEST(Test1MGeometry, testRuns)
+{
+  auto shape = this->geom_->assembledShape();
+  auto h = static_cast<std::ptrdiff_t>(shape[0]);
+  auto w = static_cast<std::ptrdiff_t>(shape[1]);
+  auto& runs = this->geom_->runs();
+  for (size_t im = 0; im < TypeParam::n_modules; ++im)
+  {
+    size_t n_pixels = 0;
+    for (auto& run : runs[im])
+    {
+      auto length = static_cast<std::ptrdiff_t>(run.length);
+      // destination
+      EXPECT_TRUE(run.dst[0] >= 0 && run.dst[0] < h);
+      EXPECT_TRUE(run.dst[1] >= 0 && run.dst[1] + length <= w);
+      // source
+      auto ss_last = run.src[0] + run.src_inc[0] * (length - 1);
+      auto fs_last = run.src[1] + run.src_inc[1] * (length - 1);
+      EXPECT_TRUE(std::min(run.src[0], ss_last) >= 0 && std::max(run.src[0], ss_last) < this->mh_);
+      EXPECT_TRUE(std::min(run.src[1], fs_last) >= 0 && std::max(run.src[1], fs_last) < this->mw_);
+
+      n_pixels += run.length;
+    }
+    EXPECT_EQ(static_cast<size_t>(this->mh_ * this->mw_), n_pixels);
+  }
+}
+
 } //test
 } //foam
\ No newline at end of file